@@ -0,0 +1,75 @@
+"""
+Recall against latency of the index types of create_faiss_index, with the flat index of the same metric
+as ground truth. Uses embeddings from a .npy file (e.g. saved by embed_stream) or random clustered vectors
+of the size of MiniLM embeddings.
+
+    python benchmarks/ann_recall.py --vectors 100000 --queries 1000 --metric cosine
+    python benchmarks/ann_recall.py --embeddings embeddings.npy
+"""
+import time
+import argparse
+import numpy as np
+
+from rag.vectors.index import create_faiss_index, set_search_params
+
+# index type, build parameters, search parameters to try
+CONFIGS = [
+    ('ivf_flat', {}, [{'nprobe': n} for n in (1, 4, 16, 64)]),
+    ('ivf_pq', {'pq_m': 48}, [{'nprobe': n} for n in (4, 16, 64)]),
+    ('hnsw', {'hnsw_m': 32}, [{'ef_search': ef} for ef in (16, 64, 256)]),
+]
+
+
+def make_vectors(n, dim, seed=0, clusters=200):
+    """Random vectors grouped around cluster centres (embeddings of texts are not uniform either)."""
+    rng = np.random.default_rng(seed)
+    centres = rng.normal(size=(clusters, dim))
+    return (centres[rng.integers(clusters, size=n)] + 0.5 * rng.normal(size=(n, dim))).astype(np.float32)
+
+
+def search(index, queries, k):
+    start = time.perf_counter()
+    _, I = index.search(queries, k)
+    return I, (time.perf_counter() - start) / len(queries) * 1000
+
+
+def recall(found, truth):
+    return np.mean([len(set(f) & set(t)) / len(t) for f, t in zip(found, truth)])
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--embeddings', default=None, help='.npy file with embeddings')
+    parser.add_argument('--vectors', type=int, default=100000)
+    parser.add_argument('--dim', type=int, default=384)
+    parser.add_argument('--queries', type=int, default=1000)
+    parser.add_argument('--k', type=int, default=10)
+    parser.add_argument('--metric', default='cosine', choices=['l2', 'ip', 'cosine'])
+    args = parser.parse_args()
+
+    vectors = np.load(args.embeddings, mmap_mode='r') if args.embeddings else make_vectors(args.vectors, args.dim)
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    rng = np.random.default_rng(1)
+    # queries are perturbed corpus vectors, so each of them has real neighbours
+    queries = vectors[rng.choice(len(vectors), args.queries)] + 0.1 * rng.normal(size=(args.queries, vectors.shape[1])).astype(np.float32)
+
+    start = time.perf_counter()
+    flat = create_faiss_index(vectors, 'flat', args.metric)
+    print(f"flat: built in {time.perf_counter() - start:.2f}s")
+    truth, flat_ms = search(flat, queries, args.k)
+    print(f"{'index':10} {'params':18} {'build s':>8} {'ms/query':>9} {'recall@' + str(args.k):>10}")
+    print(f"{'flat':10} {'':18} {'':>8} {flat_ms:>9.3f} {1.0:>10.3f}")
+
+    for index_type, build_params, search_params in CONFIGS:
+        start = time.perf_counter()
+        index = create_faiss_index(vectors, index_type, args.metric, **build_params)
+        build_seconds = time.perf_counter() - start
+        for params in search_params:
+            set_search_params(index, **params)
+            found, ms = search(index, queries, args.k)
+            described = ','.join(f'{key}={value}' for key, value in params.items())
+            print(f"{index_type:10} {described:18} {build_seconds:>8.2f} {ms:>9.3f} {recall(found, truth):>10.3f}")
+
+
+if __name__ == '__main__':
+    main()
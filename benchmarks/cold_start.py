@@ -0,0 +1,80 @@
+"""
+Time and memory needed by a new process to open the index and the chunks and answer one query:
+read_faiss_index + all chunks from JSONL (what rag_search callers do now) against
+read_faiss_index(mmap=True) + ChunkStore. Every variant runs in a fresh process.
+
+    python benchmarks/cold_start.py --chunks 200000 --dim 384 --workdir /tmp/cold_start
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import subprocess
+import numpy as np
+
+
+def prepare(workdir, n, dim):
+    from rag.preprocess.jsonl import write_jsonl
+    from rag.vectors.index import create_faiss_index, save_faiss_index
+    from rag.vectors.chunk_store import write_chunk_store
+    os.makedirs(workdir, exist_ok=True)
+    rng = np.random.default_rng(0)
+    chunks = [{'document_id': f'DU_2020_{i // 50}.md', 'chunk_id': i % 50, 'eng_title': f'Act {i // 50}',
+               'eng_chunk': 'The minister shall determine, by regulation, the detailed conditions. ' * 10} for i in range(n)]
+    write_jsonl(chunks, os.path.join(workdir, 'chunks.jsonl'))
+    write_chunk_store(os.path.join(workdir, 'chunk_store'), chunks)
+    save_faiss_index(create_faiss_index(rng.random((n, dim), dtype=np.float32)), os.path.join(workdir, 'index.faiss'))
+
+
+def peak_rss_mb():
+    # VmHWM starts from zero in a new program (ru_maxrss would include memory of the parent process)
+    with open('/proc/self/status') as f:
+        return next(int(line.split()[1]) for line in f if line.startswith('VmHWM')) / 1024
+
+
+def run(workdir, mode, dim):
+    start = time.perf_counter()
+    from rag.vectors.index import read_faiss_index
+    query = np.random.default_rng(1).random((1, dim), dtype=np.float32)
+    if mode == 'load':
+        from rag.preprocess.jsonl import read_jsonl
+        index = read_faiss_index(os.path.join(workdir, 'index.faiss'))
+        data = list(read_jsonl(os.path.join(workdir, 'chunks.jsonl')))
+        ready = time.perf_counter()
+        _, I = index.search(query, 3)
+        found = [data[i] for i in I[0]]
+    else:
+        from rag.vectors.chunk_store import ChunkStore
+        index = read_faiss_index(os.path.join(workdir, 'index.faiss'), mmap=True)
+        store = ChunkStore(os.path.join(workdir, 'chunk_store'))
+        ready = time.perf_counter()
+        _, I = index.search(query, 3)
+        found = store.get(I[0])
+    end = time.perf_counter()
+    print(json.dumps({'mode': mode, 'open_s': ready - start, 'first_query_s': end - ready, 'found': len(found),
+                      'peak_rss_mb': peak_rss_mb()}))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--chunks', type=int, default=200000)
+    parser.add_argument('--dim', type=int, default=384)
+    parser.add_argument('--workdir', default='/tmp/cold_start')
+    parser.add_argument('--run', default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.run:
+        run(args.workdir, args.run, args.dim)
+        return
+
+    prepare(args.workdir, args.chunks, args.dim)
+    print(f"{'mode':6} {'open s':>8} {'1st query s':>12} {'peak MB':>8}")
+    for mode in ('load', 'mmap'):
+        out = subprocess.run([sys.executable, __file__, '--run', mode, '--workdir', args.workdir, '--dim', str(args.dim)],
+                             capture_output=True, text=True, check=True).stdout
+        result = json.loads(out.strip().splitlines()[-1])
+        print(f"{mode:6} {result['open_s']:>8.3f} {result['first_query_s']:>12.3f} {result['peak_rss_mb']:>8.0f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+"""
+Load time, memory and generation speed of setup_qa_pipeline on a CPU-only machine:
+the current pipeline (device_map="auto") against backend="cpu" in float32, with int8 linear layers,
+and with int8 linear layers read from the cache of a previous run. Every variant runs in a fresh process.
+
+    python benchmarks/cpu_backend.py --llm google/gemma-2-2b-it --threads 8 --cache-dir /tmp/qa_cache
+"""
+import sys
+import json
+import time
+import shutil
+import argparse
+import subprocess
+
+VARIANTS = {
+    'auto': {'backend': 'auto'},
+    'cpu-fp32': {'backend': 'cpu', 'quantize': False},
+    'cpu-int8': {'backend': 'cpu', 'quantize': True},
+    'cpu-int8-cached': {'backend': 'cpu', 'quantize': True},
+}
+
+
+def peak_rss_mb():
+    # VmHWM starts from zero in a new program (ru_maxrss would include memory of the parent process)
+    with open('/proc/self/status') as f:
+        return next(int(line.split()[1]) for line in f if line.startswith('VmHWM')) / 1024
+
+
+def rss_mb():
+    with open('/proc/self/status') as f:
+        return next(int(line.split()[1]) for line in f if line.startswith('VmRSS')) / 1024
+
+
+def run(args):
+    from rag.llms.core import build_prompt
+    from rag.llms.models import setup_qa_pipeline
+    # imports take the same time in every variant, only loading the model is measured
+    start = time.perf_counter()
+    kwargs = dict(VARIANTS[args.run])
+    if kwargs['backend'] == 'cpu':
+        kwargs.update(threads=args.threads, cache_dir=args.cache_dir if kwargs['quantize'] else None)
+    qa_pipeline = setup_qa_pipeline(args.llm, **kwargs)
+    loaded = time.perf_counter()
+
+    chunks = [{'title': f'Act {i}', 'chunk': 'The minister shall determine, by regulation, the detailed conditions. ' * 8}
+              for i in range(3)]
+    prompt = build_prompt('What does the minister determine by regulation?', chunks)
+    params = {'max_new_tokens': args.max_new_tokens, 'min_new_tokens': args.max_new_tokens, 'do_sample': False,
+              'return_full_text': False}
+    first = time.perf_counter()
+    qa_pipeline(prompt, **params)
+    first_answer_s = time.perf_counter() - first
+    generation = time.perf_counter()
+    for _ in range(args.repeats):
+        qa_pipeline(prompt, **params)
+    tokens_per_s = args.repeats * args.max_new_tokens / (time.perf_counter() - generation)
+    print(json.dumps({'load_s': loaded - start, 'first_answer_s': first_answer_s, 'tokens_per_s': tokens_per_s,
+                      'rss_mb': rss_mb(), 'peak_rss_mb': peak_rss_mb()}))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--llm', default='google/gemma-2-2b-it')
+    parser.add_argument('--threads', type=int, default=None)
+    parser.add_argument('--cache-dir', default='/tmp/qa_cache')
+    parser.add_argument('--max-new-tokens', type=int, default=32)
+    parser.add_argument('--repeats', type=int, default=3)
+    parser.add_argument('--run', default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.run:
+        run(args)
+        return
+
+    # cpu-int8 quantizes the model and fills the cache, cpu-int8-cached reads it
+    shutil.rmtree(args.cache_dir, ignore_errors=True)
+    print(f"{'variant':16} {'load s':>7} {'1st answer s':>13} {'tokens/s':>9} {'RSS MB':>7} {'peak MB':>8}")
+    for variant in VARIANTS:
+        command = [sys.executable, __file__, '--run', variant, '--llm', args.llm, '--cache-dir', args.cache_dir,
+                   '--max-new-tokens', str(args.max_new_tokens), '--repeats', str(args.repeats)]
+        if args.threads:
+            command += ['--threads', str(args.threads)]
+        out = subprocess.run(command, capture_output=True, text=True, check=True).stdout
+        result = json.loads(out.strip().splitlines()[-1])
+        print(f"{variant:16} {result['load_s']:>7.2f} {result['first_answer_s']:>13.2f} {result['tokens_per_s']:>9.1f} "
+              f"{result['rss_mb']:>7.0f} {result['peak_rss_mb']:>8.0f}")
+
+
+if __name__ == '__main__':
+    main()
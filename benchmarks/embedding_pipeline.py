@@ -0,0 +1,72 @@
+"""
+Compares model.encode on the whole corpus (what embed_texts does) with embed_stream on generated chunks
+of very different lengths (like chunks of legal acts). Every run is a separate process, so peak memory
+of one run doesn't hide the others.
+
+    python benchmarks/embedding_pipeline.py --sizes 1000 5000 --workers 1 2 --model all-MiniLM-L6-v2
+"""
+import sys
+import json
+import time
+import random
+import resource
+import argparse
+import subprocess
+
+WORDS = "ustawa przepis minister art dnia roku sprawie zmianie ochrony środowiska podatku 15 2020".split()
+
+
+def make_texts(n, seed=0):
+    rng = random.Random(seed)
+    # mostly short chunks and a few long ones
+    return [' '.join(rng.choice(WORDS) for _ in range(int(rng.paretovariate(1.2) * 10))) for _ in range(n)]
+
+
+def run(config):
+    """Runs one configuration in this process and prints its result as JSON."""
+    texts = make_texts(config['size'])
+    if config['mode'] == 'encode':
+        from rag.vectors.embedd import load_embedding_model
+        model = load_embedding_model(config['model'])
+        start = time.perf_counter()
+        model.encode(texts, convert_to_numpy=True)
+    else:
+        from rag.vectors.embedd import load_embedding_model
+        from rag.vectors.pipeline import embed_stream
+        load_embedding_model(config['model'])
+        start = time.perf_counter()
+        embed_stream(texts, config['model'], output_path=config.get('output_path'), workers=config['workers'])
+    seconds = time.perf_counter() - start
+    peak_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(json.dumps({**config, 'seconds': seconds, 'texts_per_s': config['size'] / seconds, 'peak_rss_mb': peak_mb}))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 5000])
+    parser.add_argument('--workers', type=int, nargs='+', default=[1])
+    parser.add_argument('--model', default='all-MiniLM-L6-v2')
+    parser.add_argument('--output-path', default=None, help='.npy file for embed_stream (memory-mapped output)')
+    parser.add_argument('--run', default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.run:
+        run(json.loads(args.run))
+        return
+
+    configs = []
+    for size in args.sizes:
+        configs.append({'mode': 'encode', 'size': size, 'model': args.model, 'workers': 1})
+        for workers in args.workers:
+            configs.append({'mode': 'stream', 'size': size, 'model': args.model, 'workers': workers,
+                            'output_path': args.output_path})
+    print(f"{'mode':8} {'size':>7} {'workers':>7} {'seconds':>8} {'texts/s':>9} {'peak MB':>8}")
+    for config in configs:
+        out = subprocess.run([sys.executable, __file__, '--run', json.dumps(config)],
+                             capture_output=True, text=True, check=True).stdout
+        result = json.loads(out.strip().splitlines()[-1])
+        print(f"{result['mode']:8} {result['size']:>7} {result['workers']:>7} {result['seconds']:>8.2f} "
+              f"{result['texts_per_s']:>9.1f} {result['peak_rss_mb']:>8.0f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,60 @@
+"""
+Throughput of answering an evaluation set: rag_search called for every question against rag_search_batch.
+The corpus and questions are generated, answers are limited to --max-new-tokens tokens (greedy decoding).
+
+    python benchmarks/eval_throughput.py --questions 1000 --batch-size 16 --llm google/gemma-2-2b-it
+"""
+import time
+import random
+import argparse
+import numpy as np
+
+from rag.llms.core import rag_search, rag_search_batch
+from rag.llms.models import setup_qa_pipeline
+from rag.vectors.embedd import embed_texts
+from rag.vectors.index import create_faiss_index
+from rag.vectors.retriever import Retriever
+
+WORDS = "tax minister regulation waste environment penalty court act article shall enter force employer".split()
+
+
+def sentence(rng, n):
+    return ' '.join(rng.choice(WORDS) for _ in range(n))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--questions', type=int, default=1000)
+    parser.add_argument('--chunks', type=int, default=5000)
+    parser.add_argument('--batch-size', type=int, default=16)
+    parser.add_argument('--k', type=int, default=3)
+    parser.add_argument('--max-new-tokens', type=int, default=16)
+    parser.add_argument('--serial', type=int, default=100, help='questions answered one by one (slow, so fewer)')
+    parser.add_argument('--llm', default='google/gemma-2-2b-it')
+    parser.add_argument('--embedding-model', default='all-MiniLM-L6-v2')
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    data = [{'eng_chunk': sentence(rng, 40), 'eng_title': f'Act {i // 20}: {sentence(rng, 5)}'} for i in range(args.chunks)]
+    questions = [sentence(rng, 10) + '?' for _ in range(args.questions)]
+    embeddings, model = embed_texts([item['eng_chunk'] for item in data], args.embedding_model)
+    retriever = Retriever(create_faiss_index(embeddings), model, data)
+    qa_pipeline = setup_qa_pipeline(args.llm)
+    params = {'max_new_tokens': args.max_new_tokens, 'do_sample': False}
+
+    start = time.perf_counter()
+    for question in questions[:args.serial]:
+        rag_search(question, None, None, None, qa_pipeline, args.k, params, retriever=retriever)
+    serial = args.serial / (time.perf_counter() - start)
+
+    start = time.perf_counter()
+    results = rag_search_batch(questions, retriever, qa_pipeline, args.k, params, batch_size=args.batch_size)
+    seconds = time.perf_counter() - start
+    latencies = [result['latency_ms'] for result in results]
+    print(f"one by one: {serial:.2f} questions/s ({args.serial} questions)")
+    print(f"batched:    {len(questions) / seconds:.2f} questions/s ({len(questions)} questions, batch size {args.batch_size}), "
+          f"retrieval {results[0]['retrieval_ms']:.0f} ms for all, latency p50 {np.percentile(latencies, 50):.0f} ms")
+
+
+if __name__ == '__main__':
+    main()
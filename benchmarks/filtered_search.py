@@ -0,0 +1,65 @@
+"""
+Cost of searching with metadata filters against searching the whole index, and a check that filtered results
+are exactly the closest chunks among the allowed ones. Chunks get random years, types and inForce values.
+
+    python benchmarks/filtered_search.py --chunks 200000 --dim 384 --queries 64
+"""
+import time
+import argparse
+import numpy as np
+
+from rag.vectors.filters import ChunkMetadata, filtered_search
+from rag.vectors.index import create_faiss_index, set_search_params
+
+FILTERS = [
+    {'year_from': 2020, 'inForce': 'IN_FORCE'},
+    {'years': [2023], 'types': ['Ustawa']},
+    {'year_from': 2005},
+]
+
+
+def timed(function, repeat=3):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = function()
+    return result, (time.perf_counter() - start) / repeat * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--chunks', type=int, default=200000)
+    parser.add_argument('--dim', type=int, default=384)
+    parser.add_argument('--queries', type=int, default=64)
+    parser.add_argument('--k', type=int, default=5)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    vectors = rng.random((args.chunks, args.dim), dtype=np.float32)
+    queries = rng.random((args.queries, args.dim), dtype=np.float32)
+    acts = rng.integers(0, args.chunks // 20, size=args.chunks)
+    chunks = [{'year': 2000 + act % 25, 'type': ['Ustawa', 'Rozporządzenie', 'Obwieszczenie'][act % 3],
+               'inForce': 'IN_FORCE' if act % 4 else 'NOT_IN_FORCE', 'announcementDate': f'{2000 + act % 25}-01-01'}
+              for act in acts]
+    metadata = ChunkMetadata(chunks)
+
+    for index_type in ('flat', 'ivf_flat'):
+        index = create_faiss_index(vectors, index_type)
+        if index_type != 'flat':
+            set_search_params(index, nprobe=16)
+        _, full_ms = timed(lambda: index.search(queries, args.k))
+        print(f"{index_type}: no filter {full_ms:.1f} ms for {args.queries} queries")
+        for filters in FILTERS:
+            allowed, select_ms = timed(lambda: metadata.select(filters))
+            (D, I), ms = timed(lambda: filtered_search(index, queries, args.k, allowed))
+            exact = ''
+            if index_type == 'flat':
+                # the closest allowed chunks computed directly
+                distances = ((vectors[allowed][None] - queries[:, None]) ** 2).sum(-1) if len(allowed) < 20000 else None
+                if distances is not None:
+                    exact = f", exact: {bool((allowed[np.argsort(distances, axis=1)[:, :args.k]] == I).all())}"
+            print(f"  {str(filters):45} {len(allowed) / args.chunks:6.1%} allowed, select {select_ms:.1f} ms, "
+                  f"search {ms:.1f} ms{exact}")
+
+
+if __name__ == '__main__':
+    main()
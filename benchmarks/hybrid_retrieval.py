@@ -0,0 +1,60 @@
+"""
+BM25 index build time and query latency, and how often the chunk of the article asked about ("Art. 17 of act X")
+is among the top k: dense retrieval alone against dense + BM25 fused with reciprocal rank fusion.
+
+    python benchmarks/hybrid_retrieval.py --chunks 100000 --queries 300 --k 3 --model all-MiniLM-L6-v2
+"""
+import time
+import random
+import argparse
+import numpy as np
+
+from rag.vectors.bm25 import BM25Index
+from rag.vectors.embedd import embed_texts
+from rag.vectors.index import create_faiss_index
+from rag.vectors.retriever import Retriever
+
+WORDS = ("tax minister regulation waste environment penalty court act shall enter force employer "
+         "payment deadline authority permit fee protection water energy").split()
+
+
+def make_corpus(rng, n, per_act=20):
+    return [{'eng_chunk': ' '.join(rng.choice(WORDS) for _ in range(60)),
+             'eng_title': f'Act {i // per_act} on {rng.choice(WORDS)}', 'chunk_title': f'Art. {i % per_act + 1}',
+             'keywords': [rng.choice(WORDS)], 'display_name': f'Dz.U. 2020 poz. {i // per_act}'} for i in range(n)]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--chunks', type=int, default=100000)
+    parser.add_argument('--queries', type=int, default=300)
+    parser.add_argument('--k', type=int, default=3)
+    parser.add_argument('--model', default='all-MiniLM-L6-v2')
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    data = make_corpus(rng, args.chunks)
+    start = time.perf_counter()
+    lexical = BM25Index(data)
+    print(f"BM25 built in {time.perf_counter() - start:.2f}s for {len(data)} chunks, {len(lexical.terms)} terms")
+
+    targets = rng.sample(range(len(data)), args.queries)
+    queries = [f"What does {data[i]['chunk_title']} of {data[i]['eng_title']} say?" for i in targets]
+    start = time.perf_counter()
+    for query in queries:
+        lexical.search(query, 4 * args.k)
+    print(f"BM25 query: {(time.perf_counter() - start) / len(queries) * 1000:.2f} ms")
+
+    embeddings, model = embed_texts([item['eng_chunk'] for item in data], args.model)
+    index = create_faiss_index(embeddings)
+    for name, retriever in (('dense', Retriever(index, model, data)), ('hybrid', Retriever(index, model, data, lexical))):
+        hits, times = 0, []
+        for query, target in zip(queries, targets):
+            found = retriever.search(query, args.k)
+            times.append(retriever.last_timings['total_ms'])
+            hits += any(chunk['id'] == target for chunk in found)
+        print(f"{name:7} hit@{args.k}: {hits / len(queries):.3f}, p50 {np.percentile(times, 50):.2f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+"""
+Compares extract_all_docs_data with harvest_all_docs_data against a local stub of the ISAP API.
+Every stub response is delayed by --latency seconds to imitate the real server.
+
+    python benchmarks/isap_harvest.py --years 5 --docs-per-year 2000 --latency 0.05
+"""
+import json
+import time
+import argparse
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+from rag.isap.info import extract_all_docs_data, harvest_all_docs_data
+
+
+def make_handler(years, docs_per_year, latency):
+    class StubHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            time.sleep(latency)
+            url = urlparse(self.path)
+            parts = url.path.strip('/').split('/')
+            if parts[-1] == 'DU':
+                body = {'years': years}
+            elif parts[-1] == 'search':
+                query = parse_qs(url.query)
+                year, offset, limit = (int(query[name][0]) for name in ('year', 'offset', 'limit'))
+                items = [{'year': year, 'pos': pos, 'title': f'Act {year}/{pos}'}
+                         for pos in range(offset + 1, min(offset + limit, docs_per_year) + 1)]
+                body = {'items': items}
+            else:
+                body = {'count': docs_per_year}
+            payload = json.dumps(body).encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, *args):
+            pass
+
+    return StubHandler
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--years', type=int, default=5)
+    parser.add_argument('--docs-per-year', type=int, default=2000)
+    parser.add_argument('--latency', type=float, default=0.05)
+    parser.add_argument('--workers', type=int, default=8)
+    args = parser.parse_args()
+
+    years = list(range(2000, 2000 + args.years))
+    server = ThreadingHTTPServer(('127.0.0.1', 0), make_handler(years, args.docs_per_year, args.latency))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f'http://127.0.0.1:{server.server_port}'
+
+    start = time.perf_counter()
+    sequential = extract_all_docs_data(base_api_url=base_url)
+    sequential_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    concurrent = harvest_all_docs_data(base_api_url=base_url, max_workers=args.workers, requests_per_second=None)
+    concurrent_time = time.perf_counter() - start
+
+    server.shutdown()
+    assert sequential == concurrent, "harvester returned different documents"
+    print(f"documents: {len(sequential)}")
+    print(f"extract_all_docs_data: {sequential_time:.2f}s")
+    print(f"harvest_all_docs_data: {concurrent_time:.2f}s ({sequential_time / concurrent_time:.1f}x)")
+
+
+if __name__ == '__main__':
+    main()
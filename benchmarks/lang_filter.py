@@ -0,0 +1,166 @@
+"""
+Compares extract_lang with running langdetect on every paragraph (what extract_lang did before) on generated
+post-OCR text: Polish paragraphs (some of them with diacritics lost by OCR), page headers and footers, numbers,
+English annexes and a few German and French paragraphs. Prints the time of both, how many paragraphs each one
+labels wrongly and how many verdicts differ.
+
+    python benchmarks/lang_filter.py --docs 20 --paragraphs 500 --workers 1
+"""
+import time
+import random
+import argparse
+
+from langdetect import DetectorFactory, detect
+
+from rag.txt_extract import lang as lang_module
+from rag.txt_extract.lang import detect_paragraphs_lang
+
+POLISH = [
+    'Minister właściwy do spraw finansów publicznych określi, w drodze rozporządzenia, wysokość opłat.',
+    'Przepisy ustawy stosuje się odpowiednio do jednostek samorządu terytorialnego.',
+    'Wniosek o wydanie zezwolenia składa się do organu właściwego ze względu na miejsce zamieszkania.',
+    'Kto narusza obowiązek, o którym mowa w ust. 1, podlega karze grzywny.',
+    'Decyzja jest wydawana w terminie 30 dni od dnia złożenia wniosku.',
+    'Rada Ministrów przedstawia Sejmowi sprawozdanie z wykonania budżetu państwa.',
+    'Ustawa wchodzi w życie po upływie 14 dni od dnia ogłoszenia.',
+    'Podatnik jest obowiązany prowadzić ewidencję sprzedaży.',
+    'W przypadku gdy termin upływa w sobotę, przesuwa się go na najbliższy dzień roboczy.',
+    'Zwolnienie nie przysługuje osobom prowadzącym działalność gospodarczą.',
+    'Organ prowadzący rejestr dokonuje wpisu w terminie siedmiu dni.',
+    'Do postępowania w sprawach nieuregulowanych stosuje się przepisy Kodeksu postępowania administracyjnego.',
+    'Traci moc ustawa z dnia 12 marca 2004 r. o pomocy społecznej.',
+    'Wojewoda sprawuje nadzór nad działalnością organów gminy.',
+    'Opłatę wnosi się na rachunek bankowy urzędu przed złożeniem wniosku.',
+    'Świadczenie przysługuje do ukończenia przez dziecko 18 roku życia.',
+    'Minister Zdrowia ogłasza w dzienniku urzędowym wykaz leków refundowanych.',
+    'Umowa może zostać rozwiązana przez każdą ze stron z zachowaniem trzymiesięcznego okresu wypowiedzenia.',
+    'Informacje te przekazuje się w postaci elektronicznej.',
+    'Zarząd województwa uchwala regulamin organizacyjny urzędu marszałkowskiego.',
+    'Sąd rozpoznaje sprawę w składzie trzech sędziów.',
+    'Skarga przysługuje w terminie miesiąca od dnia doręczenia postanowienia.',
+    'Pracodawca jest obowiązany zapewnić pracownikom bezpieczne i higieniczne warunki pracy.',
+    'Gmina prowadzi ewidencję zbiorników bezodpływowych.',
+    'Wykonawca wnosi zabezpieczenie należytego wykonania umowy przed jej zawarciem.',
+    'Komendant Główny Policji nadaje statut komendom wojewódzkim.',
+    'Nauczycielowi przysługuje dodatek za wysługę lat.',
+    'Rejestr prowadzi się w systemie teleinformatycznym.',
+    'Czynności te wykonuje inspektor nadzoru budowlanego.',
+    'Koszty postępowania ponosi wnioskodawca.',
+    'Zmiana planu wymaga zgody rady powiatu.',
+    'Kierownik jednostki odpowiada za gospodarkę finansową.',
+    'Przedsiębiorca przechowuje dokumentację przez okres pięciu lat.',
+    'Obywatel polski ma prawo do ochrony zdrowia.',
+    'W skład komisji wchodzi przewodniczący oraz czterech członków.',
+    'Właściciel nieruchomości utrzymuje czystość i porządek.',
+    'Żołnierz zawodowy może być wyznaczony na stanowisko służbowe.',
+]
+ENGLISH = [
+    'The Minister responsible for public finance shall determine the amount of the fees by regulation.',
+    'The provisions of this Act shall apply accordingly to local government units.',
+    'An application for a permit shall be submitted to the competent authority.',
+    'Any person who breaches the obligation referred to in paragraph 1 shall be liable to a fine.',
+    'The decision is issued within 30 days from the date of the application.',
+    'This Act shall enter into force 14 days after its publication.',
+    'The taxpayer is required to keep records of sales.',
+    'The agreement may be terminated by either party with three months notice.',
+    'Member States shall communicate to the Commission the text of the main provisions of national law.',
+    'This Regulation shall be binding in its entirety and directly applicable in all Member States.',
+    'The court shall hear the case in a panel of three judges.',
+    'A complaint may be lodged within one month from the date of service of the order.',
+    'The employer is obliged to ensure safe and hygienic working conditions for employees.',
+    'The municipality keeps a register of septic tanks.',
+    'Teachers are entitled to a seniority allowance.',
+    'The costs of the proceedings are borne by the applicant.',
+    'Changes to the plan require the consent of the district council.',
+    'Polish citizens have the right to health protection.',
+    'The committee consists of a chairman and four members.',
+    'Property owners keep the premises clean and tidy.',
+]
+OTHER = [  # (language, text)
+    ('de', 'Diese Verordnung tritt am zwanzigsten Tag nach ihrer Veröffentlichung in Kraft.'),
+    ('de', 'Die Vertragsparteien verpflichten sich, die Zusammenarbeit zu fördern.'),
+    ('fr', 'Le présent règlement entre en vigueur le vingtième jour suivant celui de sa publication.'),
+    ('fr', 'Les parties contractantes s\'engagent à promouvoir la coopération.'),
+    # without letters outside ASCII, like after a bad OCR
+    ('de', 'Das Gericht entscheidet durch Beschluss ohne mundliche Verhandlung.'),
+    ('it', 'Il presente regolamento entra in vigore il ventesimo giorno successivo alla pubblicazione.'),
+    ('es', 'El presente Reglamento sera obligatorio en todos sus elementos y directamente aplicable en cada Estado miembro.'),
+    ('nl', 'De lidstaten nemen de nodige maatregelen om aan deze richtlijn te voldoen.'),
+    ('cs', 'Tento zakon nabyva ucinnosti dnem jeho vyhlaseni ve Sbirce zakonu.'),
+]
+STRIP = str.maketrans('ąćęłńóśźżĄĆĘŁŃÓŚŹŻ', 'acelnoszzACELNOSZZ')
+
+
+def make_document(rng, n_paragraphs, doc_id):
+    """Paragraphs with the language they are written in ('' for no language)."""
+    paragraphs = []
+    for i in range(n_paragraphs):
+        kind = rng.random()
+        # references to articles make most paragraphs unique, like in real acts
+        if kind < 0.55:
+            text = f'Art. {rng.randint(1, 500)}. ' + ' '.join(rng.sample(POLISH, rng.randint(1, 3)))
+            paragraphs.append(('pl', text))
+        elif kind < 0.70:
+            # OCR lost the diacritics
+            text = f'Art. {rng.randint(1, 500)}. ' + ' '.join(rng.sample(POLISH, rng.randint(1, 2)))
+            paragraphs.append(('pl', text.translate(STRIP)))
+        elif kind < 0.80:
+            # page header and footer - the same in every document apart from numbers
+            paragraphs.append(('pl', f'Dziennik Ustaw – {i // 20 + 1} – Poz. {doc_id + 100}'))
+        elif kind < 0.88:
+            paragraphs.append(('', rng.choice([f'{rng.randint(1, 300)}.', f'{rng.randint(1, 28)}.{rng.randint(1, 12)}.2024',
+                                                f'§ {rng.randint(1, 30)}.', f'{rng.randint(1, 9)})'])))
+        elif kind < 0.97:
+            paragraphs.append(('en', f'Article {rng.randint(1, 500)}. ' + ' '.join(rng.sample(ENGLISH, rng.randint(1, 3)))))
+        else:
+            paragraphs.append(rng.choice(OTHER))
+    return paragraphs
+
+
+def old_detect(paragraph):
+    try:
+        return detect(paragraph)
+    except Exception:
+        return ''
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--docs', type=int, default=20)
+    parser.add_argument('--paragraphs', type=int, default=500)
+    parser.add_argument('--workers', type=int, default=1)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    docs = [make_document(rng, args.paragraphs, doc_id) for doc_id in range(args.docs)]
+    paragraphs = [text for doc in docs for _, text in doc]
+    truth = [lang for doc in docs for lang, _ in doc]
+    # profiles of both are loaded before timing
+    DetectorFactory.seed = 0
+    old_detect('warm up')
+    detect_paragraphs_lang(['warm up'])
+    lang_module._verdicts.clear()
+
+    start = time.perf_counter()
+    old = [old_detect(paragraph) for paragraph in paragraphs]
+    old_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    new = [lang for doc in docs for lang in detect_paragraphs_lang([text for _, text in doc], args.workers)]
+    new_time = time.perf_counter() - start
+
+    langdetect_calls = sum(lang_module.quick_lang(paragraph) is None for paragraph in dict.fromkeys(paragraphs))
+    print(f"{len(paragraphs)} paragraphs, {langdetect_calls} go to langdetect")
+    print(f"langdetect on every paragraph {old_time:.2f}s, detect_paragraphs_lang {new_time:.2f}s "
+          f"({old_time / new_time:.1f}x)")
+    print(f"wrong: langdetect {sum(a != b for a, b in zip(old, truth))}, "
+          f"detect_paragraphs_lang {sum(a != b for a, b in zip(new, truth))}; "
+          f"verdicts which differ: {sum(a != b for a, b in zip(old, new))}")
+    print(f"Polish paragraphs kept by extract_lang: langdetect "
+          f"{sum(a == b == 'pl' for a, b in zip(old, truth))}, detect_paragraphs_lang "
+          f"{sum(a == b == 'pl' for a, b in zip(new, truth))} of {truth.count('pl')}; other paragraphs kept: "
+          f"{sum(a == 'pl' != b for a, b in zip(old, truth))} and {sum(a == 'pl' != b for a, b in zip(new, truth))}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+"""
+Checks that normalise_markdown gives the same output as converting tables and calling strip_markdown
+on a set of generated markdown documents (similar to what PDF to markdown conversion produces), and compares their speed.
+
+    python benchmarks/markdown_normalise.py --docs 200 --tables 20
+"""
+import time
+import random
+import argparse
+
+from rag.txt_extract.discard import strip_markdown
+from rag.txt_extract.tables import detect_markdown_table, markdown_table_to_csv
+from rag.txt_extract.markdown import normalise_markdown
+
+WORDS = "ustawa przepis minister art dnia roku sprawie zmianie ochrony środowiska podatku 15 2020 > # * **".split()
+
+
+def reference(text, keep_tables):
+    """Tables replaced one by one (from the last one, so positions stay valid), then strip_markdown."""
+    if not keep_tables:
+        tables = detect_markdown_table(text)
+        for i, (start, end) in reversed(list(enumerate(tables))):
+            text = text[:start] + f'Tabela {i}. {markdown_table_to_csv(text[start:end])}\n' + text[end:]
+    return strip_markdown(text)
+
+
+def sentence(rng):
+    return ' '.join(rng.choice(WORDS) for _ in range(rng.randint(2, 12)))
+
+
+def make_document(rng, n_blocks, n_tables):
+    blocks = []
+    for _ in range(n_blocks):
+        kind = rng.random()
+        if kind < 0.1:
+            blocks.append(f'{"#" * rng.randint(1, 4)} {sentence(rng)}')
+        elif kind < 0.2:
+            blocks.append(f'**Art. {rng.randint(1, 300)}.** {sentence(rng)} *{sentence(rng)}*')
+        elif kind < 0.25:
+            blocks.append(f'![](_page_{rng.randint(0, 99)}_Picture_0.jpeg)')
+        elif kind < 0.3:
+            blocks.append(f'<span id="page-{rng.randint(0, 99)}-0"></span>{sentence(rng)} [{sentence(rng)}](#page-1-0)')
+        elif kind < 0.35:
+            blocks.append(f'> {sentence(rng)}')
+        else:
+            blocks.append(sentence(rng))
+        blocks.append('\n' * rng.randint(1, 3))
+    for _ in range(n_tables):
+        rows = [f'| {" | ".join(sentence(rng) for _ in range(3))} |' for _ in range(rng.randint(2, 6))]
+        rows.insert(1, '| --- | --- | --- |')
+        blocks.insert(rng.randrange(0, len(blocks), 2), '\n'.join(rows) + '\n\n')
+    return ''.join(blocks)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--docs', type=int, default=200)
+    parser.add_argument('--blocks', type=int, default=2000)
+    parser.add_argument('--tables', type=int, default=20)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    docs = [make_document(rng, args.blocks, rng.randint(0, args.tables)) for _ in range(args.docs)]
+    for keep_tables in (True, False):
+        start = time.perf_counter()
+        expected = [reference(doc, keep_tables) for doc in docs]
+        old_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        result = [normalise_markdown(doc, keep_tables) for doc in docs]
+        new_time = time.perf_counter() - start
+
+        different = sum(a != b for a, b in zip(result, expected))
+        print(f"keep_tables={keep_tables}: {different} of {len(docs)} documents differ, "
+              f"tables + strip_markdown {old_time:.2f}s, normalise_markdown {new_time:.2f}s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+"""
+Latency of short answers with and without PrefixCache: generate for every question (same found chunks
+as rag_search would give), once with the default SYS_PROMPT and once with longer instructions.
+With greedy decoding answers are the same both ways in float32 (--no-quantize). With int8 linear layers they may
+differ slightly - activations are quantised with a range computed over the tokens of each forward pass, and the
+prefix is computed in a pass of its own.
+
+    python benchmarks/prefix_cache.py --llm google/gemma-2-2b-it --backend cpu --questions 20 --max-new-tokens 8
+"""
+import time
+import random
+import argparse
+import numpy as np
+
+from rag.llms.core import SYS_PROMPT, generate
+from rag.llms.models import setup_qa_pipeline
+from rag.llms.prefix_cache import PrefixCache
+from rag.llms.streaming import stream_generate
+
+WORDS = "tax minister regulation waste environment penalty court act article shall enter force employer".split()
+LONG_SYS_PROMPT = SYS_PROMPT + " " + " ".join([
+    "You answer questions about Polish legal acts published in the Journal of Laws.",
+    "Use only the documents given in the context, never your own knowledge.",
+    "If the documents don't contain the answer, say that the answer is not in the given documents.",
+    "Quote article numbers exactly as they appear in the document, e.g. Art. 15 sec. 2.",
+    "Give dates in the format YYYY-MM-DD and amounts with their currency.",
+    "Keep the answer short - one or two sentences - and don't repeat the question.",
+    "Titles of acts must be given in full, as they appear after TITLE in the context.",
+])
+
+
+def sentence(rng, n):
+    return ' '.join(rng.choice(WORDS) for _ in range(n))
+
+
+def measure(questions, contexts, qa_pipeline, params, sys_prompt, prefix_cache):
+    latencies, answers, stats = [], [], []
+    for question, chunks in zip(questions, contexts):
+        stats.append({})
+        start = time.perf_counter()
+        answers.append(generate(question, chunks, qa_pipeline, params, sys_prompt, prefix_cache=prefix_cache,
+                                stats=stats[-1]))
+        latencies.append((time.perf_counter() - start) * 1000)
+    return latencies, answers, stats
+
+
+def ttft(questions, contexts, qa_pipeline, params, sys_prompt, prefix_cache):
+    values = []
+    for question, chunks in zip(questions, contexts):
+        stats = {}
+        for _ in stream_generate(question, chunks, qa_pipeline, params, sys_prompt, stats=stats, prefix_cache=prefix_cache):
+            pass
+        values.append(stats['ttft_ms'])
+    return values
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--questions', type=int, default=20)
+    parser.add_argument('--k', type=int, default=3)
+    parser.add_argument('--chunk-words', type=int, default=40)
+    parser.add_argument('--max-new-tokens', type=int, default=8)
+    parser.add_argument('--llm', default='google/gemma-2-2b-it')
+    parser.add_argument('--backend', default='cpu')
+    parser.add_argument('--threads', type=int, default=None)
+    parser.add_argument('--no-quantize', action='store_true')
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    questions = [sentence(rng, 10) + '?' for _ in range(args.questions)]
+    contexts = [[{'title': f'Act {rng.randrange(1000)}: {sentence(rng, 5)}', 'chunk': sentence(rng, args.chunk_words)}
+                 for _ in range(args.k)] for _ in questions]
+    qa_pipeline = setup_qa_pipeline(args.llm, args.backend, quantize=not args.no_quantize, threads=args.threads)
+    params = {'max_new_tokens': args.max_new_tokens, 'do_sample': False}
+
+    for name, sys_prompt in (('default sys_prompt', SYS_PROMPT), ('long sys_prompt', LONG_SYS_PROMPT)):
+        prefix_cache = PrefixCache()
+        # the first request computes the prefix, it's not counted
+        generate(questions[0], contexts[0], qa_pipeline, params, sys_prompt, prefix_cache=prefix_cache)
+        plain, plain_answers, _ = measure(questions, contexts, qa_pipeline, params, sys_prompt, None)
+        cached, cached_answers, stats = measure(questions, contexts, qa_pipeline, params, sys_prompt, prefix_cache)
+        plain_ttft = ttft(questions, contexts, qa_pipeline, params, sys_prompt, None)
+        cached_ttft = ttft(questions, contexts, qa_pipeline, params, sys_prompt, prefix_cache)
+        print(f"{name}: {np.mean([s['cached_tokens'] for s in stats]):.0f} of "
+              f"{np.mean([s['prompt_tokens'] for s in stats]):.0f} prompt tokens cached, "
+              f"same answers: {plain_answers == cached_answers}")
+        print(f"  latency  p50 {np.percentile(plain, 50):.0f} -> {np.percentile(cached, 50):.0f} ms, "
+              f"TTFT p50 {np.percentile(plain_ttft, 50):.0f} -> {np.percentile(cached_ttft, 50):.0f} ms, "
+              f"prefill saved ~{np.mean([s['prefill_saved_ms_est'] for s in stats]):.0f} ms/request (estimate), "
+              f"cache copy {np.mean([s['cache_copy_ms'] for s in stats]):.1f} ms/request")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,61 @@
+"""
+Retrieval-only latency of one question for growing corpora: the steps of rag_search (prepare_chunks on every
+question, encode, search, get_context_chunks) against Retriever.search, with a flat index of random vectors.
+
+    python benchmarks/retrieval_latency.py --sizes 10000 100000 300000 --queries 200 --model all-MiniLM-L6-v2
+"""
+import time
+import argparse
+import numpy as np
+
+from rag.llms.context import prepare_chunks, get_context_chunks
+from rag.vectors.embedd import load_embedding_model
+from rag.vectors.index import create_faiss_index
+from rag.vectors.retriever import Retriever
+
+QUESTIONS = ["What is the penalty for not paying the tax on time?", "Who issues the regulation on waste?",
+             "When does the act on environmental protection enter into force?", "What does Art. 15 say?"]
+
+
+def rag_search_retrieval(query, index, data, model, k):
+    """Steps 1-4 of rag_search (without generation)."""
+    chunks, titles = prepare_chunks(data)
+    query_embedding = model.encode([query], convert_to_numpy=True)
+    _, I = index.search(query_embedding, k=k)
+    return get_context_chunks(chunks, titles, I)
+
+
+def percentiles(times):
+    return np.percentile(times, 50) * 1000, np.percentile(times, 95) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000, 300000])
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--k', type=int, default=3)
+    parser.add_argument('--model', default='all-MiniLM-L6-v2')
+    args = parser.parse_args()
+
+    model = load_embedding_model(args.model)
+    dim = model.encode(['warm up'], convert_to_numpy=True).shape[1]
+    questions = [QUESTIONS[i % len(QUESTIONS)] for i in range(args.queries)]
+    print(f"{'chunks':>8} {'rag_search p50/p95 ms':>22} {'Retriever p50/p95 ms':>22}")
+    for size in args.sizes:
+        data = [{'eng_chunk': f'chunk {i}', 'eng_title': f'act {i // 50}'} for i in range(size)]
+        index = create_faiss_index(np.random.default_rng(0).random((size, dim), dtype=np.float32))
+        old, new = [], []
+        retriever = Retriever(index, model, data)
+        retriever.search(questions[0], args.k)  # corpus structures are built on the first search
+        for question in questions:
+            start = time.perf_counter()
+            rag_search_retrieval(question, index, data, model, args.k)
+            old.append(time.perf_counter() - start)
+            start = time.perf_counter()
+            retriever.search(question, args.k)
+            new.append(time.perf_counter() - start)
+        print(f"{size:>8} {'%.2f / %.2f' % percentiles(old):>22} {'%.2f / %.2f' % percentiles(new):>22}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,135 @@
+"""
+End-to-end test of rag.server under load: a generated corpus is written in the layout of rag.sync, the service
+is started in this process and --concurrency clients send --requests questions over HTTP. The same load
+is sent with batching turned off (max batch size 1) and on, then a burst bigger than --max-pending
+checks that the extra requests get 503 instead of waiting.
+
+    python benchmarks/server_load.py --llm google/gemma-2-2b-it --embedding-model all-MiniLM-L6-v2
+"""
+import os
+import time
+import random
+import asyncio
+import argparse
+import numpy as np
+import aiohttp
+from aiohttp import web
+
+from rag.llms.models import setup_qa_pipeline
+from rag.server import RAGService, load_retriever
+from rag.vectors.bm25 import BM25Index
+from rag.vectors.chunk_index import ChunkIndex, chunk_key
+from rag.vectors.chunk_store import write_chunk_store
+from rag.vectors.embedd import embed_texts
+from rag.vectors.filters import ChunkMetadata
+
+WORDS = "tax minister regulation waste environment penalty court act article shall enter force employer".split()
+
+
+def sentence(rng, n):
+    return ' '.join(rng.choice(WORDS) for _ in range(n))
+
+
+def prepare(workdir, n_chunks, embedding_model):
+    rng = random.Random(0)
+    chunks = [{'document_id': f'DU_{2000 + i // 100 % 25}_{i // 20}', 'chunk_id': i % 20, 'year': 2000 + i // 100 % 25,
+               'eng_chunk': sentence(rng, 40), 'eng_title': f'Act {i // 20}: {sentence(rng, 5)}'} for i in range(n_chunks)]
+    ids = [chunk_key(chunk['document_id'], chunk['chunk_id']) for chunk in chunks]
+    embeddings, _ = embed_texts([chunk['eng_chunk'] for chunk in chunks], embedding_model)
+    index = ChunkIndex(os.path.join(workdir, 'chunk_index'))
+    index.add(chunks, embeddings)
+    index.save()
+    index.close()
+    write_chunk_store(os.path.join(workdir, 'chunk_store'), chunks, ids)
+    BM25Index(chunks, ids).save(os.path.join(workdir, 'bm25.npz'))
+    ChunkMetadata(chunks, ids).save(os.path.join(workdir, 'metadata.npz'))
+
+
+async def load(url, questions, concurrency, max_new_tokens):
+    """Sends all questions with at most concurrency requests at a time, returns latencies and status codes."""
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies, statuses = [], []
+
+    async def ask(session, question):
+        async with semaphore:
+            start = time.perf_counter()
+            async with session.post(f'{url}/query', json={'question': question, 'k': 3, 'max_new_tokens': max_new_tokens}) as response:
+                await response.read()
+                statuses.append(response.status)
+            latencies.append((time.perf_counter() - start) * 1000)
+
+    async with aiohttp.ClientSession() as session:
+        start = time.perf_counter()
+        await asyncio.gather(*(ask(session, question) for question in questions))
+        seconds = time.perf_counter() - start
+    return seconds, latencies, statuses
+
+
+async def run_service(service, port, coroutine):
+    runner = web.AppRunner(service.make_app())
+    await runner.setup()
+    await web.TCPSite(runner, '127.0.0.1', port).start()
+    try:
+        return await coroutine
+    finally:
+        await runner.cleanup()
+
+
+async def scenario(args, retriever, qa_pipeline, name, max_batch_size, max_pending, questions, concurrency):
+    service = RAGService(retriever, qa_pipeline, {'max_new_tokens': args.max_new_tokens, 'do_sample': False},
+                         max_batch_size=max_batch_size, max_wait_ms=args.max_wait_ms, max_pending=max_pending)
+    url = f'http://127.0.0.1:{args.port}'
+
+    async def measure():
+        seconds, latencies, statuses = await load(url, questions, concurrency, args.max_new_tokens)
+        async with aiohttp.ClientSession() as session:
+            async with session.get(f'{url}/health') as response:
+                health = await response.json()
+            async with session.get(f'{url}/latency') as response:
+                stats = await response.json()
+        return seconds, latencies, statuses, health, stats
+
+    seconds, latencies, statuses, health, stats = await run_service(service, args.port, measure())
+    ok = statuses.count(200)
+    print(f"{name}: {ok / seconds:.1f} answers/s, client latency p50 {np.percentile(latencies, 50):.0f} ms "
+          f"p95 {np.percentile(latencies, 95):.0f} ms, 200: {ok}, 503: {statuses.count(503)}, "
+          f"mean batch (retrieval/generation) {stats['batch_size']['retrieval']['mean']}/"
+          f"{stats['batch_size']['generation']['mean']}, health {health['status']}")
+
+
+async def main_async(args, retriever, qa_pipeline):
+    rng = random.Random(1)
+    questions = [sentence(rng, 10) + '?' for _ in range(args.requests)]
+    await scenario(args, retriever, qa_pipeline, 'no batching', 1, args.requests, questions, args.concurrency)
+    await scenario(args, retriever, qa_pipeline, 'micro-batching', args.max_batch_size, args.requests, questions,
+                   args.concurrency)
+    # everything at once, more than the service accepts
+    await scenario(args, retriever, qa_pipeline, f'burst over max_pending={args.max_pending}', args.max_batch_size,
+                   args.max_pending, questions, len(questions))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--workdir', default='/tmp/server_load')
+    parser.add_argument('--chunks', type=int, default=5000)
+    parser.add_argument('--requests', type=int, default=256)
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--max-batch-size', type=int, default=16)
+    parser.add_argument('--max-wait-ms', type=float, default=10.0)
+    parser.add_argument('--max-pending', type=int, default=64)
+    parser.add_argument('--max-new-tokens', type=int, default=16)
+    parser.add_argument('--port', type=int, default=8089)
+    parser.add_argument('--llm', default='google/gemma-2-2b-it')
+    parser.add_argument('--embedding-model', default='all-MiniLM-L6-v2')
+    args = parser.parse_args()
+
+    if not os.path.exists(os.path.join(args.workdir, 'chunk_store')):
+        prepare(args.workdir, args.chunks, args.embedding_model)
+    # no cache - repeated questions would be answered without the models
+    retriever = load_retriever(args.workdir, args.embedding_model, cache=None)
+    qa_pipeline = setup_qa_pipeline(args.llm)
+    asyncio.run(main_async(args, retriever, qa_pipeline))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,65 @@
+"""
+Perceived latency of answers: time until rag_search returns the whole answer against time to the first token
+of rag_search_stream (what the user waits for before the answer starts appearing), plus tokens/s.
+
+    python benchmarks/streaming_latency.py --questions 20 --max-new-tokens 128 --llm google/gemma-2-2b-it
+"""
+import time
+import random
+import argparse
+import numpy as np
+
+from rag.llms.core import rag_search
+from rag.llms.models import setup_qa_pipeline
+from rag.llms.streaming import rag_search_stream
+from rag.vectors.embedd import embed_texts
+from rag.vectors.index import create_faiss_index
+from rag.vectors.retriever import Retriever
+
+WORDS = "tax minister regulation waste environment penalty court act article shall enter force employer".split()
+
+
+def sentence(rng, n):
+    return ' '.join(rng.choice(WORDS) for _ in range(n))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--questions', type=int, default=20)
+    parser.add_argument('--chunks', type=int, default=5000)
+    parser.add_argument('--k', type=int, default=3)
+    parser.add_argument('--max-new-tokens', type=int, default=128)
+    parser.add_argument('--llm', default='google/gemma-2-2b-it')
+    parser.add_argument('--embedding-model', default='all-MiniLM-L6-v2')
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    data = [{'eng_chunk': sentence(rng, 40), 'eng_title': f'Act {i // 20}: {sentence(rng, 5)}'} for i in range(args.chunks)]
+    questions = [sentence(rng, 10) + '?' for _ in range(args.questions)]
+    embeddings, model = embed_texts([item['eng_chunk'] for item in data], args.embedding_model)
+    retriever = Retriever(create_faiss_index(embeddings), model, data)
+    qa_pipeline = setup_qa_pipeline(args.llm)
+    params = {'max_new_tokens': args.max_new_tokens, 'do_sample': False}
+
+    full = []
+    for question in questions:
+        start = time.perf_counter()
+        rag_search(question, None, None, None, qa_pipeline, args.k, params, retriever=retriever)
+        full.append((time.perf_counter() - start) * 1000)
+
+    stats = []
+    for question in questions:
+        stats.append({})
+        for _ in rag_search_stream(question, retriever, qa_pipeline, args.k, params, stats=stats[-1]):
+            pass
+    first_token = [s['retrieval_ms'] + s['ttft_ms'] for s in stats]
+    total = [s['retrieval_ms'] + s['latency_ms'] for s in stats]
+    print(f"whole answer (rag_search):       p50 {np.percentile(full, 50):.0f} ms, p95 {np.percentile(full, 95):.0f} ms")
+    print(f"first token (rag_search_stream): p50 {np.percentile(first_token, 50):.0f} ms, "
+          f"p95 {np.percentile(first_token, 95):.0f} ms")
+    print(f"streamed answer total:           p50 {np.percentile(total, 50):.0f} ms, "
+          f"{np.mean([s['tokens_per_s'] for s in stats]):.1f} tokens/s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,60 @@
+"""
+Compares the old per-line title search of remove_before with find_title_line on synthetic long documents
+of --lines lines. Three layouts are measured: the title after a short fragment of another act (the usual case),
+the title at the very end and no title at all (the whole document has to be scored).
+
+    python benchmarks/title_locator.py --lines 20000 --docs 10
+"""
+import time
+import random
+import argparse
+from rapidfuzz import fuzz
+
+from rag.txt_extract.discard import find_title_line, TITLE_DATE_PATTERN
+
+WORDS = "ustawa rozporządzenie minister art przepis dnia roku sprawie zmianie ochrony środowiska podatku".split()
+
+
+def per_line_search(lines, title, threshold=90):
+    """The loop remove_before used before - one partial_ratio call per line."""
+    cleaned_title = TITLE_DATE_PATTERN.sub('', title)
+    for idx, line in enumerate(lines):
+        if fuzz.partial_ratio(line.lower(), cleaned_title.lower()) >= threshold:
+            return idx
+    return None
+
+
+def make_document(rng, n_lines, title, title_position):
+    lines = [' '.join(rng.choice(WORDS) for _ in range(rng.randint(3, 15))) + '\n' for _ in range(n_lines)]
+    if title_position is not None:
+        lines.insert(title_position, f'# {title.upper()}\n')
+    return lines
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--lines', type=int, default=20000)
+    parser.add_argument('--docs', type=int, default=10)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    title = 'Ustawa z dnia 12 marca 2020 r. o szczególnych rozwiązaniach związanych z zapobieganiem COVID-19'
+    print(f"{args.docs} documents x {args.lines} lines")
+    for layout, position in (('title after 50 lines', 50), ('title at the end', args.lines), ('no title', None)):
+        docs = [make_document(rng, args.lines, title, position) for _ in range(args.docs)]
+
+        start = time.perf_counter()
+        expected = [per_line_search(lines, title) for lines in docs]
+        old_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        result = [find_title_line(lines, title) for lines in docs]
+        new_time = time.perf_counter() - start
+
+        assert result == expected, f"different lines found: {result} vs {expected}"
+        print(f"{layout}: per-line loop {old_time / args.docs * 1000:.2f} ms/document, "
+              f"find_title_line {new_time / args.docs * 1000:.2f} ms/document ({old_time / new_time:.1f}x)")
+
+
+if __name__ == '__main__':
+    main()
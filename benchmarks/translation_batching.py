@@ -0,0 +1,72 @@
+"""
+Compares one-request-per-text translation with BatchTranslator against a local stand-in of LibreTranslate.
+Every request costs --latency seconds plus --per-char seconds for each translated character.
+
+    python benchmarks/translation_batching.py --texts 500 --workers 4 --max-chars 5000
+"""
+import json
+import time
+import argparse
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+from rag.preprocess.backends import BatchTranslator, LibreTranslateBackend
+
+
+def make_handler(latency, per_char):
+    class StubHandler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+            texts = body['q'] if isinstance(body['q'], list) else [body['q']]
+            time.sleep(latency + per_char * sum(len(text) for text in texts))
+            translations = [text.upper() for text in texts]
+            payload = json.dumps({'translatedText': translations if isinstance(body['q'], list) else translations[0]}).encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, *args):
+            pass
+
+    return StubHandler
+
+
+def run(translator, texts):
+    start = time.perf_counter()
+    translations = translator.translate(texts)
+    return translations, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--texts', type=int, default=500)
+    parser.add_argument('--latency', type=float, default=0.02)
+    parser.add_argument('--per-char', type=float, default=1e-6)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--max-chars', type=int, default=5000)
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), make_handler(args.latency, args.per_char))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f'http://127.0.0.1:{server.server_port}/translate'
+    texts = [f'Art. {i}. Przepis numer {i} ' * (1 + i % 20) for i in range(args.texts)]
+
+    # one text per request, one request at a time - how translate_all used to work
+    sequential = BatchTranslator(LibreTranslateBackend(url), max_chars=0, max_workers=1)
+    batched = BatchTranslator(LibreTranslateBackend(url, pool_size=args.workers),
+                              max_chars=args.max_chars, max_workers=args.workers)
+    expected, sequential_time = run(sequential, texts)
+    result, batched_time = run(batched, texts)
+    server.shutdown()
+
+    assert result == expected, "batched translations differ"
+    print(f"texts: {len(texts)}")
+    print(f"one request per text: {sequential_time:.2f}s ({len(texts) / sequential_time:.0f} texts/s)")
+    print(f"batched x{args.workers} workers: {batched_time:.2f}s ({len(texts) / batched_time:.0f} texts/s, "
+          f"{sequential_time / batched_time:.1f}x)")
+
+
+if __name__ == '__main__':
+    main()
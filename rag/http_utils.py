@@ -0,0 +1,71 @@
+import time
+import random
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from typing import Optional, Iterable
+
+
+def create_session(pool_size: int = 10) -> requests.Session:
+    """
+    Creates a requests.Session with a connection pool big enough for pool_size threads.
+    A session keeps connections open (keep-alive), so we don't pay for a new TCP/TLS handshake on every request.
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+class RateLimiter:
+    """
+    Simple thread-safe rate limiter. Allows at most `rate` calls per second
+    by spacing the calls evenly. rate=None (or 0) disables limiting.
+    """
+
+    def __init__(self, rate: Optional[float] = None):
+        self.interval = 1.0 / rate if rate else 0.0
+        self._lock = threading.Lock()
+        self._next_slot = time.monotonic()
+
+    def wait(self) -> None:
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            # reserve the next free slot, and move it one interval forward for the next caller
+            slot = max(self._next_slot, now)
+            self._next_slot = slot + self.interval
+        delay = slot - now
+        if delay > 0:
+            time.sleep(delay)
+
+
+def request_with_retry(session: requests.Session,
+                       method: str,
+                       url: str,
+                       retries: int = 3,
+                       backoff: float = 0.5,
+                       rate_limiter: Optional[RateLimiter] = None,
+                       retry_statuses: Iterable[int] = (429, 500, 502, 503, 504),
+                       **kwargs) -> requests.Response:
+    """
+    Sends a request using the given session and retries it on connection errors
+    and on "temporary" HTTP statuses (429, 5xx).
+    Waiting time grows exponentially: backoff, 2*backoff, 4*backoff... plus a bit of random jitter
+    so many threads don't retry at exactly the same moment.
+    """
+    for attempt in range(retries + 1):
+        if rate_limiter is not None:
+            rate_limiter.wait()
+        try:
+            response = session.request(method, url, **kwargs)
+            if response.status_code not in retry_statuses or attempt == retries:
+                response.raise_for_status()
+                return response
+            response.close()
+        except (requests.ConnectionError, requests.Timeout):
+            if attempt == retries:
+                raise
+        time.sleep(backoff * (2 ** attempt) + random.uniform(0, backoff))
@@ -1,40 +1,160 @@
+import os
+import json
+import time
+import threading
+import requests
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from tqdm import tqdm
-from typing import List
+from typing import List, Optional
 from .helpers import match_text_type, get_response
+from ..http_utils import create_session, RateLimiter, request_with_retry
 
+BASE_API_URL = 'https://api.sejm.gov.pl/eli/acts'
+# file in save_path that remembers size and ETag of every downloaded PDF
+MANIFEST_NAME = '.downloads.json'
 
-def save_article(doc: dict, file_ver: str, base_api_url: str, save_path: str) -> None:
+
+def article_url(doc: dict, file_ver: tuple, base_api_url: str) -> str:
     """
-    A function to save specified version of the article in the provided path.
+    Builds the link to the best available PDF version of the article.
     """
     # If we have the official version ('U'), use that link
     if file_ver[0]:
-        pdf_res = get_response(f'{base_api_url}/DU/{doc["year"]}/{doc["pos"]}/text/U/{file_ver[0]}', "pdf")
+        return f'{base_api_url}/DU/{doc["year"]}/{doc["pos"]}/text/U/{file_ver[0]}'
     # If we don’t have 'U' but have the original ('O'), use that one instead
-    elif file_ver[1]:
-        pdf_res = get_response(f'{base_api_url}/DU/{doc["year"]}/{doc["pos"]}/text/O/{file_ver[1]}', "pdf")
+    if file_ver[1]:
+        return f'{base_api_url}/DU/{doc["year"]}/{doc["pos"]}/text/O/{file_ver[1]}'
     # If neither version is available, try downloading the basic PDF
-    else:
-        pdf_res = get_response(f'{base_api_url}/DU/{doc["year"]}/{doc["pos"]}/text.pdf', "pdf")
+    return f'{base_api_url}/DU/{doc["year"]}/{doc["pos"]}/text.pdf'
+
+
+def save_article(doc: dict, file_ver: str, base_api_url: str, save_path: str) -> None:
+    """
+    A function to save specified version of the article in the provided path.
+    """
+    pdf_res = get_response(article_url(doc, file_ver, base_api_url), "pdf")
     # Save the PDF file with a clear name that includes the publisher, year, and document number
     with open(f'{save_path}/DU_{doc["year"]}_{doc["pos"]}.pdf','wb') as f:
         f.write(pdf_res)
 
 
-def get_articles(docs: List[dict], save_path: str) -> None:
+def download_file(session: requests.Session, url: str, path: str, known: Optional[dict] = None,
+                  chunk_size: int = 1 << 16, rate_limiter: Optional[RateLimiter] = None,
+                  revalidate: bool = False) -> dict:
     """
-    This function downloads PDF versions of documents and saves them to specified path.
-    It takes a list of documents and a place to save the files (save_path)
+    Downloads one file and returns its stats (name, status, bytes, seconds, MB/s) together with size and ETag.
+    - if the file already exists with the size we remember from the last download, nothing is sent at all
+      (with revalidate, the file is requested with the remembered ETag and the server answers
+      "304 Not Modified" without the body if it didn't change)
+    - if it exists but we know nothing about it, a HEAD request checks its size/ETag
+    - otherwise the body is streamed to disk in chunks into a temporary file which is renamed at the end,
+      so a crash never leaves a half-written PDF under the final name
     """
+    start = time.perf_counter()
+    stats = {'file': os.path.basename(path), 'url': url, 'status': 'skipped', 'bytes': 0}
+    headers = {}
+    if os.path.exists(path):
+        size = os.path.getsize(path)
+        if known and known.get('url') == url and known.get('size') == size:
+            if not (revalidate and known.get('etag')):
+                return {**stats, 'size': size, 'etag': known.get('etag'), 'seconds': 0.0, 'mb_per_s': 0.0}
+            headers['If-None-Match'] = known['etag']
+        else:
+            head = request_with_retry(session, 'HEAD', url, rate_limiter=rate_limiter, allow_redirects=True)
+            etag = head.headers.get('ETag')
+            if str(size) == head.headers.get('Content-Length') and (not known or not etag or known.get('etag') == etag):
+                return {**stats, 'size': size, 'etag': etag, 'seconds': time.perf_counter() - start, 'mb_per_s': 0.0}
+
+    tmp_path = f'{path}.part'
+    with request_with_retry(session, 'GET', url, rate_limiter=rate_limiter, stream=True, headers=headers) as response:
+        if response.status_code == 304:
+            return {**stats, 'size': os.path.getsize(path), 'etag': known['etag'],
+                    'seconds': time.perf_counter() - start, 'mb_per_s': 0.0}
+        with open(tmp_path, 'wb') as f:
+            for chunk in response.iter_content(chunk_size=chunk_size):
+                f.write(chunk)
+                stats['bytes'] += len(chunk)
+        etag = response.headers.get('ETag')
+    os.replace(tmp_path, path)
+
+    seconds = time.perf_counter() - start
+    return {**stats, 'status': 'downloaded', 'size': stats['bytes'], 'etag': etag,
+            'seconds': seconds, 'mb_per_s': stats['bytes'] / seconds / 1e6 if seconds else 0.0}
+
 
-    base_api_url = 'https://api.sejm.gov.pl/eli/acts'
+def read_manifest(save_path: str) -> dict:
+    """Manifest of downloaded files in save_path (file name -> url, size, etag), empty if it's missing or broken."""
+    manifest_path = os.path.join(save_path, MANIFEST_NAME)
+    if not os.path.exists(manifest_path):
+        return {}
+    try:
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+    except (ValueError, OSError):
+        # e.g. a manifest written by an older version which was killed mid-write - files are checked again
+        return {}
+    return manifest if isinstance(manifest, dict) else {}
 
-    # Wrap the iteration with tqdm to show progress
-    for doc in tqdm(docs, desc="Downloading PDFs"):
-        #if there is no PDF file just skip it
-        if not doc.get('textPDF'):
-            continue
-        file_versions = match_text_type(doc)
-        save_article(doc, file_versions, base_api_url, save_path)
 
+def write_manifest(save_path: str, manifest: dict) -> None:
+    """Saves the manifest (to a temporary file first, so a crash never leaves a broken one)."""
+    manifest_path = os.path.join(save_path, MANIFEST_NAME)
+    with open(f'{manifest_path}.tmp', 'w', encoding='utf-8') as f:
+        json.dump(manifest, f)
+    os.replace(f'{manifest_path}.tmp', manifest_path)
 
+
+def download_articles(docs: List[dict], save_path: str, max_workers: int = 8,
+                      requests_per_second: Optional[float] = None,
+                      base_api_url: str = BASE_API_URL, revalidate: bool = False) -> List[dict]:
+    """
+    Parallel version of get_articles. Workers share one keep-alive session and stream the PDFs to disk.
+    Size and ETag of every file are kept in a small manifest in save_path, so files that are
+    already there are skipped without any network traffic - re-running the download is almost free.
+    revalidate - ask the server whether files already there changed (by their ETag) instead of skipping them.
+    Returns per-file stats (see download_file), including throughput of every downloaded file.
+    """
+    manifest = read_manifest(save_path)
+
+    session = create_session(max_workers)
+    limiter = RateLimiter(requests_per_second)
+    lock = threading.Lock()
+    results = []
+
+    def download(doc: dict) -> dict:
+        name = f'DU_{doc["year"]}_{doc["pos"]}.pdf'
+        url = article_url(doc, match_text_type(doc), base_api_url)
+        try:
+            stats = download_file(session, url, os.path.join(save_path, name), manifest.get(name), rate_limiter=limiter,
+                                  revalidate=revalidate)
+        except requests.RequestException as e:
+            return {'file': name, 'url': url, 'status': 'failed', 'error': str(e)}
+        with lock:
+            manifest[name] = {'url': url, 'size': stats['size'], 'etag': stats['etag']}
+        return stats
+
+    #if there is no PDF file just skip it
+    docs = [doc for doc in docs if doc.get('textPDF')]
+    try:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = [executor.submit(download, doc) for doc in docs]
+            for future in tqdm(as_completed(futures), total=len(futures), desc="Downloading PDFs"):
+                results.append(future.result())
+    finally:
+        # save what we know even if the run was interrupted
+        write_manifest(save_path, manifest)
+        session.close()
+
+    failed = [stats for stats in results if stats['status'] == 'failed']
+    if failed:
+        print(f"{len(failed)} downloads failed, e.g. {failed[0]['file']}: {failed[0]['error']}")
+    return results
+
+
+def get_articles(docs: List[dict], save_path: str, max_workers: int = 8) -> None:
+    """
+    This function downloads PDF versions of documents and saves them to specified path.
+    It takes a list of documents and a place to save the files (save_path)
+    Files which were already downloaded are skipped (see download_articles).
+    """
+    download_articles(docs, save_path, max_workers=max_workers)
@@ -1,12 +1,14 @@
 import requests
-from typing import Union, Dict, Any, Tuple
+from typing import Union, Dict, Any, Tuple, Optional
 
-def get_response(url: str, return_type: str ="json") -> Union[bytes, Dict[str, Any]]:
+def get_response(url: str, return_type: str ="json", session: Optional[requests.Session] = None) -> Union[bytes, Dict[str, Any]]:
     """
     # This helper function contacts the API using a web address (URL)
     and returns the result as structured data (in JSON format) or file content (binary)
+    If a session is passed, its pooled (keep-alive) connections are reused instead of opening a new one
     """
-    return requests.get(url).json() if return_type == "json" else requests.get(url).content
+    response = (session or requests).get(url)
+    return response.json() if return_type == "json" else response.content
 
 
 def calc_offset_incr(a: int, b: int) -> int:
@@ -1,13 +1,20 @@
+import os
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from .helpers import get_response, calc_offset_incr
+from ..http_utils import create_session, RateLimiter, request_with_retry
 from tqdm import tqdm
-from typing import Optional, List
+from typing import Optional, List, Dict, Tuple
 
-def extract_all_docs_data(years_to_keep:Optional[list]=None) -> List[dict]:
+BASE_API_URL = 'https://api.sejm.gov.pl/eli/acts'
+
+def extract_all_docs_data(years_to_keep:Optional[list]=None, base_api_url: str = BASE_API_URL) -> List[dict]:
     """
     Gets all years for which documents are available, loops through them from each year extracts all documents info.
     Allows for optional years filter - extract only docs information from years specified in years_to_keep
     """
-    years = get_response('https://api.sejm.gov.pl/eli/acts/DU')['years']
+    years = get_response(f'{base_api_url}/DU')['years']
     if years_to_keep:
         years = [year for year in years if year in years_to_keep]
 
@@ -15,19 +22,122 @@ def extract_all_docs_data(years_to_keep:Optional[list]=None) -> List[dict]:
 
     #tqdm adds progress bar
     for year in tqdm(years, desc="Processing years"):
-        acts_count = get_response(f'https://api.sejm.gov.pl/eli/acts/DU/{year}')['count']
+        acts_count = get_response(f'{base_api_url}/DU/{year}')['count']
         limit = 500 # max number of concurrent documents to extract
         num_of_repeats = calc_offset_incr(acts_count, limit)
 
         for rep_num in tqdm(range(num_of_repeats), desc=f"Year {year}", leave=False):
             offset = limit * rep_num
             docs_response = get_response(
-                f'https://api.sejm.gov.pl/eli/acts/search?limit={limit}&offset={offset}&publisher=DU&year={year}'
+                f'{base_api_url}/search?limit={limit}&offset={offset}&publisher=DU&year={year}'
             )
             docs_info.extend(docs_response['items'])
 
     return docs_info
 
+
+def _load_checkpoint(checkpoint_path: Optional[str]) -> Tuple[Dict[int, int], Dict[Tuple[int, int], List[dict]]]:
+    """
+    Reads a checkpoint file written by harvest_all_docs_data.
+    Every line is either {"year": ..., "count": ...} or {"year": ..., "offset": ..., "items": [...]}.
+    A half-written last line (e.g. after a crash) is ignored.
+    """
+    counts, pages = {}, {}
+    if not checkpoint_path or not os.path.exists(checkpoint_path):
+        return counts, pages
+    with open(checkpoint_path, 'r', encoding='utf-8') as f:
+        content = f.read()
+    # make sure new records don't get glued to a half-written last line
+    if content and not content.endswith('\n'):
+        with open(checkpoint_path, 'a', encoding='utf-8') as f:
+            f.write('\n')
+    for line in content.splitlines():
+        try:
+            record = json.loads(line)
+        except json.JSONDecodeError:
+            continue
+        if 'items' in record:
+            pages[(record['year'], record['offset'])] = record['items']
+        else:
+            counts[record['year']] = record['count']
+    return counts, pages
+
+
+def harvest_all_docs_data(years_to_keep: Optional[list] = None,
+                          checkpoint_path: Optional[str] = None,
+                          max_workers: int = 8,
+                          requests_per_second: Optional[float] = 10,
+                          retries: int = 3,
+                          base_api_url: str = BASE_API_URL) -> List[dict]:
+    """
+    Concurrent version of extract_all_docs_data - returns the same list of documents info.
+    Pages (500 documents each) are downloaded by max_workers threads sharing one pooled session,
+    at most requests_per_second requests are sent and failed requests are retried with exponential backoff.
+    If checkpoint_path is given, every finished page is saved there, so an interrupted run
+    continues from where it stopped instead of starting from scratch.
+    base_api_url can be changed e.g. to point at a local stub server for benchmarking.
+    """
+    session = create_session(max_workers)
+    limiter = RateLimiter(requests_per_second)
+    counts, pages = _load_checkpoint(checkpoint_path)
+    limit = 500 # max number of documents returned by one search request
+    lock = threading.Lock()
+    checkpoint = open(checkpoint_path, 'a', encoding='utf-8') if checkpoint_path else None
+
+    def fetch(url: str) -> dict:
+        return request_with_retry(session, 'GET', url, retries=retries, rate_limiter=limiter).json()
+
+    def save(record: dict) -> None:
+        # one line per finished request, flushed right away so a crash doesn't lose it
+        if checkpoint is None:
+            return
+        with lock:
+            checkpoint.write(json.dumps(record, ensure_ascii=False) + '\n')
+            checkpoint.flush()
+
+    def fetch_count(year: int) -> Tuple[int, int]:
+        count = fetch(f'{base_api_url}/DU/{year}')['count']
+        save({'year': year, 'count': count})
+        return year, count
+
+    def fetch_page(year: int, offset: int) -> Tuple[Tuple[int, int], List[dict]]:
+        items = fetch(f'{base_api_url}/search?limit={limit}&offset={offset}&publisher=DU&year={year}')['items']
+        save({'year': year, 'offset': offset, 'items': items})
+        return (year, offset), items
+
+    try:
+        years = fetch(f'{base_api_url}/DU')['years']
+        if years_to_keep:
+            years = [year for year in years if year in years_to_keep]
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            # Step 1: number of documents in every year (skip the ones we already know from the checkpoint)
+            futures = [executor.submit(fetch_count, year) for year in years if year not in counts]
+            for future in tqdm(as_completed(futures), total=len(futures), desc="Counting documents"):
+                year, count = future.result()
+                counts[year] = count
+
+            # Step 2: all pages that are still missing
+            missing = [(year, limit * rep_num) for year in years
+                       for rep_num in range(calc_offset_incr(counts[year], limit))
+                       if (year, limit * rep_num) not in pages]
+            futures = [executor.submit(fetch_page, year, offset) for year, offset in missing]
+            for future in tqdm(as_completed(futures), total=len(futures), desc="Downloading pages"):
+                key, items = future.result()
+                pages[key] = items
+    finally:
+        if checkpoint is not None:
+            checkpoint.close()
+        session.close()
+
+    # put pages back in the same order as extract_all_docs_data returns them
+    docs_info = []
+    for year in years:
+        for rep_num in range(calc_offset_incr(counts[year], limit)):
+            docs_info.extend(pages[(year, limit * rep_num)])
+    return docs_info
+
+
 def filter_out_results(in_data: List[dict], filters:Optional[dict]=None) -> List[dict]:
     """
     Function to filter out documents matching given criteria. Criteria are defined by filters
@@ -0,0 +1,78 @@
+import json
+import sqlite3
+from typing import List, Tuple, Iterable
+
+
+class ActManifest:
+    """
+    Local SQLite store with the metadata of every act we have already processed, keyed by (year, pos).
+    It remembers changeDate and announcementDate of each act, so a new listing from the API can be compared
+    with it to find acts which are new or were changed since the last run.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        self.conn.execute(
+            """CREATE TABLE IF NOT EXISTS acts (
+                   year INTEGER NOT NULL,
+                   pos INTEGER NOT NULL,
+                   change_date TEXT,
+                   announcement_date TEXT,
+                   metadata TEXT NOT NULL,
+                   PRIMARY KEY (year, pos)
+               )"""
+        )
+        self.conn.commit()
+
+    def __len__(self) -> int:
+        return self.conn.execute("SELECT COUNT(*) FROM acts").fetchone()[0]
+
+    def get(self, year: int, pos: int):
+        """Returns stored metadata of an act or None if we don't know it."""
+        row = self.conn.execute("SELECT metadata FROM acts WHERE year = ? AND pos = ?", (year, pos)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def all(self) -> List[dict]:
+        return [json.loads(row[0]) for row in self.conn.execute("SELECT metadata FROM acts ORDER BY year, pos")]
+
+    def diff(self, docs: List[dict]) -> Tuple[List[dict], List[dict], List[dict]]:
+        """
+        Compares a fresh listing of documents with the manifest.
+        Returns three lists: new acts, changed acts (different changeDate or announcementDate)
+        and removed acts - the ones we know from the years present in docs which are not in the listing anymore.
+        """
+        known = {
+            (year, pos): (change_date, announcement_date, metadata)
+            for year, pos, change_date, announcement_date, metadata in self.conn.execute(
+                "SELECT year, pos, change_date, announcement_date, metadata FROM acts")
+        }
+        new, changed = [], []
+        seen = set()
+        for doc in docs:
+            key = (doc['year'], doc['pos'])
+            seen.add(key)
+            if key not in known:
+                new.append(doc)
+            elif known[key][:2] != (doc.get('changeDate'), doc.get('announcementDate')):
+                changed.append(doc)
+
+        years = {doc['year'] for doc in docs}
+        removed = [json.loads(value[2]) for key, value in known.items() if key[0] in years and key not in seen]
+        return new, changed, removed
+
+    def update(self, docs: Iterable[dict]) -> None:
+        """Inserts new acts or overwrites the stored version of the existing ones."""
+        self.conn.executemany(
+            "INSERT OR REPLACE INTO acts (year, pos, change_date, announcement_date, metadata) VALUES (?, ?, ?, ?, ?)",
+            [(doc['year'], doc['pos'], doc.get('changeDate'), doc.get('announcementDate'),
+              json.dumps(doc, ensure_ascii=False)) for doc in docs]
+        )
+        self.conn.commit()
+
+    def remove(self, docs: Iterable[dict]) -> None:
+        self.conn.executemany("DELETE FROM acts WHERE year = ? AND pos = ?", [(doc['year'], doc['pos']) for doc in docs])
+        self.conn.commit()
+
+    def close(self) -> None:
+        self.conn.close()
@@ -1,4 +1,8 @@
+import re
+import hashlib
+import weakref
 import numpy as np
+from typing import Dict, List, Optional, Tuple
 
 def prepare_chunks(data):
     chunks = []  # This will store the main content pieces
@@ -26,4 +30,88 @@ def get_context_chunks(chunks, titles, indices):
             "title": current_title,
         })
 
-    return all_chunks  # Return list of documents with their context
\ No newline at end of file
+    return all_chunks  # Return list of documents with their context
+
+# end of a sentence: ".", "!", "?" or ";" followed by a space and a capital letter ("Art. 5" is not split)
+SENTENCE_END_PATTERN = re.compile(r'(?<=[.!?;])\s+(?=[A-ZĄĆĘŁŃÓŚŹŻ])')
+# the part of the prompt added for every document besides its title and content (see build_prompt)
+DOCUMENT_TEMPLATE = "Document {number} - TITLE: {title}\nContent: {chunk}\n"
+
+
+class TokenCounter:
+    """
+    Counts tokens of texts with the tokenizer of the model, remembering counts of texts seen before
+    (the same chunks are found for many questions). At most max_entries counts are kept.
+    counts - optional dict of counts to start from (and fill), e.g. shared by counters of one tokenizer.
+    """
+
+    def __init__(self, tokenizer, max_entries: int = 100_000, counts: Optional[Dict[bytes, int]] = None):
+        self.tokenizer = tokenizer
+        self.max_entries = max_entries
+        self.counts: Dict[bytes, int] = {} if counts is None else counts
+
+    def __call__(self, text: str) -> int:
+        key = hashlib.blake2b(text.encode('utf-8'), digest_size=16).digest()
+        count = self.counts.get(key)
+        if count is None:
+            count = len(self.tokenizer(text, add_special_tokens=False)['input_ids'])
+            if len(self.counts) >= self.max_entries:
+                self.counts.clear()
+            self.counts[key] = count
+        return count
+
+
+# counts of every tokenizer, so they are kept between questions (and forgotten together with the tokenizer)
+_counts = weakref.WeakKeyDictionary()
+
+
+def get_token_counter(tokenizer) -> TokenCounter:
+    """A counter of the tokenizer which shares counts with all counters returned for it before."""
+    # only the counts are kept here - a counter refers to its tokenizer, which would keep it alive forever
+    return TokenCounter(tokenizer, counts=_counts.setdefault(tokenizer, {}))
+
+
+def _trim_to_sentences(text: str, max_tokens: int, count: TokenCounter) -> str:
+    """The longest beginning of text made of whole sentences which has at most max_tokens tokens."""
+    kept = []
+    used = 0
+    for sentence in SENTENCE_END_PATTERN.split(text):
+        tokens = count(sentence + ' ')
+        if used + tokens > max_tokens:
+            break
+        kept.append(sentence)
+        used += tokens
+    return ' '.join(kept)
+
+
+def pack_context(context_chunks: List[dict], tokenizer, max_tokens: int = 1024) -> Tuple[List[dict], int]:
+    """
+    Fits the found chunks (best first, like Retriever returns them) into max_tokens tokens of the prompt.
+    - Chunks of the same act are merged into one document, so its title is written only once.
+    - Chunks are taken in order as long as they fit. The first one which doesn't fit is cut at the end of a sentence
+      and the rest is skipped, so the size of the prompt (and the time of generation) doesn't depend on chunk lengths.
+    Returns documents in the format of get_context_chunks and the number of tokens they use in the prompt.
+    """
+    count = get_token_counter(tokenizer)
+    documents: Dict[str, dict] = {}  # title -> document, in order of their best chunk
+    used = 0
+    for chunk_set in context_chunks:
+        title, text = chunk_set['title'], chunk_set['chunk']
+        document = documents.get(title)
+        # a new document costs its title and the template as well
+        overhead = 0 if document else count(DOCUMENT_TEMPLATE.format(number=len(documents) + 1, title=title, chunk=''))
+        tokens = count(text + '\n')
+        fits = used + overhead + tokens <= max_tokens
+        if not fits:
+            text = _trim_to_sentences(text, max_tokens - used - overhead, count)
+            if not text:
+                break
+            tokens = count(text + '\n')
+        used += overhead + tokens
+        if document:
+            document['chunk'] += '\n' + text
+        else:
+            documents[title] = {"chunk": text, "title": title}
+        if not fits:
+            break
+    return list(documents.values()), used
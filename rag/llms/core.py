@@ -1,48 +1,151 @@
-from .context import get_context_chunks, prepare_chunks
-from typing import List, Optional
+from .context import get_context_chunks, prepare_chunks, pack_context
+from ..vectors.retriever import Retriever
+from .query_cache import QueryCache
+from .prefix_cache import PrefixCache
+import time
+from contextlib import contextmanager
+from typing import Iterator, List, Optional
 from transformers import pipeline
 from sentence_transformers import SentenceTransformer
 import faiss
 
-def generate( query: str, context_chunks: List[str], qa_pipeline: pipeline, generation_params: Optional[dict] = None,
-              sys_prompt: str = "Use the following context to answer the question. Return only the answer and the title of the document the answer comes from. Nothing more.") -> str:
-    """
-    Function to generate an answer from a model.
-    Default model - gemma2 always returns context in the answer so we don't need to do anything to retrieve it back.
-    generation_params specifies additional parameters for generation (see transformers.pipeline docs)
-    """
-    # Start building a prompt (input text) to send to the AI model
-    context = ""
-    # Add each document with its title and content
-    for i, chunk_set in enumerate(context_chunks):
-        context += f"Document {i+1} - TITLE: {chunk_set['title']}\n"
-        context += f"Content: {chunk_set['chunk']}\n"
-    #Use the following context to answer the question. Return only the answer and the title of the document the answer comes from. Nothing more.
-    prompt = f"""{sys_prompt}
+# default instruction given to the model before the context
+SYS_PROMPT = "Use the following context to answer the question. Return only the answer and the title of the document the answer comes from. Nothing more."
+
+
+def prompt_prefix(sys_prompt: str = SYS_PROMPT) -> str:
+    """Beginning of every prompt built by build_prompt - the same for all questions (see PrefixCache)."""
+    return f"""{sys_prompt}
 
     Context:
-    {context}
+    """
+
+
+def build_prompt(query: str, context_chunks: List[dict], sys_prompt: str = SYS_PROMPT) -> str:
+    """Builds the prompt (input text) sent to the model from the question and the found chunks."""
+    # Add each document with its title and content
+    context = "".join(f"Document {i+1} - TITLE: {chunk_set['title']}\nContent: {chunk_set['chunk']}\n"
+                      for i, chunk_set in enumerate(context_chunks))
+    return prompt_prefix(sys_prompt) + f"""{context}
 
     Question:
     {query}
 
     Answer:"""
 
+
+def generate( query: str, context_chunks: List[str], qa_pipeline: pipeline, generation_params: Optional[dict] = None,
+              sys_prompt: str = SYS_PROMPT, cache: Optional[QueryCache] = None,
+              max_context_tokens: Optional[int] = None, prefix_cache: Optional[PrefixCache] = None,
+              stats: Optional[dict] = None) -> str:
+    """
+    Function to generate an answer from a model.
+    Default model - gemma2 always returns context in the answer so we don't need to do anything to retrieve it back.
+    generation_params specifies additional parameters for generation (see transformers.pipeline docs)
+    cache - optional QueryCache, an answer to the same prompt with the same parameters is taken from it.
+    max_context_tokens - if given, the chunks are packed into that many tokens first (see pack_context).
+    prefix_cache - optional PrefixCache, the fixed beginning of the prompt isn't run through the model again.
+    stats - optional dict, filled by the prefix cache with tokens of the prompt and prefill time saved.
+    """
+    if max_context_tokens is not None:
+        context_chunks = pack_context(context_chunks, qa_pipeline.tokenizer, max_context_tokens)[0]
+    # Start building a prompt (input text) to send to the AI model
+    prompt = build_prompt(query, context_chunks, sys_prompt)
+    if cache is not None:
+        key = cache.answer_key(prompt, generation_params)
+        answer = cache.answers.get(key)
+        if answer is not None:
+            return answer
+
     try:
         # check if generation_params is empty, then we need to convert it to empty dict
         generation_params = generation_params or {}
         # unpack optional parameters to use for text generation
-        return qa_pipeline(prompt, **generation_params)[0]["generated_text"]
+        if prefix_cache is not None:
+            answer = prefix_cache.generate(qa_pipeline, prompt_prefix(sys_prompt), prompt, generation_params, stats)
+        else:
+            answer = qa_pipeline(prompt, **generation_params)[0]["generated_text"]
+        if cache is not None:
+            cache.answers.put(key, answer)
+        return answer
 
     except Exception as e:
         # If something goes wrong , show the error
         return f"Error generating response: {str(e)}"
 
 
-def rag_search(query: str, index:faiss.IndexFlatL2, data:dict, embedding_model: SentenceTransformer, qa_pipeline:pipeline, k: int=3, params=None) -> str:
+@contextmanager
+def prepare_for_batching(qa_pipeline: pipeline) -> Iterator[None]:
+    """
+    Prompts of one batch have different lengths, so they are padded - on the left side, because a decoder-only
+    model continues the text from its last token. Models without a padding token use the end-of-text token.
+    The previous settings of the tokenizer and the model are restored when the block ends.
+    """
+    tokenizer, generation_config = qa_pipeline.tokenizer, qa_pipeline.model.generation_config
+    padding_side, pad_token, pad_token_id = tokenizer.padding_side, tokenizer.pad_token, generation_config.pad_token_id
+    tokenizer.padding_side = "left"
+    if pad_token is None:
+        tokenizer.pad_token = tokenizer.eos_token
+        generation_config.pad_token_id = tokenizer.eos_token_id
+    try:
+        yield
+    finally:
+        tokenizer.padding_side = padding_side
+        if pad_token is None:
+            tokenizer.pad_token = None
+            generation_config.pad_token_id = pad_token_id
+
+
+def generate_batch(queries: List[str], context_chunks: List[List[dict]], qa_pipeline: pipeline,
+                   generation_params: Optional[dict] = None, sys_prompt: str = SYS_PROMPT,
+                   batch_size: int = 8, cache: Optional[QueryCache] = None, raise_errors: bool = False) -> List[str]:
+    """
+    Generates answers to many questions at once, batch_size prompts in every forward pass of the model.
+    context_chunks - found chunks of every question. Returns answers in the same order as queries.
+    cache - optional QueryCache, only prompts without a cached answer go to the model.
+    raise_errors - raise the exception of a failed generation instead of returning an error message as every answer.
+    """
+    prompts = [build_prompt(query, chunks, sys_prompt) for query, chunks in zip(queries, context_chunks)]
+    answers = [None] * len(prompts)
+    keys = [None] * len(prompts)
+    if cache is not None:
+        keys = [cache.answer_key(prompt, generation_params) for prompt in prompts]
+        answers = [cache.answers.get(key) for key in keys]
+    todo = [i for i, answer in enumerate(answers) if answer is None]
+    if not todo:
+        return answers
+    try:
+        with prepare_for_batching(qa_pipeline):
+            outputs = qa_pipeline([prompts[i] for i in todo], batch_size=batch_size, **(generation_params or {}))
+    except Exception as e:
+        if raise_errors:
+            raise
+        # If something goes wrong , show the error for every question of the batch
+        return [answer if answer is not None else f"Error generating response: {str(e)}" for answer in answers]
+    for i, output in zip(todo, outputs):
+        answers[i] = output[0]["generated_text"]
+        if cache is not None:
+            cache.answers.put(keys[i], answers[i])
+    return answers
+
+
+def rag_search(query: str, index:faiss.IndexFlatL2, data:dict, embedding_model: SentenceTransformer, qa_pipeline:pipeline, k: int=3, params=None,
+               retriever: Optional[Retriever] = None, cache: Optional[QueryCache] = None,
+               max_context_tokens: Optional[int] = None, prefix_cache: Optional[PrefixCache] = None) -> str:
     """
     Main function to do RAG (Retrieval-Augmented Generation). K parameter specifies numbers of context chunks to use
+    A Retriever built once for the corpus can be passed instead of index, data and embedding_model (they can be None then),
+    so the corpus isn't walked again for every question.
+    cache - optional QueryCache for generated answers (give it to the Retriever as well to cache embeddings and search results).
+    max_context_tokens - optional limit of tokens of the found chunks in the prompt (see pack_context).
+    prefix_cache - optional PrefixCache for keys and values of the beginning of the prompt, which is the same every time.
     """
+    if retriever is not None:
+        # Steps 1-4 done by the retriever, with everything that depends only on the corpus prepared earlier
+        context_chunks = retriever.search(query, k)
+        return generate(query, context_chunks, qa_pipeline, params, cache=cache, max_context_tokens=max_context_tokens,
+                        prefix_cache=prefix_cache)
+
     # Step 1: Break data into chunks and get titles
     chunks, titles = prepare_chunks(data)
 
@@ -59,8 +162,46 @@ def rag_search(query: str, index:faiss.IndexFlatL2, data:dict, embedding_model:
     # Step 4: Add surrounding context to each matched chunk
     context_chunks = get_context_chunks(chunks, titles, I)
 
-    response = generate(query, context_chunks, qa_pipeline, params)
+    response = generate(query, context_chunks, qa_pipeline, params, cache=cache, max_context_tokens=max_context_tokens,
+                        prefix_cache=prefix_cache)
     return response # Return the AI's answer
 
 
-
+def rag_search_batch(queries: List[str], retriever: Retriever, qa_pipeline: pipeline, k: int = 3, params=None,
+                     batch_size: int = 8, sys_prompt: str = SYS_PROMPT, cache: Optional[QueryCache] = None,
+                     max_context_tokens: Optional[int] = None) -> List[dict]:
+    """
+    RAG for many questions at once (e.g. an evaluation set): all questions are embedded and searched in one call,
+    then answers are generated batch_size questions at a time (questions with similar prompt lengths together).
+    Returns a dict for every question, in the same order:
+    - answer,
+    - retrieval_ms: time of retrieval of the whole list (shared by all questions),
+    - generation_ms: time of generation of the batch the question was in,
+    - latency_ms: time from the start until its answer was ready,
+    - context_tokens: tokens of the found chunks in the prompt (only with max_context_tokens).
+    cache - optional QueryCache for generated answers.
+    max_context_tokens - optional limit of tokens of the found chunks in every prompt (see pack_context).
+    """
+    start = time.perf_counter()
+    context_chunks = retriever.search_batch(queries, k)
+    retrieval_ms = (time.perf_counter() - start) * 1000
+    context_tokens = [None] * len(queries)
+    if max_context_tokens is not None:
+        packed = [pack_context(chunks, qa_pipeline.tokenizer, max_context_tokens) for chunks in context_chunks]
+        context_chunks = [chunks for chunks, _ in packed]
+        context_tokens = [tokens for _, tokens in packed]
+
+    # questions with prompts of similar length go into the same batch, so little padding is needed
+    order = sorted(range(len(queries)),
+                   key=lambda i: len(queries[i]) + sum(len(c['chunk']) + len(c['title']) for c in context_chunks[i]))
+    results = [None] * len(queries)
+    for batch_start in range(0, len(order), batch_size):
+        batch = order[batch_start:batch_start + batch_size]
+        generation_start = time.perf_counter()
+        answers = generate_batch([queries[i] for i in batch], [context_chunks[i] for i in batch], qa_pipeline,
+                                 params, sys_prompt, batch_size, cache)
+        done = time.perf_counter()
+        for i, answer in zip(batch, answers):
+            results[i] = {'answer': answer, 'retrieval_ms': retrieval_ms, 'generation_ms': (done - generation_start) * 1000,
+                          'latency_ms': (done - start) * 1000, 'context_tokens': context_tokens[i]}
+    return results
@@ -0,0 +1,104 @@
+"""
+Every prompt starts with the same text - sys_prompt and "Context:" (see prompt_prefix). The model computes the same
+keys and values for it in every request. PrefixCache computes them once per model and sys_prompt and every
+request starts from a copy, so only the found chunks and the question are run through the model before generation.
+"""
+import copy
+import time
+import threading
+import weakref
+from typing import Optional, Tuple
+import torch
+from transformers import pipeline
+
+# parameters of the text-generation pipeline which model.generate doesn't accept
+PIPELINE_ONLY_PARAMS = ('return_full_text', 'clean_up_tokenization_spaces', 'prefix', 'handle_long_generation')
+
+
+class PrefixCache:
+    """
+    past_key_values of the fixed beginning of prompts, one entry per model (kept as long as the model is).
+    The entry is computed again when a prompt with a different prefix (a changed sys_prompt) is asked for,
+    so answers never use keys and values of an old prompt.
+    Safe to use from many threads.
+    """
+
+    def __init__(self):
+        self.entries = weakref.WeakKeyDictionary()  # model -> {'prefix', 'ids', 'cache', 'prefill_ms'}
+        self.lock = threading.Lock()
+        self.hits = self.misses = 0
+
+    def get(self, model, tokenizer, prefix: str) -> dict:
+        """The entry for the model and the prefix text, computed if needed."""
+        with self.lock:
+            entry = self.entries.get(model)
+            if entry is not None and entry['prefix'] == prefix:
+                return entry
+            ids = tokenizer(prefix, return_tensors="pt").input_ids.to(model.device)
+            start = time.perf_counter()
+            with torch.no_grad():
+                cache = model(input_ids=ids, use_cache=True).past_key_values
+            entry = {'prefix': prefix, 'ids': ids[0], 'cache': cache, 'prefill_ms': (time.perf_counter() - start) * 1000}
+            self.entries[model] = entry
+            return entry
+
+    def prepare(self, model, tokenizer, prefix: str, prompt: str,
+                stats: Optional[dict] = None) -> Tuple[torch.Tensor, torch.Tensor, Optional[object]]:
+        """
+        Tokenizes the prompt and returns input_ids, attention_mask and a copy of the cached past_key_values
+        to pass to model.generate (None if the prompt doesn't start with the cached tokens).
+        A token at the end of the prefix can merge with the text after it, so only the tokens which are
+        the same in the prompt are reused.
+        stats - optional dict, filled with prompt_tokens, cached_tokens, prefill_saved_ms_est and cache_copy_ms.
+        prefill_saved_ms_est is an estimate, not a measurement of this request: the time the prefix took when it
+        was computed for the cache, scaled to the number of reused tokens.
+        """
+        inputs = tokenizer(prompt, return_tensors="pt").to(model.device)
+        input_ids = inputs.input_ids
+        entry = self.get(model, tokenizer, prefix)
+        prefix_ids = entry['ids']
+        # at least one token of the prompt has to go through the model
+        n = min(len(prefix_ids), input_ids.shape[1] - 1)
+        different = (input_ids[0, :n] != prefix_ids[:n]).nonzero()
+        cached = int(different[0]) if len(different) else n
+        start = time.perf_counter()
+        past_key_values = None
+        if cached > 0:
+            past_key_values = copy.deepcopy(entry['cache'])
+            if cached < len(prefix_ids):
+                # a negative value removes that many tokens from the end in all versions of transformers
+                # (a positive one meant the length to keep before 5.x and is deprecated since)
+                past_key_values.crop(cached - len(prefix_ids))
+        with self.lock:
+            if past_key_values is not None:
+                self.hits += 1
+            else:
+                self.misses += 1
+        if stats is not None:
+            stats.update({'prompt_tokens': input_ids.shape[1], 'cached_tokens': cached,
+                          'prefill_saved_ms_est': entry['prefill_ms'] * cached / len(prefix_ids),
+                          'cache_copy_ms': (time.perf_counter() - start) * 1000})
+        return input_ids, inputs.attention_mask, past_key_values
+
+    def generate(self, qa_pipeline: pipeline, prefix: str, prompt: str, generation_params: Optional[dict] = None,
+                 stats: Optional[dict] = None) -> str:
+        """
+        Generates the answer to the prompt like qa_pipeline(prompt, **generation_params)[0]["generated_text"],
+        starting from the cached prefix. The prompt is included in the answer unless return_full_text is False.
+        """
+        tokenizer, model = qa_pipeline.tokenizer, qa_pipeline.model
+        generation_params = dict(generation_params or {})
+        return_full_text = generation_params.get('return_full_text', True)
+        for name in PIPELINE_ONLY_PARAMS:
+            generation_params.pop(name, None)
+        input_ids, attention_mask, past_key_values = self.prepare(model, tokenizer, prefix, prompt, stats)
+        with torch.no_grad():
+            output = model.generate(input_ids=input_ids, attention_mask=attention_mask, past_key_values=past_key_values,
+                                    **generation_params)
+        answer = tokenizer.decode(output[0, input_ids.shape[1]:], skip_special_tokens=True)
+        return prompt + answer if return_full_text else answer
+
+    def stats(self) -> dict:
+        requests = self.hits + self.misses
+        return {'models': len(self.entries), 'hits': self.hits, 'misses': self.misses,
+                'hit_rate': self.hits / requests if requests else 0.0}
@@ -0,0 +1,103 @@
+import re
+import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Any, Optional
+
+WHITESPACE_PATTERN = re.compile(r'\s+')
+
+
+def normalise_query(query: str) -> str:
+    """The same question typed a bit differently ("What is  X?" / "what is x ?") gives the same key."""
+    return WHITESPACE_PATTERN.sub(' ', query).strip().lower().rstrip('?!. ')
+
+
+class LRUCache:
+    """
+    In-memory cache keeping at most max_entries recently used values, optionally only for ttl seconds.
+    Safe to use from many threads. Counts hits and misses.
+    """
+
+    def __init__(self, max_entries: int = 10000, ttl: Optional[float] = None):
+        self.max_entries, self.ttl = max_entries, ttl
+        self.entries = OrderedDict()  # key -> (time of saving, value)
+        self.lock = threading.Lock()
+        self.hits = self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def get(self, key) -> Optional[Any]:
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and self.ttl is not None and time.monotonic() - entry[0] > self.ttl:
+                del self.entries[key]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, value) -> None:
+        if self.max_entries <= 0:
+            return
+        with self.lock:
+            self.entries[key] = (time.monotonic(), value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self.lock:
+            self.entries.clear()
+
+    def stats(self) -> dict:
+        requests = self.hits + self.misses
+        return {'entries': len(self.entries), 'hits': self.hits, 'misses': self.misses,
+                'hit_rate': self.hits / requests if requests else 0.0}
+
+
+class QueryCache:
+    """
+    Caches for repeated questions, one for every stage of rag_search:
+    - embeddings: normalised question -> its embedding (skips the embedding model),
+    - retrievals: (question embedding, k, filters, index version) -> ids and scores of found chunks (skips the search),
+    - answers: (prompt, generation parameters) -> generated answer, kept for answer_ttl seconds (skips the LLM).
+    Pass it to Retriever for the first two and to rag_search / rag_search_batch for the answers.
+    Retrievals and answers are cleared when the retriever sees a new version of the index (see ChunkIndex.version).
+    A size of 0 turns a cache off.
+    """
+
+    def __init__(self, max_embeddings: int = 10000, max_retrievals: int = 10000, max_answers: int = 1000,
+                 answer_ttl: Optional[float] = 3600):
+        self.embeddings = LRUCache(max_embeddings)
+        self.retrievals = LRUCache(max_retrievals)
+        self.answers = LRUCache(max_answers, answer_ttl)
+        self.index_version = None
+
+    def check_index_version(self, version) -> None:
+        """Forgets retrievals and answers based on an older version of the index."""
+        if version != self.index_version:
+            if self.index_version is not None:
+                self.retrievals.clear()
+                self.answers.clear()
+            self.index_version = version
+
+    @staticmethod
+    def retrieval_key(embedding, k: int, filters: Optional[dict], index_version) -> tuple:
+        return (hashlib.sha256(embedding.tobytes()).hexdigest(), k,
+                json.dumps(filters or {}, sort_keys=True, default=str), index_version)
+
+    @staticmethod
+    def answer_key(prompt: str, generation_params: Optional[dict]) -> str:
+        params = json.dumps(generation_params or {}, sort_keys=True, default=str)
+        return hashlib.sha256(f'{prompt}\x00{params}'.encode('utf-8')).hexdigest()
+
+    def stats(self) -> dict:
+        """Number of entries, hits, misses and hit rate of every cache."""
+        return {'embeddings': self.embeddings.stats(), 'retrievals': self.retrievals.stats(),
+                'answers': self.answers.stats()}
@@ -0,0 +1,178 @@
+"""
+Answers returned piece by piece while the model is still generating them, so the user sees the beginning of the
+answer after the first token instead of after the last one. Every request can be cancelled and records
+time to the first token (TTFT), generated tokens per second and total latency.
+"""
+import time
+import asyncio
+import threading
+from typing import AsyncIterator, Iterator, List, Optional
+from transformers import pipeline, StoppingCriteria, StoppingCriteriaList, TextIteratorStreamer
+from .context import pack_context
+from .core import SYS_PROMPT, build_prompt, prompt_prefix
+from .prefix_cache import PrefixCache
+from ..vectors.retriever import Retriever
+
+
+class _CountingStreamer(TextIteratorStreamer):
+    """
+    TextIteratorStreamer which also counts generated tokens and remembers when the first one was generated
+    (text is passed on only at the end of a word, so the first piece of text may come a few tokens later).
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.generated_tokens = 0
+        self.first_token_time = None
+
+    def put(self, value) -> None:
+        if not (self.skip_prompt and self.next_tokens_are_prompt):
+            if self.first_token_time is None:
+                self.first_token_time = time.perf_counter()
+            self.generated_tokens += value.numel()
+        super().put(value)
+
+
+class _StopOnEvent(StoppingCriteria):
+    """Stops generation after the current token once the event is set."""
+
+    def __init__(self, event: threading.Event):
+        self.event = event
+
+    def __call__(self, input_ids, scores, **kwargs) -> bool:
+        return self.event.is_set()
+
+
+def stream_generate(query: str, context_chunks: List[dict], qa_pipeline: pipeline, generation_params: Optional[dict] = None,
+                    sys_prompt: str = SYS_PROMPT, max_context_tokens: Optional[int] = None,
+                    stop_event: Optional[threading.Event] = None, stats: Optional[dict] = None,
+                    prefix_cache: Optional[PrefixCache] = None) -> Iterator[str]:
+    """
+    Like generate, but yields pieces of the answer as soon as they are generated (without the prompt).
+    generation_params are passed to model.generate (e.g. max_new_tokens, do_sample, temperature).
+    stop_event - setting it stops generation after the current token. Generation is stopped as well
+    when the consumer stops iterating (e.g. the user left).
+    stats - optional dict, filled with ttft_ms, latency_ms, tokens, tokens_per_s and cancelled when generation ends.
+    prefix_cache - optional PrefixCache, the fixed beginning of the prompt isn't run through the model again
+    (stats get prompt_tokens, cached_tokens and prefill_saved_ms_est as well).
+    """
+    if max_context_tokens is not None:
+        context_chunks = pack_context(context_chunks, qa_pipeline.tokenizer, max_context_tokens)[0]
+    prompt = build_prompt(query, context_chunks, sys_prompt)
+    tokenizer, model = qa_pipeline.tokenizer, qa_pipeline.model
+    stop_event = stop_event or threading.Event()
+    streamer = _CountingStreamer(tokenizer, skip_prompt=True, skip_special_tokens=True)
+    start = time.perf_counter()
+    if prefix_cache is not None:
+        input_ids, attention_mask, past_key_values = prefix_cache.prepare(model, tokenizer, prompt_prefix(sys_prompt),
+                                                                          prompt, stats)
+        inputs = {'input_ids': input_ids, 'attention_mask': attention_mask, 'past_key_values': past_key_values}
+    else:
+        inputs = tokenizer(prompt, return_tensors="pt").to(model.device)
+    errors = []
+
+    def run() -> None:
+        try:
+            model.generate(**inputs, streamer=streamer, stopping_criteria=StoppingCriteriaList([_StopOnEvent(stop_event)]),
+                           **(generation_params or {}))
+        except Exception as e:
+            # the consumer would wait for the next piece forever, end the stream and pass the error on
+            errors.append(e)
+            streamer.end()
+
+    finished = False
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    try:
+        for piece in streamer:
+            if piece:
+                yield piece
+        finished = True
+    finally:
+        # the consumer may stop early - don't generate tokens nobody will read
+        cancelled = not finished or stop_event.is_set()
+        stop_event.set()
+        thread.join()
+        end = time.perf_counter()
+        if stats is not None:
+            first_token = streamer.first_token_time
+            generating = end - (first_token or end)
+            stats.update({'ttft_ms': (first_token - start) * 1000 if first_token else None,
+                          'latency_ms': (end - start) * 1000, 'tokens': streamer.generated_tokens,
+                          'tokens_per_s': streamer.generated_tokens / generating if generating > 0 else None,
+                          'cancelled': cancelled})
+    if errors:
+        raise errors[0]
+
+
+async def astream_generate(query: str, context_chunks: List[dict], qa_pipeline: pipeline,
+                           generation_params: Optional[dict] = None, sys_prompt: str = SYS_PROMPT,
+                           max_context_tokens: Optional[int] = None, stop_event: Optional[threading.Event] = None,
+                           stats: Optional[dict] = None, prefix_cache: Optional[PrefixCache] = None) -> AsyncIterator[str]:
+    """
+    stream_generate as an async iterator - the model runs in a separate thread and the event loop is never blocked.
+    Cancelling the task which iterates over it (or leaving the loop early) stops generation.
+    """
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue()
+    stop_event = stop_event or threading.Event()
+    done = object()
+
+    def put(item) -> bool:
+        """Passes item to the consumer, False if its event loop is closed already."""
+        try:
+            loop.call_soon_threadsafe(queue.put_nowait, item)
+            return True
+        except RuntimeError:
+            return False
+
+    def produce() -> None:
+        pieces = stream_generate(query, context_chunks, qa_pipeline, generation_params, sys_prompt,
+                                 max_context_tokens, stop_event, stats, prefix_cache)
+        try:
+            for piece in pieces:
+                if not put(piece):
+                    # nobody will read the rest of the answer
+                    break
+            else:
+                put(done)
+        except Exception as e:
+            put(e)
+        finally:
+            # stops generation if the loop above ended early
+            pieces.close()
+
+    threading.Thread(target=produce, daemon=True).start()
+    try:
+        while (piece := await queue.get()) is not done:
+            if isinstance(piece, Exception):
+                raise piece
+            yield piece
+    finally:
+        stop_event.set()
+
+
+def rag_search_stream(query: str, retriever: Retriever, qa_pipeline: pipeline, k: int = 3, params=None,
+                      max_context_tokens: Optional[int] = None, stop_event: Optional[threading.Event] = None,
+                      stats: Optional[dict] = None, prefix_cache: Optional[PrefixCache] = None) -> Iterator[str]:
+    """rag_search which yields the answer piece by piece (see stream_generate), stats get retrieval_ms as well."""
+    start = time.perf_counter()
+    context_chunks = retriever.search(query, k)
+    if stats is not None:
+        stats['retrieval_ms'] = (time.perf_counter() - start) * 1000
+    yield from stream_generate(query, context_chunks, qa_pipeline, params, SYS_PROMPT, max_context_tokens, stop_event, stats,
+                               prefix_cache)
+
+
+async def rag_search_astream(query: str, retriever: Retriever, qa_pipeline: pipeline, k: int = 3, params=None,
+                             max_context_tokens: Optional[int] = None, stop_event: Optional[threading.Event] = None,
+                             stats: Optional[dict] = None, prefix_cache: Optional[PrefixCache] = None) -> AsyncIterator[str]:
+    """rag_search as an async iterator of pieces of the answer (see astream_generate)."""
+    start = time.perf_counter()
+    # retrieval embeds the question with a model as well, so it runs in a thread too
+    context_chunks = await asyncio.get_running_loop().run_in_executor(None, retriever.search, query, k)
+    if stats is not None:
+        stats['retrieval_ms'] = (time.perf_counter() - start) * 1000
+    async for piece in astream_generate(query, context_chunks, qa_pipeline, params, SYS_PROMPT,
+                                        max_context_tokens, stop_event, stats, prefix_cache):
+        yield piece
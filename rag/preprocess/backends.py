@@ -0,0 +1,182 @@
+import requests
+from urllib.parse import quote
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional
+from .cache import TranslationCache
+from ..http_utils import create_session, RateLimiter, request_with_retry
+
+# URL for LibreTranslate API, if you're running it locally
+LIBRETRANSLATE_URL = "http://localhost:5000/translate"
+
+# Template for the Lingva API (translates from Polish to English)
+LINGVA_URL_TEMPLATE = "https://lingva.ml/api/v1/pl/en/{}"
+
+# Target language for translation
+TARGET_LANG = "en"
+
+
+class TranslationBackend:
+    """
+    Common interface of translation APIs.
+    translate_batch translates a list of texts and returns translations in the same order.
+    max_batch_size says how many texts the API accepts in one request.
+    All requests go through one pooled session, are rate limited and retried with backoff.
+    """
+    name = "base"
+    source = "auto"
+    target = TARGET_LANG
+    max_batch_size = 1
+
+    def __init__(self, pool_size: int = 10, requests_per_second: Optional[float] = None, retries: int = 3):
+        self.session = create_session(pool_size)
+        self.rate_limiter = RateLimiter(requests_per_second)
+        self.retries = retries
+
+    def _request(self, method: str, url: str, **kwargs) -> requests.Response:
+        return request_with_retry(self.session, method, url, retries=self.retries,
+                                  rate_limiter=self.rate_limiter, **kwargs)
+
+    def translate_batch(self, texts: List[str]) -> List[str]:
+        raise NotImplementedError
+
+
+class LibreTranslateBackend(TranslationBackend):
+    """
+    LibreTranslate accepts a list of texts in "q", so many chunks can be sent in one request.
+    """
+    name = "libre"
+    source = "auto"
+    max_batch_size = 100
+
+    def __init__(self, url: str = LIBRETRANSLATE_URL, **kwargs):
+        super().__init__(**kwargs)
+        self.url = url
+
+    def translate_batch(self, texts: List[str]) -> List[str]:
+        response = self._request(
+            'POST',
+            self.url,
+            json={
+                "q": texts,
+                "source": self.source,
+                "target": self.target,
+                "format": "text",
+                "alternatives": 1,
+                "api_key": ""  # No API key needed by default
+            },
+            headers={"Content-Type": "application/json"}
+        )
+        translations = response.json().get("translatedText", [])
+        # a single string is returned if only one text was sent
+        return [translations] if isinstance(translations, str) else translations
+
+
+class LingvaBackend(TranslationBackend):
+    """
+    Lingva translates one text per request (the text is a part of the URL).
+    """
+    name = "lingva"
+    source = "pl"
+    max_batch_size = 1
+
+    def __init__(self, url_template: str = LINGVA_URL_TEMPLATE, **kwargs):
+        super().__init__(**kwargs)
+        self.url_template = url_template
+
+    def translate_batch(self, texts: List[str]) -> List[str]:
+        return [
+            self._request('GET', self.url_template.format(quote(text))).json().get("translation", "")  # Safely encode the text
+            for text in texts
+        ]
+
+
+def get_backend(engine: str, **kwargs) -> TranslationBackend:
+    """
+    Returns a backend for the engine name used in the rest of the package ("Lingva" or "LibreTranslate").
+    """
+    if engine.lower() == "lingva":
+        return LingvaBackend(**kwargs)
+    return LibreTranslateBackend(**kwargs)
+
+
+# One backend (with its pooled session) per engine, created when it's needed for the first time
+_shared_backends = {}
+
+
+def shared_backend(engine: str) -> TranslationBackend:
+    """
+    The backend of the engine with default settings, the same object in every call,
+    so all callers reuse one pooled session instead of opening new connections.
+    """
+    name = "lingva" if engine.lower() == "lingva" else "libre"
+    if name not in _shared_backends:
+        _shared_backends[name] = get_backend(name)
+    return _shared_backends[name]
+
+
+class BatchTranslator:
+    """
+    Translates many texts at once:
+    1. repeated texts and texts already in the (optional) cache are translated only once / not at all,
+    2. remaining texts are packed into requests of at most max_chars characters (and max_batch_size texts),
+    3. up to max_workers requests are sent at the same time,
+    4. translations are put back in the original order.
+    If a request fails, its texts get an empty translation (the same as translate_text does).
+    """
+
+    def __init__(self, backend: TranslationBackend, max_chars: int = 5000, max_workers: int = 4,
+                 cache: Optional[TranslationCache] = None):
+        self.backend = backend
+        self.max_chars = max_chars
+        self.max_workers = max_workers
+        self.cache = cache
+
+    def _key(self, text: str) -> str:
+        return self.cache.make_key(text, self.backend.name, self.backend.source, self.backend.target)
+
+    def _pack(self, texts: List[str]) -> List[List[str]]:
+        batches, batch, size = [], [], 0
+        for text in texts:
+            # start a new request when this text would not fit into the current one
+            if batch and (size + len(text) > self.max_chars or len(batch) >= self.backend.max_batch_size):
+                batches.append(batch)
+                batch, size = [], 0
+            batch.append(text)
+            size += len(text)
+        if batch:
+            batches.append(batch)
+        return batches
+
+    def _translate_batch(self, batch: List[str]) -> List[str]:
+        try:
+            translations = self.backend.translate_batch(batch)
+            if len(translations) != len(batch):
+                raise ValueError(f"expected {len(batch)} translations, got {len(translations)}")
+            return translations
+        except Exception as e:
+            print(f"{self.backend.name} error: {e}")
+            return [""] * len(batch)
+
+    def translate(self, texts: List[str]) -> List[str]:
+        translated = {"": ""}
+        to_translate = []
+        for text in dict.fromkeys(texts):  # unique texts, original order
+            if not text.strip():
+                translated[text] = ""
+                continue
+            cached = self.cache.get(self._key(text)) if self.cache is not None else None
+            if cached is None:
+                to_translate.append(text)
+            else:
+                translated[text] = cached
+
+        batches = self._pack(to_translate)
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            for batch, translations in zip(batches, executor.map(self._translate_batch, batches)):
+                for text, translation in zip(batch, translations):
+                    translated[text] = translation
+                    # empty result means the request failed, don't remember it
+                    if translation and self.cache is not None:
+                        self.cache.put(self._key(text), translation)
+
+        return [translated[text] for text in texts]
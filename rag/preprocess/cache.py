@@ -0,0 +1,119 @@
+import time
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+
+class TranslationCache:
+    """
+    On-disk (SQLite) cache of translations.
+    Entries are keyed by a hash of engine, source language, target language and the text itself,
+    so the same text is translated only once - in this run and in all the following ones.
+    When there are more than max_entries translations, the least recently used ones are removed
+    (10% at once, so we don't clean up after every single insert).
+    hits and misses count how many translations were found in the cache and how many were not.
+    Times of last use are kept in memory and written together - every flush_every hits, on put and on close.
+    """
+
+    def __init__(self, path: str, max_entries: Optional[int] = 1_000_000, memory_entries: int = 10_000,
+                 flush_every: int = 1000):
+        self.path = path
+        self.max_entries = max_entries
+        self.memory_entries = memory_entries
+        self.flush_every = flush_every
+        self.hits = 0
+        self.misses = 0
+        # recently used translations, so texts repeated in this run don't even touch the database
+        self._memory = OrderedDict()
+        # key -> time of last use, not written to the database yet
+        self._used = {}
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute(
+            """CREATE TABLE IF NOT EXISTS translations (
+                   key TEXT PRIMARY KEY,
+                   translation TEXT NOT NULL,
+                   last_used REAL NOT NULL
+               )"""
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS translations_last_used ON translations (last_used)")
+        self.conn.commit()
+        self._count = self.conn.execute("SELECT COUNT(*) FROM translations").fetchone()[0]
+
+    def _remember(self, key: str, translation: str) -> None:
+        self._memory[key] = translation
+        self._memory.move_to_end(key)
+        if len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    @staticmethod
+    def make_key(text: str, engine: str, source: str, target: str) -> str:
+        return hashlib.sha256('\0'.join((engine.lower(), source, target, text)).encode('utf-8')).hexdigest()
+
+    def _flush_used(self) -> None:
+        """Writes buffered times of last use (the caller holds the lock and commits)."""
+        if self._used:
+            self.conn.executemany("UPDATE translations SET last_used = ? WHERE key = ?",
+                                  [(used, key) for key, used in self._used.items()])
+            self._used.clear()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                translation = self._memory[key]
+            else:
+                row = self.conn.execute("SELECT translation FROM translations WHERE key = ?", (key,)).fetchone()
+                if row is None:
+                    self.misses += 1
+                    return None
+                translation = row[0]
+                self._remember(key, translation)
+            self.hits += 1
+            self._used[key] = time.time()
+            if len(self._used) >= self.flush_every:
+                self._flush_used()
+                self.conn.commit()
+            return translation
+
+    def put(self, key: str, translation: str) -> None:
+        with self._lock:
+            self._remember(key, translation)
+            now = time.time()
+            self._used.pop(key, None)
+            # so the least recently used translations are removed below, not the ones just read
+            self._flush_used()
+            inserted = self.conn.execute("INSERT OR IGNORE INTO translations (key, translation, last_used) VALUES (?, ?, ?)",
+                                         (key, translation, now)).rowcount
+            if inserted:
+                self._count += 1
+            else:
+                self.conn.execute("UPDATE translations SET translation = ?, last_used = ? WHERE key = ?",
+                                  (translation, now, key))
+            if self.max_entries and self._count > self.max_entries:
+                # remove the least recently used translations
+                to_remove = self._count - int(self.max_entries * 0.9)
+                self.conn.execute(
+                    "DELETE FROM translations WHERE key IN (SELECT key FROM translations ORDER BY last_used LIMIT ?)",
+                    (to_remove,)
+                )
+                self._count -= to_remove
+            self.conn.commit()
+
+    def __len__(self) -> int:
+        return self._count
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {'hits': self.hits, 'misses': self.misses, 'hit_rate': self.hits / total if total else 0.0}
+
+    def flush(self) -> None:
+        with self._lock:
+            self._flush_used()
+            self.conn.commit()
+
+    def close(self) -> None:
+        self.flush()
+        self.conn.close()
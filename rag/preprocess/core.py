@@ -1,10 +1,22 @@
 import os
-from typing import List, Dict
+from typing import List, Dict, Optional
 from .chunk import chunk_by_sections, fallback_chunk
-from .translate import translate_text
+from .cache import TranslationCache
+from .backends import BatchTranslator, shared_backend
+from .jsonl import read_jsonl, write_jsonl, truncate_incomplete
 
-def process_document(file_path: str, metadata: dict, engine: str = "lingva") -> List[Dict]:
-    """Process a single document and return a list of translated chunk dicts."""
+def process_document(file_path: str, metadata: dict, engine: str = "lingva",
+                     cache: Optional[TranslationCache] = None,
+                     translator: Optional[BatchTranslator] = None) -> List[Dict]:
+    """
+    Process a single document and return a list of translated chunk dicts.
+    An optional TranslationCache lets unchanged chunks skip the translation API.
+    All chunks of the document are translated together by a BatchTranslator - pass one to share it
+    between documents, otherwise one using the shared backend of the engine (and cache) is created.
+    A passed translator uses its own cache, so cache can't be given together with it.
+    """
+    if translator is not None and cache is not None and translator.cache is not cache:
+        raise ValueError("Pass the cache to the BatchTranslator given as translator, not to process_document")
 
     # Open and read the file content
     with open(file_path, 'r', encoding='utf-8') as f:
@@ -23,20 +35,22 @@ def process_document(file_path: str, metadata: dict, engine: str = "lingva") ->
     # Extract the document ID (filename without path)
     doc_id = os.path.basename(file_path)
 
+    if section_based:
+        section_titles, chunk_texts = zip(*sections) # Extract the titles and texts for section-based chunks
+    else:
+        section_titles = ["undefined"] * len(sections) # If fallback chunking is used, title is "undefined"
+        chunk_texts = sections
+
+    # Translate the title (the same for every chunk, so only once) and all chunks of text in one go
+    if translator is None:
+        translator = BatchTranslator(shared_backend(engine), cache=cache)
+    translated_title, *translated_chunks = translator.translate([metadata['title'], *chunk_texts])
+
     # List to store all chunks as dictionaries
     chunks = []
 
     # Iterate over each chunk and prepare it for output
-    for idx, chunk in enumerate(sections):
-        if section_based:
-            section_title, chunk_text = chunk # Extract the title and text for section-based chunks
-        else:
-            section_title = "undefined" # If fallback chunking is used, title is "undefined"
-            chunk_text = chunk
-
-        # Translate the chunk of text
-        translated_chunk = translate_text(chunk_text, engine)
-        translated_title = translate_text(metadata['title'], engine)
+    for idx, (section_title, chunk_text, translated_chunk) in enumerate(zip(section_titles, chunk_texts, translated_chunks)):
 
         # Create a dictionary containing metadata and chunk information
         chunks.append({
@@ -45,6 +59,12 @@ def process_document(file_path: str, metadata: dict, engine: str = "lingva") ->
             "keywords": metadata.get('keywords', ''),
             "announcementDate": metadata.get('announcementDate',''),
             "changeDate": metadata.get('changeDate', ''),
+            # metadata of the act used to filter chunks at search time (see rag.vectors.filters)
+            "year": metadata.get('year'),
+            "pos": metadata.get('pos'),
+            "type": metadata.get('type'),
+            "status": metadata.get('status'),
+            "inForce": metadata.get('inForce'),
             "document_id": doc_id,
             "chunk_id": idx,
             "text": chunk_text,
@@ -56,36 +76,45 @@ def process_document(file_path: str, metadata: dict, engine: str = "lingva") ->
 
 
 
-def process_folder(folder_path: str, output_path: str, metadata: List[dict]):
+def process_folder(folder_path: str, output_path: str, metadata: List[dict],
+                   cache: Optional[TranslationCache] = None, engine: str = "lingva", resume: bool = False):
     """
     This function processes all markdown (.md) files in a given folder, applies
     the chunking and translation functions, and saves the results to a JSONL file.
     Metadata need to contain year, pos and title.
-    displayAdress, keywords, annoucementDate and changeDate are optional
+    displayAdress, keywords, annoucementDate, changeDate, type, status and inForce are optional
+    cache is an optional TranslationCache shared by all documents.
+    Chunks are written as soon as a document is processed, so memory use doesn't grow with the number of files.
+    With resume=True documents already present in output_path are skipped and new chunks are appended.
     """
-    all_chunks = [] # List to store all chunks from all files
+    translator = BatchTranslator(shared_backend(engine), cache=cache) # shared by all documents
+    # Find the correct metadata for the file based on naming convention
+    metadata_by_file = {f'DU_{meta["year"]}_{meta["pos"]}.md': meta for meta in metadata}
+
+    done = set()
+    if resume and os.path.exists(output_path):
+        # the last document could have been interrupted while writing, so it's removed and processed again
+        truncate_incomplete(output_path, group_key="document_id")
+        done = {chunk["document_id"] for chunk in read_jsonl(output_path)}
 
-    # Iterate over all files in the folder
-    for filename in os.listdir(folder_path):
-        # Process only .md files
-        if filename.endswith('.md'):
+    def all_chunks():
+        # Iterate over all files in the folder
+        for filename in os.listdir(folder_path):
+            # Process only .md files, which were not processed before
+            if not filename.endswith('.md') or filename in done:
+                continue
             file_path = os.path.join(folder_path, filename)
+            meta = metadata_by_file.get(filename)
+            if meta is None:
+                print(f"No metadata for {file_path}, skipping.")
+                continue
             print(f"Processing {file_path}...")
-            # Find the correct metadata for the file based on naming convention
-            for meta in metadata:
-                if f'DU_{meta["year"]}_{meta["pos"]}.md' == filename:
-                    chunks = process_document(file_path, meta)
-                    break
-            # Add the chunks to the list of all chunks
             try:
-                 all_chunks.extend(chunks)
+                yield from process_document(file_path, meta, engine, translator=translator)
             except Exception as e:
                 print(e) # Handle errors during chunk processing
 
     # Save the processed chunks to a JSONL (JSON Lines) file
-    import json
-    with open(output_path, 'w', encoding='utf-8') as f_out:
-        for chunk in all_chunks:
-            f_out.write(json.dumps(chunk) + '\n')
+    saved = write_jsonl(all_chunks(), output_path, append=bool(done), ensure_ascii=True)
     # Print the number of chunks saved
-    print(f"Saved {len(all_chunks)} chunks to {output_path}.")
+    print(f"Saved {saved} chunks to {output_path}.")
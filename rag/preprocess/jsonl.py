@@ -0,0 +1,79 @@
+"""
+Small generator-based helpers to read, transform and write JSONL files record by record,
+so memory use stays flat no matter how big the file is and work done so far is kept on disk.
+"""
+import os
+import json
+from itertools import islice
+from typing import Iterable, Iterator, List, Optional
+
+
+def read_jsonl(path: str, skip: int = 0) -> Iterator[dict]:
+    """
+    Yields JSON objects from a JSONL file one by one. Empty and broken lines are skipped.
+    skip - number of valid objects to skip at the beginning (used to resume work).
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            if not line.strip():  # Skip empty lines
+                continue
+            try:
+                obj = json.loads(line)
+            except json.JSONDecodeError as e:
+                print(f"Error parsing JSON: {e}")
+                continue
+            if skip:
+                skip -= 1
+                continue
+            yield obj
+
+
+def write_jsonl(records: Iterable[dict], path: str, append: bool = False, flush_every: int = 100,
+                ensure_ascii: bool = False) -> int:
+    """
+    Writes records to a JSONL file as soon as they are produced and returns how many were written.
+    The file is flushed every flush_every records, so a crash loses at most that many.
+    """
+    count = 0
+    with open(path, 'a' if append else 'w', encoding='utf-8') as f:
+        for record in records:
+            f.write(json.dumps(record, ensure_ascii=ensure_ascii) + '\n')
+            count += 1
+            if count % flush_every == 0:
+                f.flush()
+    return count
+
+
+def batched(iterable: Iterable, size: int) -> Iterator[List]:
+    """Groups items of any iterable into lists of at most size items."""
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+def truncate_incomplete(path: str, group_key: Optional[str] = None) -> int:
+    """
+    Prepares a partially written JSONL file to be continued and returns the number of lines kept.
+    A half-written last line is always removed. If group_key is given (e.g. "document_id"),
+    all lines of the last group are removed as well, because we can't know if the group was finished.
+    """
+    if not os.path.exists(path):
+        return 0
+    keep_bytes, group_start, last_group, lines, lines_at_group_start = 0, 0, None, 0, 0
+    with open(path, 'rb') as f:
+        for line in f:
+            if not line.endswith(b'\n'):
+                break
+            try:
+                group = json.loads(line).get(group_key) if group_key else None
+            except json.JSONDecodeError:
+                break
+            if group != last_group:
+                group_start, lines_at_group_start, last_group = keep_bytes, lines, group
+            keep_bytes += len(line)
+            lines += 1
+    if group_key and lines:
+        keep_bytes, lines = group_start, lines_at_group_start
+    with open(path, 'r+b') as f:
+        f.truncate(keep_bytes)
+    return lines
@@ -1,19 +1,17 @@
-import json
 import time
-import requests
-from urllib.parse import quote
 from tqdm import tqdm  # Shows a progress bar during translation
 import ipywidgets as widgets  # UI elements for Colab
 from IPython.display import display  # Show widgets in the notebook
+from typing import Optional
+from .cache import TranslationCache
+from .jsonl import read_jsonl, write_jsonl, batched, truncate_incomplete
+# URLs and target language now live next to the backends, they are imported here so old imports keep working
+from .backends import BatchTranslator, get_backend, shared_backend, LIBRETRANSLATE_URL, LINGVA_URL_TEMPLATE, TARGET_LANG
 
-# URL for LibreTranslate API, if you're running it locally
-LIBRETRANSLATE_URL = "http://localhost:5000/translate"
 
-# Template for the Lingva API (translates from Polish to English)
-LINGVA_URL_TEMPLATE = "https://lingva.ml/api/v1/pl/en/{}"
-
-# Target language for translation
-TARGET_LANG = "en"
+def _default_backend(engine):
+    # shared with process_document and process_folder
+    return shared_backend(engine)
 
 
 def translate_with_libretranslate(text):
@@ -22,20 +20,7 @@ def translate_with_libretranslate(text):
     Assumes the API is running locally.
     """
     try:
-        response = requests.post(
-            LIBRETRANSLATE_URL,
-            json={
-                "q": text,
-                "source": "auto",
-                "target": TARGET_LANG,
-                "format": "text",
-                "alternatives": 1,
-                "api_key": ""  # No API key needed by default
-            },
-            headers={"Content-Type": "application/json"}
-        )
-        response.raise_for_status()  # Raise error if request fails
-        return response.json().get("translatedText", "")
+        return _default_backend("libre").translate_batch([text])[0]
     except Exception as e:
         print(f"LibreTranslate error: {e}")
         return ""
@@ -47,28 +32,41 @@ def translate_with_lingva(text):
     This API does not require a key and is suitable for smaller jobs.
     """
     try:
-        url = LINGVA_URL_TEMPLATE.format(quote(text))  # Safely encode the text
-        response = requests.get(url)
-        response.raise_for_status()
-        return response.json().get("translation", "")
+        return _default_backend("lingva").translate_batch([text])[0]
     except Exception as e:
         print(f"Lingva error: {e}")
         return ""
 
 
-def translate_text(text, engine):
+def translate_text(text, engine, cache: Optional[TranslationCache] = None):
     """
     Wrapper function that selects which translation engine to use.
     Parameters:
         - text: The string to be translated.
         - engine: Either "Lingva" or "LibreTranslate"
+        - cache: optional TranslationCache - texts translated before are taken from it instead of the API
     """
-    if engine.lower() == "lingva":
-        return translate_with_lingva(text)
-    return translate_with_libretranslate(text)
+    # Nothing to translate, no need to call the API
+    if not text.strip():
+        return ""
+
+    backend = _default_backend(engine)
+    translate = translate_with_lingva if backend.name == "lingva" else translate_with_libretranslate
+    if cache is None:
+        return translate(text)
+
+    key = cache.make_key(text, backend.name, backend.source, backend.target)
+    translated = cache.get(key)
+    if translated is None:
+        translated = translate(text)
+        # empty result means the request failed, don't remember it
+        if translated:
+            cache.put(key, translated)
+    return translated
 
 
-def translate_all(input_file, output_file, engine="libre"):
+def translate_all(input_file, output_file, engine="libre", cache: Optional[TranslationCache] = None,
+                  max_workers=4, max_chars=5000, progress_step=500, resume=False):
     """
     Translates all lines in a JSONL file and saves the results.
 
@@ -76,57 +74,57 @@ def translate_all(input_file, output_file, engine="libre"):
         - input_file: Path to the input .jsonl file.
         - output_file: Path to save the translated .jsonl file.
         - engine: Which translation engine to use ("Lingva" or "LibreTranslate").
+        - cache: optional TranslationCache, so unchanged texts are not sent to the API again.
+        - max_workers: how many requests are sent at the same time.
+        - max_chars: how many characters are packed into one request (LibreTranslate only, Lingva takes one text).
+        - progress_step: how many texts are translated (and written) at once.
+        - resume: continue after the last line already written to output_file instead of starting from scratch.
 
     This function:
-        1. Loads each JSON object from the input file.
+        1. Reads JSON objects from the input file, progress_step at a time.
         2. Translates the "text" field in each object.
         3. Saves the translation in a new field called "eng_chunk".
-        4. Writes all objects to the output file.
+        4. Appends the objects to the output file right away, so memory use doesn't grow with the file size
+           and an interrupted run can be resumed.
     """
     print(f"Using '{engine}' for translation...")
     start_time = time.time()
 
-    # Load data
-    json_objects = []
-    with open(input_file, 'r', encoding='utf-8') as f:
-        for line in f:
-            if line.strip():  # Skip empty lines
-                try:
-                    json_objects.append(json.loads(line))
-                except json.JSONDecodeError as e:
-                    print(f"Error parsing JSON: {e}")
-
-    if not json_objects:
-        print("No valid JSON objects found. Exiting.")
-        return
+    # number of objects which are already translated (a half-written last line is removed)
+    done = truncate_incomplete(output_file) if resume else 0
+    if done:
+        print(f"Resuming after {done} translated objects.")
 
-    # Extract the "text" field from each object
-    texts_to_translate = [obj.get("text", "") for obj in json_objects]
+    translator = BatchTranslator(get_backend(engine, pool_size=max_workers), max_chars=max_chars,
+                                 max_workers=max_workers, cache=cache)
 
-    # Translate each text and collect results
-    translations = []
-    for text in tqdm(texts_to_translate, desc="Translating"):
-        translated_text = translate_text(text, engine)
-        translations.append(translated_text)
+    def translated_objects():
+        with tqdm(desc="Translating", initial=done) as progress:
+            for batch in batched(read_jsonl(input_file, skip=done), progress_step):
+                # Translate the "text" field of each object and add translations back into the objects
+                translations = translator.translate([obj.get("text", "") for obj in batch])
+                for obj, translated_text in zip(batch, translations):
+                    obj["eng_chunk"] = translated_text.strip()
+                    yield obj
+                progress.update(len(batch))
 
-    # Add translations back into the original JSON objects
-    for obj, translated_text in zip(json_objects, translations):
-        obj["eng_chunk"] = translated_text.strip()
+    written = write_jsonl(translated_objects(), output_file, append=bool(done))
 
-    # Save results to the output file
-    with open(output_file, 'w', encoding='utf-8') as f:
-        for item in json_objects:
-            json.dump(item, f, ensure_ascii=False)
-            f.write('\n')
+    if not written and not done:
+        print("No valid JSON objects found. Exiting.")
+        return
 
     print(f"\nTranslation completed in {time.time() - start_time:.2f} seconds.")
+    if cache is not None:
+        print(f"Translation cache: {cache.stats()}")
     print(f"Output saved to {output_file}")
 
     # Show a preview of the first result
-    if json_objects:
+    first = next(read_jsonl(output_file), None)
+    if first:
         print("\nSample translation:")
-        print(f"Original text: {json_objects[0].get('text', 'N/A')}")
-        print(f"Translated text: {json_objects[0].get('eng_chunk', 'N/A')}")
+        print(f"Original text: {first.get('text', 'N/A')}")
+        print(f"Translated text: {first.get('eng_chunk', 'N/A')}")
 
 
 def show_ui():
@@ -0,0 +1,340 @@
+"""
+Long-running HTTP service answering questions about the corpus. Models and indexes are loaded once at startup,
+questions of concurrent requests are collected into micro-batches, so the embedding model and the LLM
+process many questions in one call instead of one after another.
+
+    python -m rag.server --workdir workdir --llm google/gemma-2-2b-it --port 8080
+
+Endpoints:
+    POST /query    {"question": "...", "k": 3, "filters": {"year_from": 2020}, "max_new_tokens": 128}
+                   -> {"answer": ..., "chunks": [...], "retrieval_ms": ..., "generation_ms": ..., "latency_ms": ...}
+    GET  /health   -> {"status": "ok", "chunks": ..., "pending": ...}
+    GET  /latency  -> percentiles of latencies of recent requests, sizes of batches, rejected requests
+
+Backpressure: at most max_pending requests are handled at once, the next ones get 503 at once (with Retry-After)
+instead of waiting in an ever-growing queue. Requests taking longer than request_timeout get 504.
+Needs aiohttp (pip install rag[server]).
+"""
+import os
+import json
+import time
+import asyncio
+import argparse
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List, Optional
+import numpy as np
+from aiohttp import web
+from transformers import pipeline
+from .llms.core import SYS_PROMPT, generate_batch
+from .llms.context import pack_context
+from .llms.models import setup_qa_pipeline
+from .llms.query_cache import QueryCache
+from .vectors.embedd import load_embedding_model
+from .vectors.index import read_faiss_index
+from .vectors.chunk_store import ChunkStore
+from .vectors.bm25 import BM25Index
+from .vectors.filters import ChunkMetadata
+from .vectors.retriever import Retriever
+
+
+class MicroBatcher:
+    """
+    Collects items submitted by concurrent requests into batches. A batch is processed when it has
+    max_batch_size items or max_wait_ms after its oldest item arrived, whichever comes first - a lone request
+    waits at most max_wait_ms, under load batches fill up without waiting.
+
+    process(items) -> results (in the same order, an Exception instance fails only its own item) runs
+    in a separate thread, one batch at a time (models shouldn't be called from many threads at once),
+    so the event loop keeps accepting requests meanwhile. Items which arrive during a batch form the next one.
+    """
+
+    def __init__(self, process: Callable[[list], list], max_batch_size: int = 16, max_wait_ms: float = 10.0,
+                 max_queue: int = 256, name: str = 'batcher'):
+        self.process, self.max_batch_size, self.max_wait = process, max_batch_size, max_wait_ms / 1000
+        self.queue = asyncio.Queue(max_queue)
+        self.executor = ThreadPoolExecutor(1, thread_name_prefix=name)
+        self.batch_sizes = deque(maxlen=1000)
+        self.task = None
+
+    def start(self) -> None:
+        self.task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self) -> None:
+        if self.task is not None:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+        self.executor.shutdown(wait=True)
+
+    async def submit(self, item):
+        """Waits for the result of the item. Raises asyncio.QueueFull at once if max_queue items are waiting."""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self.queue.put_nowait((loop.time(), item, future))
+        return await future
+
+    async def _next_batch(self) -> list:
+        loop = asyncio.get_running_loop()
+        batch = [await self.queue.get()]
+        deadline = batch[0][0] + self.max_wait
+        while len(batch) < self.max_batch_size:
+            # items which are already waiting join at once, then new ones until the oldest item has waited long enough
+            if not self.queue.empty():
+                batch.append(self.queue.get_nowait())
+                continue
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        # requests which timed out or were dropped by the client are not processed
+        return [(item, future) for _, item, future in batch if not future.done()]
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._next_batch()
+            if not batch:
+                continue
+            self.batch_sizes.append(len(batch))
+            try:
+                results = await loop.run_in_executor(self.executor, self.process, [item for item, _ in batch])
+            except Exception as e:
+                results = [e] * len(batch)
+            for (_, future), result in zip(batch, results):
+                if future.done():
+                    continue
+                if isinstance(result, Exception):
+                    future.set_exception(result)
+                else:
+                    future.set_result(result)
+
+
+def _percentiles(values) -> dict:
+    if not values:
+        return {'p50': None, 'p95': None, 'p99': None}
+    p50, p95, p99 = np.percentile(np.fromiter(values, dtype=np.float64), [50, 95, 99])
+    return {'p50': round(p50, 2), 'p95': round(p95, 2), 'p99': round(p99, 2)}
+
+
+class RAGService:
+    """
+    Answers questions with a retriever and an LLM loaded once, batching questions of concurrent requests:
+    all questions of a batch are embedded and searched in one call (Retriever.search_batch), then their answers
+    are generated in one call (generate_batch). Questions with different k / filters / max_new_tokens
+    can share a batch, they are split into groups inside it.
+
+    Parameters:
+    - generation_params: default parameters of generation, max_new_tokens of a request can only be lower.
+    - max_batch_size / max_wait_ms: size of batches and how long a question waits for others (for both stages).
+    - max_pending: how many requests are handled at once, the next ones are rejected with 503.
+    - request_timeout: seconds after which a request gets 504.
+    - max_context_tokens: optional limit of tokens of the found chunks in the prompt (see pack_context).
+    - cache: optional QueryCache for answers (give it to the retriever as well for embeddings and search results).
+    - history: how many recent requests the percentiles of /latency are computed from.
+    """
+
+    def __init__(self, retriever: Retriever, qa_pipeline: pipeline, generation_params: Optional[dict] = None,
+                 sys_prompt: str = SYS_PROMPT, max_batch_size: int = 16, max_wait_ms: float = 10.0,
+                 max_pending: int = 256, request_timeout: float = 120.0, max_context_tokens: Optional[int] = None,
+                 cache: Optional[QueryCache] = None, history: int = 10000):
+        self.retriever, self.qa_pipeline, self.sys_prompt = retriever, qa_pipeline, sys_prompt
+        self.generation_params = {'max_new_tokens': 256, 'return_full_text': False, **(generation_params or {})}
+        self.max_batch_size, self.max_wait_ms = max_batch_size, max_wait_ms
+        self.max_pending, self.request_timeout = max_pending, request_timeout
+        self.max_context_tokens, self.cache = max_context_tokens, cache
+        self.retrieval_batcher = self.generation_batcher = None
+        self.pending = 0
+        self.counts = {'requests': 0, 'rejected': 0, 'timeouts': 0, 'errors': 0}
+        # (latency, retrieval, generation) of recent requests in milliseconds
+        self.latencies = deque(maxlen=history)
+        self.started = time.time()
+
+    def _retrieve(self, items: List[tuple]) -> list:
+        """Found chunks for (question, k, filters) items, one search_batch call for every k and filters."""
+        results = [None] * len(items)
+        groups = defaultdict(list)
+        for i, (_, k, filters) in enumerate(items):
+            groups[(k, json.dumps(filters or {}, sort_keys=True))].append(i)
+        for (k, _), positions in groups.items():
+            try:
+                found = self.retriever.search_batch([items[i][0] for i in positions], k, items[positions[0]][2])
+            except Exception as e:
+                found = [e] * len(positions)
+            for i, chunks in zip(positions, found):
+                results[i] = chunks
+        return results
+
+    def _generate(self, items: List[tuple]) -> list:
+        """
+        Answers for (question, found chunks, generation params) items, one generate_batch call for every params.
+        If generation fails, every item of the call gets a RuntimeError, so its request gets a 500.
+        """
+        results = [None] * len(items)
+        groups = defaultdict(list)
+        for i, (_, _, params) in enumerate(items):
+            groups[json.dumps(params, sort_keys=True)].append(i)
+        for positions in groups.values():
+            contexts = [items[i][1] for i in positions]
+            if self.max_context_tokens is not None:
+                contexts = [pack_context(chunks, self.qa_pipeline.tokenizer, self.max_context_tokens)[0]
+                            for chunks in contexts]
+            try:
+                answers = generate_batch([items[i][0] for i in positions], contexts, self.qa_pipeline,
+                                         items[positions[0]][2], self.sys_prompt, len(positions), self.cache,
+                                         raise_errors=True)
+            except Exception as e:
+                # not a ValueError, which would be reported as a bad request
+                answers = [RuntimeError(f"Error generating response: {e}") for _ in positions]
+            for i, answer in zip(positions, answers):
+                results[i] = answer
+        return results
+
+    async def start(self, app: Optional[web.Application] = None) -> None:
+        self.retrieval_batcher = MicroBatcher(self._retrieve, self.max_batch_size, self.max_wait_ms,
+                                              self.max_pending, 'retrieval')
+        self.generation_batcher = MicroBatcher(self._generate, self.max_batch_size, self.max_wait_ms,
+                                               self.max_pending, 'generation')
+        self.retrieval_batcher.start()
+        self.generation_batcher.start()
+
+    async def stop(self, app: Optional[web.Application] = None) -> None:
+        for batcher in (self.retrieval_batcher, self.generation_batcher):
+            if batcher is not None:
+                await batcher.stop()
+
+    async def answer(self, question: str, k: int = 3, filters: Optional[dict] = None,
+                     max_new_tokens: Optional[int] = None) -> dict:
+        """Answers one question (retrieval and generation batched with other requests)."""
+        start = time.perf_counter()
+        chunks = await self.retrieval_batcher.submit((question, k, filters))
+        retrieved = time.perf_counter()
+        params = dict(self.generation_params)
+        if max_new_tokens is not None:
+            params['max_new_tokens'] = min(max_new_tokens, params['max_new_tokens'])
+        answer = await self.generation_batcher.submit((question, chunks, params))
+        done = time.perf_counter()
+        return {'answer': answer,
+                'chunks': [{'title': chunk['title'], 'id': chunk['id'], 'score': chunk['score']} for chunk in chunks],
+                'retrieval_ms': (retrieved - start) * 1000, 'generation_ms': (done - retrieved) * 1000,
+                'latency_ms': (done - start) * 1000}
+
+    async def handle_query(self, request: web.Request) -> web.Response:
+        try:
+            body = await request.json()
+            question = body['question']
+            k = int(body.get('k', 3))
+            filters = body.get('filters')
+            max_new_tokens = body.get('max_new_tokens')
+            if not isinstance(question, str) or not question.strip() or not 1 <= k <= 100:
+                raise ValueError
+            if filters is not None and not isinstance(filters, dict):
+                raise ValueError
+            max_new_tokens = int(max_new_tokens) if max_new_tokens is not None else None
+            if max_new_tokens is not None and max_new_tokens < 1:
+                raise ValueError
+        except (ValueError, TypeError, KeyError):
+            raise web.HTTPBadRequest(text=json.dumps({'error': 'expected {"question": str, "k": 1-100, '
+                                                               '"filters": dict, "max_new_tokens": int >= 1}'}),
+                                     content_type='application/json')
+
+        self.counts['requests'] += 1
+        if self.pending >= self.max_pending:
+            self.counts['rejected'] += 1
+            raise web.HTTPServiceUnavailable(text=json.dumps({'error': 'too many requests'}),
+                                             content_type='application/json', headers={'Retry-After': '1'})
+        self.pending += 1
+        try:
+            result = await asyncio.wait_for(self.answer(question, k, filters, max_new_tokens), self.request_timeout)
+        except asyncio.TimeoutError:
+            self.counts['timeouts'] += 1
+            raise web.HTTPGatewayTimeout(text=json.dumps({'error': 'timeout'}), content_type='application/json')
+        except asyncio.QueueFull:
+            self.counts['rejected'] += 1
+            raise web.HTTPServiceUnavailable(text=json.dumps({'error': 'too many requests'}),
+                                             content_type='application/json', headers={'Retry-After': '1'})
+        except (ValueError, TypeError) as e:
+            # e.g. filters without metadata of the chunks or with values of a wrong type
+            self.counts['errors'] += 1
+            raise web.HTTPBadRequest(text=json.dumps({'error': f'invalid request: {e}'}), content_type='application/json')
+        except Exception as e:
+            self.counts['errors'] += 1
+            raise web.HTTPInternalServerError(text=json.dumps({'error': str(e)}), content_type='application/json')
+        finally:
+            self.pending -= 1
+        self.latencies.append((result['latency_ms'], result['retrieval_ms'], result['generation_ms']))
+        return web.json_response(result)
+
+    async def handle_health(self, request: web.Request) -> web.Response:
+        index = self.retriever.index
+        chunks = index.ntotal if hasattr(index, 'ntotal') else len(index)  # FAISS index or ChunkIndex
+        return web.json_response({'status': 'ok', 'chunks': int(chunks), 'pending': self.pending,
+                                  'uptime_s': round(time.time() - self.started, 1)})
+
+    async def handle_latency(self, request: web.Request) -> web.Response:
+        latencies = list(self.latencies)
+        stats = {'recent_requests': len(latencies), **{name: _percentiles([row[i] for row in latencies])
+                                                 for i, name in enumerate(('latency_ms', 'retrieval_ms', 'generation_ms'))},
+                 'batch_size': {name: {'mean': round(float(np.mean(batcher.batch_sizes)), 2) if batcher.batch_sizes else None,
+                                       'max': max(batcher.batch_sizes, default=None)}
+                                for name, batcher in (('retrieval', self.retrieval_batcher),
+                                                      ('generation', self.generation_batcher))},
+                 'pending': self.pending, **self.counts}
+        if self.cache is not None:
+            stats['cache'] = self.cache.stats()
+        return web.json_response(stats)
+
+    def make_app(self) -> web.Application:
+        app = web.Application(client_max_size=64 * 1024)
+        app.add_routes([web.post('/query', self.handle_query), web.get('/health', self.handle_health),
+                        web.get('/latency', self.handle_latency)])
+        app.on_startup.append(self.start)
+        app.on_cleanup.append(self.stop)
+        return app
+
+
+def load_retriever(workdir: str, embedding_model: str = 'all-MiniLM-L6-v2', cache: Optional[QueryCache] = None) -> Retriever:
+    """
+    Retriever over the files of rag.sync in workdir: chunk_index/index.faiss (memory-mapped) with chunk_store/,
+    plus bm25.npz and metadata.npz if they exist.
+    """
+    index = read_faiss_index(os.path.join(workdir, 'chunk_index', 'index.faiss'), mmap=True)
+    store = ChunkStore(os.path.join(workdir, 'chunk_store'))
+    bm25_path, metadata_path = os.path.join(workdir, 'bm25.npz'), os.path.join(workdir, 'metadata.npz')
+    lexical = BM25Index.load(bm25_path) if os.path.exists(bm25_path) else None
+    metadata = ChunkMetadata.load(metadata_path) if os.path.exists(metadata_path) else None
+    return Retriever(index, load_embedding_model(embedding_model), store, lexical=lexical, metadata=metadata, cache=cache)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workdir', required=True, help='working directory of rag.sync')
+    parser.add_argument('--llm', default='google/gemma-2-2b-it')
+    parser.add_argument('--backend', choices=('auto', 'cpu'), default='auto', help='see setup_qa_pipeline')
+    parser.add_argument('--threads', type=int, default=None, help='torch threads of the cpu backend')
+    parser.add_argument('--model-cache-dir', default=None, help='cache of the quantized model of the cpu backend')
+    parser.add_argument('--embedding-model', default='all-MiniLM-L6-v2')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--max-new-tokens', type=int, default=256)
+    parser.add_argument('--max-batch-size', type=int, default=16)
+    parser.add_argument('--max-wait-ms', type=float, default=10.0)
+    parser.add_argument('--max-pending', type=int, default=256)
+    parser.add_argument('--request-timeout', type=float, default=120.0)
+    parser.add_argument('--max-context-tokens', type=int, default=None)
+    parser.add_argument('--no-cache', action='store_true')
+    args = parser.parse_args()
+
+    cache = None if args.no_cache else QueryCache()
+    qa_pipeline = setup_qa_pipeline(args.llm, args.backend, threads=args.threads, cache_dir=args.model_cache_dir)
+    service = RAGService(load_retriever(args.workdir, args.embedding_model, cache), qa_pipeline,
+                         {'max_new_tokens': args.max_new_tokens}, max_batch_size=args.max_batch_size,
+                         max_wait_ms=args.max_wait_ms, max_pending=args.max_pending,
+                         request_timeout=args.request_timeout, max_context_tokens=args.max_context_tokens, cache=cache)
+    web.run_app(service.make_app(), host=args.host, port=args.port)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,169 @@
+"""
+Incremental update of the whole corpus. Instead of rebuilding everything, only acts which are new
+or changed since the last run are downloaded, cleaned, chunked, translated and embedded.
+
+All files live in one working directory:
+    workdir/manifest.sqlite     - metadata of every processed act (see rag.isap.manifest)
+    workdir/pdf/                - downloaded PDFs
+    workdir/md/                 - markdown converted from the PDFs (DU_<year>_<pos>.md)
+    workdir/clean/              - cleaned markdown (output of process_documents)
+    workdir/translations.sqlite - translation cache (see rag.preprocess.cache)
+    workdir/chunks.jsonl        - translated chunks of all acts
+    workdir/embeddings/         - embeddings of chunk texts (see rag.vectors.store)
+    workdir/index.faiss         - FAISS index built from the embeddings (positions of chunks in chunks.jsonl)
+    workdir/chunk_index/        - FAISS index with stable chunk ids, updated act by act (see rag.vectors.chunk_index)
+    workdir/chunk_store/        - chunks of chunk_index by id, for serving (see rag.vectors.chunk_store)
+    workdir/bm25.npz            - BM25 index of the chunks with the same ids (see rag.vectors.bm25)
+    workdir/metadata.npz        - metadata of the acts of the chunks used by filters (see rag.vectors.filters)
+"""
+import os
+import numpy as np
+from typing import Callable, List, Optional
+from .isap.info import harvest_all_docs_data, filter_out_results
+from .isap.files import download_articles, read_manifest, write_manifest
+from .isap.manifest import ActManifest
+from .txt_extract.files import process_documents
+from .preprocess.core import process_document
+from .preprocess.cache import TranslationCache
+from .preprocess.backends import BatchTranslator, shared_backend
+from .preprocess.jsonl import read_jsonl, write_jsonl
+from .vectors.embedd import embed_texts, load_embedding_model
+from .vectors.store import EmbeddingStore
+from .vectors.index import create_faiss_index, save_faiss_index
+from .vectors.chunk_index import ChunkIndex, chunk_key
+from .vectors.chunk_store import write_chunk_store
+from .vectors.bm25 import BM25Index
+from .vectors.filters import ChunkMetadata
+
+
+def _doc_name(doc: dict) -> str:
+    return f'DU_{doc["year"]}_{doc["pos"]}'
+
+
+def _read_chunks(path: str) -> List[dict]:
+    return list(read_jsonl(path)) if os.path.exists(path) else []
+
+
+def _forget_pdfs(docs: List[dict], pdf_folder: str) -> None:
+    """Removes PDFs of the acts and their entries in the download manifest, so new versions are downloaded."""
+    manifest = read_manifest(pdf_folder)
+    for doc in docs:
+        name = f'{_doc_name(doc)}.pdf'
+        manifest.pop(name, None)
+        path = os.path.join(pdf_folder, name)
+        if os.path.exists(path):
+            os.remove(path)
+    write_manifest(pdf_folder, manifest)
+
+
+def _embedding_dim(model_name: str) -> int:
+    model = load_embedding_model(model_name)
+    # renamed in newer sentence-transformers
+    return (getattr(model, 'get_embedding_dimension', None) or model.get_sentence_embedding_dimension)()
+
+
+def sync_corpus(workdir: str,
+                remove_after_params: dict,
+                convert_pdfs: Callable[[List[str], str], None],
+                years_to_keep: Optional[list] = None,
+                filters: Optional[dict] = None,
+                engine: str = "lingva",
+                model_name: str = 'all-MiniLM-L6-v2') -> dict:
+    """
+    Brings the corpus in workdir up to date with the ISAP API.
+
+    Parameters:
+    - workdir: working directory (see the layout at the top of this module).
+    - remove_after_params: passed to process_documents.
+    - convert_pdfs: function converting a list of PDF paths into markdown files DU_<year>_<pos>.md
+      saved in the folder given as the second argument (e.g. a PDF->markdown converter followed by extract_md_files).
+    - years_to_keep, filters: the same as in extract_all_docs_data and filter_out_results.
+    - engine: translation engine, model_name: embedding model.
+
+    Returns a small summary with the number of new, changed, removed and failed acts.
+    """
+    folders = {name: os.path.join(workdir, name) for name in ('pdf', 'md', 'clean')}
+    for folder in folders.values():
+        os.makedirs(folder, exist_ok=True)
+    chunks_path = os.path.join(workdir, 'chunks.jsonl')
+
+    manifest = ActManifest(os.path.join(workdir, 'manifest.sqlite'))
+    cache = TranslationCache(os.path.join(workdir, 'translations.sqlite'))
+    translator = BatchTranslator(shared_backend(engine), cache=cache)
+    chunk_index = ChunkIndex(os.path.join(workdir, 'chunk_index'))
+    try:
+        # Step 1: compare the current listing with what we processed last time
+        docs = filter_out_results(harvest_all_docs_data(years_to_keep), filters)
+        new, changed, removed = manifest.diff(docs)
+        to_process = new + changed
+        print(f"New acts: {len(new)}, changed: {len(changed)}, removed: {len(removed)}")
+
+        # Step 2: download and convert only acts which need it
+        # (the old PDF and markdown of changed acts are removed first, so neither the download
+        # nor a failed conversion can reuse them)
+        _forget_pdfs(changed, folders['pdf'])
+        for doc in to_process:
+            for folder in (folders['md'], folders['clean']):
+                path = os.path.join(folder, f'{_doc_name(doc)}.md')
+                if os.path.exists(path):
+                    os.remove(path)
+        download_articles(to_process, folders['pdf'])
+        pdf_paths = [os.path.join(folders['pdf'], f'{_doc_name(doc)}.pdf') for doc in to_process]
+        pdf_paths = [path for path in pdf_paths if os.path.exists(path)]
+        if pdf_paths:
+            convert_pdfs(pdf_paths, folders['md'])
+
+        # Step 3: clean, chunk and translate them
+        process_documents(to_process, folders['md'], folders['clean'], remove_after_params)
+        new_chunks, processed, failed = [], [], []
+        for doc in to_process:
+            clean_path = os.path.join(folders['clean'], f'{_doc_name(doc)}.md')
+            if not os.path.exists(clean_path):
+                failed.append(doc)
+                continue
+            for chunk in process_document(clean_path, doc, engine, translator=translator):
+                # names expected by rag.llms.context.prepare_chunks
+                chunk['eng_chunk'] = chunk['translated_text']
+                chunk['eng_title'] = chunk['title']
+                new_chunks.append(chunk)
+            processed.append(doc)
+
+        # Step 4: replace chunks of processed and removed acts, keep all the others
+        outdated = {f'{_doc_name(doc)}.md' for doc in processed + removed}
+        old_chunks = _read_chunks(chunks_path)
+        chunks = [chunk for chunk in old_chunks if chunk['document_id'] not in outdated] + new_chunks
+
+        # a chunk index created for an existing corpus gets all its chunks, later only chunks of processed acts
+        indexed_chunks = chunks if len(chunk_index) == 0 else new_chunks
+        corpus_changed = bool(indexed_chunks) or len(chunks) != len(old_chunks) or not os.path.exists(chunks_path)
+        if corpus_changed:
+            if chunks:
+                # only chunks which are not in the embedding store yet are encoded
+                store = EmbeddingStore(os.path.join(workdir, 'embeddings'), model_name)
+                embeddings = embed_texts([chunk['eng_chunk'] for chunk in chunks], model_name, store)[0]
+            else:
+                # every act was removed - empty files are written, so nothing serves the removed chunks anymore
+                embeddings = np.zeros((0, _embedding_dim(model_name)), dtype=np.float32)
+            write_jsonl(chunks, f'{chunks_path}.tmp')
+            os.replace(f'{chunks_path}.tmp', chunks_path)
+            save_faiss_index(create_faiss_index(embeddings), os.path.join(workdir, 'index.faiss'))
+            # new chunks are at the end of the list
+            chunk_index.replace_documents(outdated, indexed_chunks, embeddings[len(chunks) - len(indexed_chunks):])
+        else:
+            chunk_index.remove_documents(outdated)
+        chunk_index.save()
+        if corpus_changed:
+            ids = [chunk_key(chunk['document_id'], chunk['chunk_id']) for chunk in chunks]
+            write_chunk_store(os.path.join(workdir, 'chunk_store'), chunks, ids)
+            BM25Index(chunks, ids).save(os.path.join(workdir, 'bm25.npz'))
+            ChunkMetadata(chunks, ids).save(os.path.join(workdir, 'metadata.npz'))
+
+        # Step 5: remember what was done, failed acts will be retried next time
+        manifest.update(processed)
+        manifest.remove(removed)
+    finally:
+        manifest.close()
+        cache.close()
+        chunk_index.close()
+
+    return {'new': len(new), 'changed': len(changed), 'removed': len(removed), 'failed': len(failed)}
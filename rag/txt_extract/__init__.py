@@ -3,4 +3,6 @@ The package contains all operations related to text extraction:
 1. Discarding contamination from other texts and Markdown syntax - discard.py
 2. Language detection - lang.py
 3. Md files extraction and processing all texts - files.py
+4. Tables detection and conversion to csv - tables.py
+5. One-pass markdown normalisation (tables and formatting) - markdown.py
 """
\ No newline at end of file
@@ -1,29 +1,68 @@
 import re
-from rapidfuzz import fuzz
-from typing import List
+import numpy as np
+from rapidfuzz import fuzz, process
+from typing import List, Optional, Union
 
+# date part of titles, e.g. " z dnia 12 marca 2020 r."
+TITLE_DATE_PATTERN = re.compile(r'\s+z dnia\s+\d{1,2}\s+\w+\s+\d{4}\s+r\.')
 
-def remove_before(content: List[str], title: str, threshold = 90):
+
+def find_title_line(lines: List[str], title: str, threshold = 90, workers: int = 1) -> Optional[int]:
+    """
+    Returns the index of the first line which matches the title (partial_ratio >= threshold) or None.
+
+    Lines are checked in blocks growing 4 times each step (64, 256, 1024... lines), so we stop early
+    when the title is close to the beginning, as it usually is. In every block:
+    - a cheap exact check looks for the first line containing the whole (lowercased) title - such a line
+      always has a score of 100, so only lines before it can be an earlier match,
+    - those lines are scored in bulk by rapidfuzz (process.cdist) instead of one by one.
+    workers - number of threads used by cdist (-1 uses all cores).
+    """
+    # remove common parts from the title to prevent false positives in matchining titles
+    cleaned_title = TITLE_DATE_PATTERN.sub('', title).lower()
+    if not cleaned_title:
+        return None
+
+    start, block = 0, 64
+    while start < len(lines):
+        stop = min(len(lines), start + block)
+        candidates = [line.lower() for line in lines[start:stop]]
+        exact = next((idx for idx, line in enumerate(candidates) if cleaned_title in line), None)
+        if exact is not None:
+            candidates = candidates[:exact]
+        if candidates:
+            # similarity of every line to the cleaned title (on a scale from 0 to 100), lines below the threshold get 0
+            scores = process.cdist([cleaned_title], candidates, scorer=fuzz.partial_ratio,
+                                   score_cutoff=threshold, workers=workers)[0]
+            matches = np.flatnonzero(scores >= threshold)
+            if matches.size:
+                return start + int(matches[0])
+        if exact is not None:
+            return start + exact
+        start, block = stop, block * 4
+    return None
+
+
+def remove_before(content: Union[str, List[str]], title: str, threshold = 90):
     """
     Function to remove any unwanted content at the beginning of the text—such as fragments from other documents—
     that appear before the specified title.
 
     It uses the partial_ratio algorithm to compare each line of the text to the target title.
     If a line matches the title with over 90% similarity, everything preceding that line is discarded.
+    content can be the whole text or a list of its lines.
     """
-    # remove common parts from the title to prevent false positives in matchining titles
-    cleaned_title = re.sub(r'\s+z dnia\s+\d{1,2}\s+\w+\s+\d{4}\s+r\.', '', title)
-    # Go through each line in the content to find where the actual document starts
-    for idx, line in enumerate(content):
-        # Compare how similar the current line is to the cleaned title (on a scale from 0 to 100)
-        score = fuzz.partial_ratio(line.lower(), cleaned_title.lower())
-        if score >= threshold:
-            # Found the likely start — slice from the next line
-            content_str = ''.join(content[idx + 1:])
-            # Prepend the official title
-            return f"{title}\n{content_str}"
-    # If no matching title found, return the content unchanged
-    return ''.join(content)
+    # Split the text into lines once (keeping line endings, so they can be joined back unchanged)
+    lines = content.splitlines(keepends=True) if isinstance(content, str) else list(content)
+    # Find where the actual document starts
+    idx = find_title_line(lines, title, threshold)
+    if idx is None:
+        # If no matching title found, return the content unchanged
+        return ''.join(lines)
+    # Found the likely start — slice from the next line
+    content_str = ''.join(lines[idx + 1:])
+    # Prepend the official title
+    return f"{title}\n{content_str}"
 
 
 def remove_after(content: str,
@@ -57,7 +96,11 @@ def remove_after(content: str,
     # regular expression: ^ - start of the line, \s* - zero or more whitespaces
     # a{x,y} - matches character "a" exactly x or y times
     #start_pattern = r'^\s*#{2,3}\s*(USTAWA|ROZPORZĄDZENIE|OBWIESZCZENIE)'
-    match = re.search(start_pattern, content, flags=re.MULTILINE)
+    # the pattern may already be compiled (see compile_remove_after_params)
+    if isinstance(start_pattern, re.Pattern):
+        match = start_pattern.search(content)
+    else:
+        match = re.search(start_pattern, content, flags=re.MULTILINE)
     if match:
         # If we find such a heading, we assume the real content ends before it.
         end_position = match.start()
@@ -80,6 +123,18 @@ def remove_after(content: str,
     return content.strip()
 
 
+def compile_remove_after_params(params: dict) -> dict:
+    """
+    Returns a copy of remove_after params with all regular expressions compiled,
+    so they are compiled once instead of on every call of remove_after.
+    """
+    compiled = dict(params)
+    if params.get('start_pattern'):
+        compiled['start_pattern'] = re.compile(params['start_pattern'], flags=re.MULTILINE)
+    compiled['signature_patterns'] = [re.compile(pattern) for pattern in params.get('signature_patterns') or []]
+    return compiled
+
+
 def strip_markdown(text: str) -> str:
     """
     remove Markdown formatting, preserve only text
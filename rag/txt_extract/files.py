@@ -1,9 +1,11 @@
 import os
 import shutil
+import traceback
+from concurrent.futures import ProcessPoolExecutor
 from tqdm import tqdm
-from typing import List
-from .discard import remove_after, remove_before, strip_markdown
-from .tables import detect_markdown_table, markdown_table_to_csv
+from typing import List, Optional, Tuple
+from .discard import remove_after, remove_before, compile_remove_after_params
+from .markdown import normalise_markdown
 
 def extract_md_files(input_dir: str, output_dir:str) -> None:
     """
@@ -15,11 +17,63 @@ def extract_md_files(input_dir: str, output_dir:str) -> None:
             shutil.move(md_path, f'{output_dir}/{file.name}.md')
 
 
+# Settings of the current worker process, set once by _init_worker (see process_documents)
+_worker_settings = {}
+
+
+def _init_worker(source_folder: str, output_folder: str, remove_after_params: dict, keep_tables: bool) -> None:
+    """
+    Runs once in every worker process. Patterns are compiled here, so each worker
+    compiles them only once instead of once per document.
+    """
+    _worker_settings.update(
+        source_folder=source_folder,
+        output_folder=output_folder,
+        remove_after_params=compile_remove_after_params(remove_after_params),
+        keep_tables=keep_tables,
+    )
+
+
+def clean_document(text: str, title: str, remove_after_params: dict, keep_tables: bool = True) -> str:
+    """
+    Cleans the text of one document: removes fragments of other documents before and after it,
+    optionally converts tables to CSV and removes Markdown formatting.
+    """
+    text = remove_before(text, title)
+    text = remove_after(text, remove_after_params)
+    # tables to CSV (if not keep_tables) and markdown formatting removed in one pass
+    return normalise_markdown(text, keep_tables)
+
+
+def _clean_file(task: Tuple[str, str]) -> Tuple[str, Optional[str]]:
+    """
+    Cleans one file (task is file name and title) and returns its name with an error message if it failed,
+    so one broken document doesn't stop the whole run.
+    """
+    file_name, title = task
+    settings = _worker_settings
+    try:
+        # For each file, open it and read its contents as a string.
+        # The 'with' statement ensures that the file is properly closed after being read.
+        with open(os.path.join(settings['source_folder'], file_name), 'r', encoding='utf-8') as f:
+            text = f.read()
+        text = clean_document(text, title, settings['remove_after_params'], settings['keep_tables'])
+        # After processing the text, it is saved to a new file with the same name
+        # in the 'output_folder'.
+        with open(os.path.join(settings['output_folder'], file_name), 'w', encoding='utf-8') as f:
+            f.write(text)
+        return file_name, None
+    except Exception:
+        return file_name, traceback.format_exc()
+
+
 def process_documents(filter_docs: List[str],
                       source_folder: str,
                       output_folder: str,
                       remove_after_params: dict,
-                     keep_tables=True) -> None:
+                     keep_tables=True,
+                     workers: Optional[int] = 1,
+                     chunksize: int = 16) -> dict:
     """
     Processes markdown files in the given folder, cleans and extracts Polish text,
     and saves the output to a specified destination.
@@ -29,6 +83,10 @@ def process_documents(filter_docs: List[str],
     - source_folder: Folder containing the markdown files to process.
     - output_folder: Folder where processed files will be saved.
     - remove_after_params: patterns to filter out - default_ending, start_pattern, signature_patterns
+    - workers: number of processes cleaning documents in parallel (None - one per CPU core, 1 - no extra processes).
+    - chunksize: how many documents are sent to a worker process at once.
+
+    Returns a report with the number of processed files and the errors of files which failed.
     """
 
     # This part is creating a dictionary where the keys are file names
@@ -37,29 +95,28 @@ def process_documents(filter_docs: List[str],
     # Each document is assumed to have a 'year', 'pos' (position), and 'title'.
     titles = {f"DU_{doc['year']}_{doc['pos']}.md": doc['title'] for doc in filter_docs}
 
-    files = list(os.scandir(source_folder))  # convert to list so tqdm can measure length
+    # Files of documents that are not in filter_docs are left alone
+    tasks = [(file.name, titles[file.name]) for file in os.scandir(source_folder) if file.name in titles]
+    settings = (source_folder, output_folder, remove_after_params, keep_tables)
 
-    # This part is scanning through files in a specific folder one by one.
-    for file in tqdm(files, desc="Extracting text"):
-        # For each file, open it and read its contents as a string.
-        # The 'with' statement ensures that the file is properly closed after being read.
-        with open(os.path.join(source_folder, file.name), 'r', encoding='utf-8') as f:
-            text = f.read()
-        title = titles[file.name]
-        text = remove_before(text, title)
-        text = remove_after(text, remove_after_params)
-
-        if not keep_tables:
-            tables = detect_markdown_table(text)
-    
-            for i, table_idx in enumerate(tables):
-                table = text[table_idx[0]:table_idx[1]]
-                csv_table = markdown_table_to_csv(table)
-                text = text.replace(table, f'Tabela {i}. {csv_table}\n')
-
-        text = strip_markdown(text)
-        # After processing the text, it is saved to a new file with the same name
-        # in the 'output_folder'.
-        output_path = os.path.join(output_folder, file.name)
-        with open(output_path, 'w', encoding='utf-8') as f:
-            f.write(text)
+    if workers == 1:
+        _init_worker(*settings)
+        results = map(_clean_file, tasks)
+        executor = None
+    else:
+        executor = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=settings)
+        # map returns results in the same order as tasks, so the progress bar goes through files in order
+        results = executor.map(_clean_file, tasks, chunksize=chunksize)
+
+    errors = []
+    try:
+        for file_name, error in tqdm(results, total=len(tasks), desc="Extracting text"):
+            if error is not None:
+                errors.append({'file': file_name, 'error': error})
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+    if errors:
+        print(f"{len(errors)} of {len(tasks)} files failed, e.g. {errors[0]['file']}:\n{errors[0]['error']}")
+    return {'processed': len(tasks) - len(errors), 'errors': errors}
@@ -1,28 +1,171 @@
-from langdetect import detect, detect_langs
+import re
+import threading
+from concurrent.futures import Executor, ProcessPoolExecutor
+from typing import Optional, List, Dict
+from langdetect.detector_factory import DetectorFactory, PROFILES_DIRECTORY
 
+# letters which (among languages found in our documents) appear only in Polish
+POLISH_LETTERS = set('ąćęłńśźżĄĆĘŁŃŚŹŻ')
+# any letter (\w without digits and underscore)
+LETTER_PATTERN = re.compile(r'[^\W\d_]')
+NON_ASCII_LETTER_PATTERN = re.compile(r'[^\W\d_a-zA-Z]')
+ASCII_WORD_PATTERN = re.compile(r'[a-z]+')
+# frequent words of Polish (also without diacritics, as OCR often loses them) and English legal texts which are not
+# words of the other language - short ones shared by both ("a", "i", "to", "do", "on", "by", "no") are left out,
+# and so are words like "minister" or "organ"
+POLISH_WORDS = frozenset(
+    'w z na nie sie oraz lub przez dla od po jest ktory ktora ktore ktorych ktorym ze za przy jako tym tej tego '
+    'jego ich jej sa moze takze lit ust pkt poz dz ustaw ustawy ustawa ustawie dnia roku zm mowa mowy stosuje '
+    'przepis przepisy przepisu sprawie zakresie rady dziennik wniosek decyzji albo ani aby gdy jezeli jednak '
+    'tylko wraz wobec pod nad miedzy'.split())
+ENGLISH_WORDS = frozenset(
+    'the of and in is for with that be as are shall this or from at an which it not have has was were its their '
+    'any such may other these all into under between than been will would should within where there whether '
+    'must upon each those'.split())
+# letter pairs which are frequent in one of the languages and (almost) never appear in the other one
+POLISH_LETTER_PAIRS = re.compile(r'cz|rz|dz|sz')
+ENGLISH_LETTER_PAIRS = re.compile(r'th|wh')
+# a paragraph without letters outside ASCII is decided by its words if at least this many of them are typical
+# of one language (a frequent word or a word with its letter pair), none of the other one, and they make
+# at least 1/MIN_WORD_SHARE of all words
+MIN_KNOWN_WORDS = 2
+MIN_WORD_SHARE = 5
 
-def extract_lang(text: str, target_lang: str) -> str:
+# language of paragraphs we have already seen (boilerplate lines repeat a lot), '' means "no language"
+_verdicts: Dict[str, str] = {}
+MAX_CACHED_VERDICTS = 200_000
+
+# worker processes of langdetect, started on the first call which needs them and reused by the next ones
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_workers = 0
+_pool_lock = threading.Lock()
+# starting the pool takes longer than langdetect of fewer paragraphs than this (unless the pool is running already)
+MIN_POOL_PARAGRAPHS = 1000
+
+# profiles of langdetect, loaded in every process on its first use of langdetect
+_factory: Optional[DetectorFactory] = None
+_factory_lock = threading.Lock()
+
+
+def quick_lang(paragraph: str) -> Optional[str]:
     """
-    Function to keep only the text written in a specific language (e.g., Polish) from a larger text
+    Cheap guess of the language based on the characters and the most frequent words:
+    - 'pl' if there is any Polish-only letter,
+    - '' if there are no letters at all (numbers, punctuation) - langdetect can't detect those anyway,
+    - 'pl' or 'en' for text without letters outside ASCII with enough words typical of one of them
+      (see MIN_KNOWN_WORDS),
+    - None if we can't tell and langdetect has to decide.
     """
-    # Break the full text into separate paragraphs (based on line breaks)
-    paragraphs = text.split('\n')
-    text = []
-
-    # Go through each paragraph one by one
-    for paragraph in paragraphs:
-        if paragraph:  # Make sure the paragraph is not empty
-            try:
-                # Try to detect the language of this paragraph
-                lang = detect(paragraph)
-                # If it's written in the target language (e.g., Polish), keep it
-                if lang == target_lang:
-                    text.append(paragraph)
-            except Exception:
-                # If something goes wrong (e.g., unreadable text), just skip it
+    if not POLISH_LETTERS.isdisjoint(paragraph):
+        return 'pl'
+    if not LETTER_PATTERN.search(paragraph):
+        return ''
+    if not paragraph.isascii() and NON_ASCII_LETTER_PATTERN.search(paragraph):
+        # letters of other languages (ä, é, ř, ...)
+        return None
+    polish = english = 0
+    words = ASCII_WORD_PATTERN.findall(paragraph.lower())
+    for word in words:
+        if word in POLISH_WORDS or POLISH_LETTER_PAIRS.search(word):
+            polish += 1
+        elif word in ENGLISH_WORDS or ENGLISH_LETTER_PAIRS.search(word):
+            english += 1
+    for lang, typical, other in (('pl', polish, english), ('en', english, polish)):
+        if typical >= MIN_KNOWN_WORDS and not other and typical * MIN_WORD_SHARE >= len(words):
+            return lang
+    return None
+
+
+def _detector_factory() -> DetectorFactory:
+    """
+    Own factory of langdetect detectors with a fixed seed - langdetect is random by default, the seed gives
+    the same answer for the same text every time (without changing the seed of detectors made by anyone else).
+    """
+    global _factory
+    with _factory_lock:
+        if _factory is None:
+            factory = DetectorFactory()
+            factory.load_profile(PROFILES_DIRECTORY)
+            factory.set_seed(0)
+            _factory = factory
+        return _factory
+
+
+def _langdetect(paragraph: str) -> str:
+    try:
+        # Try to detect the language of this paragraph
+        detector = _detector_factory().create()
+        detector.append(paragraph)
+        return detector.detect()
+    except Exception:
+        # If something goes wrong (e.g., unreadable text), treat it as "no language"
+        return ''
+
+
+def _get_pool(workers: int) -> ProcessPoolExecutor:
+    """The shared pool of worker processes, started again only if a different number of workers is asked for."""
+    global _pool, _pool_workers
+    with _pool_lock:
+        if _pool is None or _pool_workers != workers:
+            if _pool is not None:
+                _pool.shutdown()
+            _pool, _pool_workers = ProcessPoolExecutor(max_workers=workers), workers
+        return _pool
+
+
+def _remember(paragraph: str, lang: str) -> None:
+    if len(_verdicts) >= MAX_CACHED_VERDICTS:
+        _verdicts.clear()
+    _verdicts[paragraph] = lang
+
+
+def detect_paragraphs_lang(paragraphs: List[str], workers: int = 1, chunksize: int = 64,
+                           executor: Optional[Executor] = None) -> List[str]:
+    """
+    Returns the language of every paragraph ('' if it has none).
+    Most paragraphs are decided by quick_lang or by the cache of earlier verdicts (at most MAX_CACHED_VERDICTS),
+    only the rest goes to langdetect - in a pool of worker processes if workers > 1 and there are at least
+    MIN_POOL_PARAGRAPHS of them (or the pool is running already).
+    The pool is kept for the next calls, or pass your own executor to run langdetect in it instead.
+    """
+    verdicts, unknown = {}, []
+    for paragraph in dict.fromkeys(paragraphs):  # every paragraph only once
+        lang = _verdicts.get(paragraph)
+        if lang is None:
+            lang = quick_lang(paragraph)
+            if lang is None:
+                unknown.append(paragraph)
                 continue
-    # Return all the paragraphs that matched the target language, combined into one text block
-    return '\n'.join(text)
+            _remember(paragraph, lang)
+        verdicts[paragraph] = lang
+
+    pool_running = _pool is not None and _pool_workers == workers
+    if executor is None and workers > 1 and (len(unknown) >= MIN_POOL_PARAGRAPHS or pool_running):
+        executor = _get_pool(workers)
+    if executor is not None and len(unknown) > chunksize:
+        langs = list(executor.map(_langdetect, unknown, chunksize=chunksize))
+    else:
+        langs = [_langdetect(paragraph) for paragraph in unknown]
+    for paragraph, lang in zip(unknown, langs):
+        _remember(paragraph, lang)
+        verdicts[paragraph] = lang
+    return [verdicts[paragraph] for paragraph in paragraphs]
+
+
+def extract_lang(text: str, target_lang: str, workers: int = 1, executor: Optional[Executor] = None) -> str:
+    """
+    Function to keep only the text written in a specific language (e.g., Polish) from a larger text
+    workers - number of processes running langdetect for paragraphs which can't be decided quickly
+    (or an executor to run it in, see detect_paragraphs_lang).
+    """
+    # Break the full text into separate paragraphs (based on line breaks) and skip the empty ones
+    paragraphs = [paragraph for paragraph in text.split('\n') if paragraph]
+    langs = detect_paragraphs_lang(paragraphs, workers, executor=executor)
+    # Keep the paragraphs written in the target language (e.g., Polish),
+    # combined into one text block
+    return '\n'.join(paragraph for paragraph, lang in zip(paragraphs, langs) if lang == target_lang)
 
-def detect_lang_with_prob(text: str) -> str:
-    return detect_langs(text)
\ No newline at end of file
+def detect_lang_with_prob(text: str) -> list:
+    detector = _detector_factory().create()
+    detector.append(text)
+    return detector.get_probabilities()
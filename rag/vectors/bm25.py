@@ -0,0 +1,118 @@
+import re
+import json
+import numpy as np
+from collections import Counter, defaultdict
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+# chunk fields searched by default - translated text and title, section title ("Art. 15") and metadata of the act
+BM25_FIELDS = ('eng_chunk', 'eng_title', 'chunk_title', 'keywords', 'display_name')
+TOKEN_PATTERN = re.compile(r'\w+')
+# "Art. 15", "article 15a", "§ 3" - kept as one token as well, so the number alone doesn't match every article
+ARTICLE_PATTERN = re.compile(r'(?:\bart(?:icle|ykuł)?\b\.?|§+)\s*(\d+[a-z]?)', re.IGNORECASE)
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase words and numbers of the text plus an "art:<number>" token for every article reference."""
+    text = text.lower()
+    return TOKEN_PATTERN.findall(text) + [f'art:{number}' for number in ARTICLE_PATTERN.findall(text)]
+
+
+def _chunk_text(chunk: dict, fields: Sequence[str]) -> str:
+    parts = []
+    for field in fields:
+        value = chunk.get(field) or ''
+        # keywords of an act are a list
+        parts.append(' '.join(map(str, value)) if isinstance(value, list) else str(value))
+    return '\n'.join(parts)
+
+
+class BM25Index:
+    """
+    Inverted index ranking chunks with BM25, for exact words which embeddings miss:
+    article numbers, names from titles, keywords of acts.
+
+    The BM25 weight of every (term, chunk) pair is computed when the index is built,
+    so a search only adds up the weights of the terms of the question.
+    ids - ids returned for the chunks, positions in the list by default (see write_chunk_store).
+    """
+
+    def __init__(self, chunks: Iterable[dict] = (), ids: Optional[Iterable[int]] = None,
+                 fields: Sequence[str] = BM25_FIELDS, k1: float = 1.5, b: float = 0.75):
+        self.fields = tuple(fields)
+        postings = defaultdict(list)  # term -> [(chunk number, term frequency)]
+        lengths = []
+        for number, chunk in enumerate(chunks):
+            tokens = tokenize(_chunk_text(chunk, self.fields))
+            lengths.append(len(tokens))
+            for term, frequency in Counter(tokens).items():
+                postings[term].append((number, frequency))
+
+        n = len(lengths)
+        self.ids = np.arange(n, dtype=np.int64) if ids is None else np.fromiter(ids, dtype=np.int64, count=n)
+        lengths = np.array(lengths, dtype=np.float32)
+        average_length = lengths.mean() if n else 1.0
+        # all postings in two flat arrays, postings of one term are at starts[term]:starts[term + 1]
+        self.terms: Dict[str, int] = {}
+        starts, chunk_numbers, weights = [0], [], []
+        for term, term_postings in postings.items():
+            numbers, frequencies = np.array(term_postings, dtype=np.float32).T
+            numbers = numbers.astype(np.int64)
+            idf = np.log(1 + (n - len(numbers) + 0.5) / (len(numbers) + 0.5))
+            norm = k1 * (1 - b + b * lengths[numbers] / average_length)
+            self.terms[term] = len(self.terms)
+            chunk_numbers.append(numbers)
+            weights.append(idf * frequencies * (k1 + 1) / (frequencies + norm))
+            starts.append(starts[-1] + len(numbers))
+        self.starts = np.array(starts, dtype=np.int64)
+        self.chunk_numbers = np.concatenate(chunk_numbers) if chunk_numbers else np.zeros(0, dtype=np.int64)
+        self.weights = np.concatenate(weights).astype(np.float32) if weights else np.zeros(0, dtype=np.float32)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def search(self, query: str, k: int = 10, mask: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Returns scores and ids of at most k best matching chunks, best first (chunks without any query term are skipped).
+        mask - optional boolean array (in the order of ids), only chunks marked True can be returned.
+        """
+        scores = np.zeros(len(self.ids), dtype=np.float32)
+        for term in set(tokenize(query)):
+            if term in self.terms:
+                t = self.terms[term]
+                start, end = self.starts[t], self.starts[t + 1]
+                scores[self.chunk_numbers[start:end]] += self.weights[start:end]
+        if mask is not None:
+            scores[~mask] = 0
+        matching = np.flatnonzero(scores)
+        if len(matching) > k:
+            matching = matching[np.argpartition(-scores[matching], k - 1)[:k]]
+        best = matching[np.argsort(-scores[matching], kind='stable')]
+        return scores[best], self.ids[best]
+
+    def save(self, path: str) -> None:
+        """Saves the index into one .npz file."""
+        np.savez(path, ids=self.ids, starts=self.starts, chunk_numbers=self.chunk_numbers, weights=self.weights,
+                 terms=np.array(json.dumps(list(self.terms))), fields=np.array(json.dumps(self.fields)))
+
+    @classmethod
+    def load(cls, path: str) -> 'BM25Index':
+        files = np.load(path)
+        index = cls.__new__(cls)
+        index.ids, index.starts = files['ids'], files['starts']
+        index.chunk_numbers, index.weights = files['chunk_numbers'], files['weights']
+        index.terms = {term: t for t, term in enumerate(json.loads(str(files['terms'])))}
+        index.fields = tuple(json.loads(str(files['fields'])))
+        return index
+
+
+def reciprocal_rank_fusion(rankings: List[Sequence[int]], k: int = 60) -> List[Tuple[int, float]]:
+    """
+    Merges rankings of ids (each best first) into one: every id gets 1 / (k + rank) from every ranking it's in.
+    Scores of different retrievers (distances, BM25) can't be compared, ranks can.
+    Returns (id, score) pairs, best first.
+    """
+    scores = defaultdict(float)
+    for ranking in rankings:
+        for rank, id_ in enumerate(ranking):
+            scores[int(id_)] += 1 / (k + rank + 1)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
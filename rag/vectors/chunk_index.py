@@ -0,0 +1,190 @@
+import os
+import json
+import sqlite3
+import hashlib
+import numpy as np
+import faiss
+from typing import Iterable, List, Optional, Tuple
+from .index import make_faiss_index, save_faiss_index, read_faiss_index
+
+
+def chunk_key(document_id: str, chunk_id: int) -> int:
+    """
+    Stable 64-bit id of a chunk, the same in every run and on every machine.
+    It's a hash of (document_id, chunk_id), limited to 63 bits because FAISS and SQLite ids are signed.
+    """
+    digest = hashlib.blake2b(f'{document_id}\x00{chunk_id}'.encode('utf-8'), digest_size=8).digest()
+    return int.from_bytes(digest, 'little') & 0x7FFF_FFFF_FFFF_FFFF
+
+
+class ChunkIndex:
+    """
+    FAISS index of chunks addressed by stable ids (see chunk_key) instead of positions, with the metadata
+    of every chunk kept next to it. Chunks of one act can be added, removed or replaced without touching
+    the rest of the index, and the order of chunks in any file doesn't matter anymore.
+
+    Files in the folder:
+    - index.faiss - the index (IndexIDMap2 around any index made by make_faiss_index),
+    - chunks.sqlite - id, document_id, chunk_id and the whole chunk dict of every indexed chunk.
+    Changes are kept in memory until save() is called.
+    version grows with every change, so caches of search results know when they are out of date.
+
+    index_type, metric and index_params are used only when the index is created (on the first add),
+    IVF indexes are trained on the embeddings of that first add. HNSW indexes can't remove vectors,
+    so they are append-only: adding chunks which are already there, remove_documents and replace_documents
+    of indexed documents raise ValueError.
+    """
+
+    def __init__(self, folder: str, index_type: str = 'flat', metric: str = 'l2', **index_params):
+        os.makedirs(folder, exist_ok=True)
+        self.folder = folder
+        self.index_path = os.path.join(folder, 'index.faiss')
+        self.index_type, self.metric, self.index_params = index_type, metric, index_params
+        self.conn = sqlite3.connect(os.path.join(folder, 'chunks.sqlite'), check_same_thread=False)
+        self.conn.execute(
+            """CREATE TABLE IF NOT EXISTS chunks (
+                   id INTEGER PRIMARY KEY,
+                   document_id TEXT NOT NULL,
+                   chunk_id INTEGER NOT NULL,
+                   metadata TEXT NOT NULL
+               )"""
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS chunks_document ON chunks (document_id)")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS info (key TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+        self.conn.commit()
+        row = self.conn.execute("SELECT value FROM info WHERE key = 'version'").fetchone()
+        self.version = row[0] if row else 0
+        self._finish_save()
+        self.index = read_faiss_index(self.index_path) if os.path.exists(self.index_path) else None
+
+    def _pending_index_path(self, version: int) -> str:
+        return f'{self.index_path}.v{version}.tmp'
+
+    def _finish_save(self) -> None:
+        """
+        Finishes a save() which crashed after committing the metadata: the index written for the committed version
+        replaces index.faiss. Indexes written for any other version were never committed and are removed.
+        """
+        committed = os.path.basename(self._pending_index_path(self.version))
+        for name in os.listdir(self.folder):
+            if name.startswith('index.faiss.v') and name.endswith('.tmp'):
+                path = os.path.join(self.folder, name)
+                if name == committed:
+                    os.replace(path, self.index_path)
+                else:
+                    os.remove(path)
+
+    def __len__(self) -> int:
+        return self.index.ntotal if self.index is not None else 0
+
+    @property
+    def append_only(self) -> bool:
+        """True for HNSW indexes, which can't remove vectors."""
+        if self.index is None:
+            return self.index_type == 'hnsw'
+        inner = faiss.downcast_index(self.index.index)
+        if isinstance(inner, faiss.IndexPreTransform):  # cosine metric
+            inner = faiss.downcast_index(inner.index)
+        return isinstance(inner, faiss.IndexHNSW)
+
+    def _remove_ids(self, ids: np.ndarray) -> None:
+        if self.append_only:
+            raise ValueError(f"{len(ids)} chunks would have to be removed, but an HNSW index can only add new ones - "
+                             "rebuild the index or use another index_type")
+        self.index.remove_ids(ids)
+
+    def _indexed(self, ids: np.ndarray) -> np.ndarray:
+        """The ids which are already in the index."""
+        ids = [int(id_) for id_ in ids]
+        found = []
+        # SQLite limits the number of parameters of one query
+        for start in range(0, len(ids), 500):
+            part = ids[start:start + 500]
+            found.extend(row[0] for row in self.conn.execute(
+                f"SELECT id FROM chunks WHERE id IN ({','.join('?' * len(part))})", part))
+        return np.array(found, dtype=np.int64)
+
+    def add(self, chunks: List[dict], embeddings: np.ndarray) -> np.ndarray:
+        """
+        Adds chunks (dicts with document_id and chunk_id) with their embeddings and returns their ids.
+        Chunks which are already in the index are replaced.
+        """
+        if not chunks:
+            return np.zeros(0, dtype=np.int64)
+        embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+        ids = np.array([chunk_key(chunk['document_id'], chunk['chunk_id']) for chunk in chunks], dtype=np.int64)
+        if self.index is None:
+            self.index = faiss.IndexIDMap2(make_faiss_index(embeddings, self.index_type, self.metric, **self.index_params))
+        else:
+            indexed = self._indexed(ids)
+            if len(indexed):
+                self._remove_ids(indexed)
+        self.index.add_with_ids(embeddings, ids)
+        self.version += 1
+        self.conn.executemany(
+            "INSERT OR REPLACE INTO chunks (id, document_id, chunk_id, metadata) VALUES (?, ?, ?, ?)",
+            [(int(id_), chunk['document_id'], chunk['chunk_id'], json.dumps(chunk, ensure_ascii=False))
+             for id_, chunk in zip(ids, chunks)]
+        )
+        return ids
+
+    def document_ids(self, document_ids: Iterable[str]) -> np.ndarray:
+        """Ids of all indexed chunks of the given documents."""
+        ids = []
+        for document_id in document_ids:
+            ids.extend(row[0] for row in self.conn.execute("SELECT id FROM chunks WHERE document_id = ?", (document_id,)))
+        return np.array(ids, dtype=np.int64)
+
+    def remove_documents(self, document_ids: Iterable[str]) -> int:
+        """Removes all chunks of the given documents and returns how many were removed."""
+        ids = self.document_ids(document_ids)
+        if len(ids) and self.index is not None:
+            self._remove_ids(ids)
+            self.conn.executemany("DELETE FROM chunks WHERE id = ?", [(int(id_),) for id_ in ids])
+            self.version += 1
+        return len(ids)
+
+    def replace_documents(self, document_ids: Iterable[str], chunks: List[dict], embeddings: np.ndarray) -> np.ndarray:
+        """
+        Removes all chunks of the given documents and adds the new ones (a new version of an act
+        may have fewer chunks than the old one, so its chunks can't simply be overwritten by id).
+        """
+        self.remove_documents(document_ids)
+        return self.add(chunks, embeddings)
+
+    def search(self, query_embeddings: np.ndarray, k: int = 3) -> Tuple[np.ndarray, np.ndarray]:
+        """Returns distances and ids of the k closest chunks for every query (-1 if there are fewer chunks)."""
+        query_embeddings = np.ascontiguousarray(query_embeddings, dtype=np.float32)
+        if self.index is None:
+            return (np.full((len(query_embeddings), k), np.inf, dtype=np.float32),
+                    np.full((len(query_embeddings), k), -1, dtype=np.int64))
+        return self.index.search(query_embeddings, k)
+
+    def get(self, ids: Iterable[int]) -> List[Optional[dict]]:
+        """Returns chunk dicts with the given ids in the same order (None for unknown ids)."""
+        ids = [int(id_) for id_ in ids]
+        found = {}
+        # SQLite limits the number of parameters of one query
+        for start in range(0, len(ids), 500):
+            part = ids[start:start + 500]
+            rows = self.conn.execute(f"SELECT id, metadata FROM chunks WHERE id IN ({','.join('?' * len(part))})", part)
+            found.update((id_, json.loads(metadata)) for id_, metadata in rows)
+        return [found.get(id_) for id_ in ids]
+
+    def save(self) -> None:
+        """
+        Writes the index and commits the metadata so that a crash at any point leaves both files of the same version:
+        the index is written to a temporary file named after the version, then the metadata is committed, and only
+        then the index replaces index.faiss. A crash before the commit leaves the old files (the temporary one is
+        removed when the folder is opened again), a crash after it is finished when the folder is opened again.
+        """
+        pending = self._pending_index_path(self.version) if self.index is not None else None
+        if pending is not None:
+            save_faiss_index(self.index, pending)
+        self.conn.execute("INSERT OR REPLACE INTO info (key, value) VALUES ('version', ?)", (self.version,))
+        self.conn.commit()
+        if pending is not None:
+            os.replace(pending, self.index_path)
+
+    def close(self) -> None:
+        self.conn.close()
@@ -0,0 +1,116 @@
+import os
+import json
+import shutil
+import numpy as np
+from typing import Iterable, List, Optional
+
+
+CURRENT = 'CURRENT'
+
+
+def _current_version(folder: str) -> Optional[str]:
+    """Name of the subfolder CURRENT points to, None for a store written in the flat layout (or no store yet)."""
+    try:
+        with open(os.path.join(folder, CURRENT), encoding='utf-8') as f:
+            return f.read().strip()
+    except FileNotFoundError:
+        return None
+
+
+def _version_number(name: str) -> int:
+    return int(name[1:]) if name.startswith('v') and name[1:].isdigit() else -1
+
+
+def write_chunk_store(folder: str, chunks: List[dict], ids: Optional[Iterable[int]] = None) -> None:
+    """
+    Saves chunks in the format read by ChunkStore:
+    - chunks.bin - JSON of every chunk, one after another, sorted by id,
+    - ids.npy - sorted ids of the chunks,
+    - offsets.npy - where each chunk starts in chunks.bin (plus the end of the last one).
+    ids - ids the chunks will be looked up by, e.g. chunk_key of every chunk (for a ChunkIndex) or,
+    by default, positions in the list (for an index built from the embeddings of chunks in that order).
+    The three files are written into a new subfolder (v1, v2, ...) and then the CURRENT file is replaced with one
+    pointing to it - a single rename, so a ChunkStore opened at any time sees either the old store or the new one.
+    Only the current and the previous version are kept. One writer at a time.
+    """
+    os.makedirs(folder, exist_ok=True)
+    ids = np.arange(len(chunks), dtype=np.int64) if ids is None else np.fromiter(ids, dtype=np.int64, count=len(chunks))
+    order = np.argsort(ids, kind='stable')
+    versions = [name for name in os.listdir(folder) if _version_number(name) >= 0]
+    version = f'v{max(map(_version_number, versions), default=0) + 1}'
+    version_folder = os.path.join(folder, version)
+    os.makedirs(version_folder)
+
+    offsets = np.zeros(len(chunks) + 1, dtype=np.int64)
+    with open(os.path.join(version_folder, 'chunks.bin'), 'wb') as f:
+        for i, position in enumerate(order):
+            record = json.dumps(chunks[position], ensure_ascii=False).encode('utf-8')
+            f.write(record)
+            offsets[i + 1] = offsets[i] + len(record)
+    np.save(os.path.join(version_folder, 'offsets.npy'), offsets)
+    np.save(os.path.join(version_folder, 'ids.npy'), ids[order])
+
+    previous = _current_version(folder)
+    with open(os.path.join(folder, f'{CURRENT}.tmp'), 'w', encoding='utf-8') as f:
+        f.write(version)
+    os.replace(os.path.join(folder, f'{CURRENT}.tmp'), os.path.join(folder, CURRENT))
+
+    # older versions (and ones left by a writer which crashed before the swap) are removed - stores which
+    # already have them open keep their memory-mapped files, the space is freed when those are closed
+    for name in versions:
+        if name != previous:
+            shutil.rmtree(os.path.join(folder, name), ignore_errors=True)
+    if previous is None:
+        # the store was in the flat layout before
+        for name in ('chunks.bin', 'offsets.npy', 'ids.npy'):
+            if os.path.exists(os.path.join(folder, name)):
+                os.remove(os.path.join(folder, name))
+
+
+class ChunkStore:
+    """
+    Read-only store of chunk dicts saved by write_chunk_store, looked up by id.
+    Nothing is read when the store is opened - all three files are memory-mapped, only the chunks
+    which are asked for are read and parsed. Worker processes opening the same store share its pages,
+    and opening it takes the same time no matter how big the corpus is.
+    The files are read from the version CURRENT points to (or from the folder itself for a store in the flat layout),
+    so an open store is not affected by write_chunk_store - open a new one to see the new chunks.
+    """
+
+    def __init__(self, folder: str):
+        version = _current_version(folder)
+        if version is not None:
+            folder = os.path.join(folder, version)
+        self.folder = folder
+        self.ids = np.load(os.path.join(folder, 'ids.npy'), mmap_mode='r')
+        self.offsets = np.load(os.path.join(folder, 'offsets.npy'), mmap_mode='r')
+        data_path = os.path.join(folder, 'chunks.bin')
+        # an empty file can't be memory-mapped
+        self.data = np.memmap(data_path, dtype=np.uint8, mode='r') if os.path.getsize(data_path) else np.zeros(0, np.uint8)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def _positions(self, ids: Iterable[int]) -> np.ndarray:
+        """Positions of ids in the store, -1 for unknown ones."""
+        if not isinstance(ids, np.ndarray):
+            ids = list(ids)
+        ids = np.asarray(ids, dtype=np.int64).ravel()
+        positions = np.searchsorted(self.ids, ids)
+        found = positions < len(self.ids)
+        found[found] = self.ids[positions[found]] == ids[found]
+        return np.where(found, positions, -1)
+
+    def __contains__(self, id_: int) -> bool:
+        return self._positions([id_])[0] >= 0
+
+    def get(self, ids: Iterable[int]) -> List[Optional[dict]]:
+        """Returns chunk dicts with the given ids in the same order (None for unknown ids, e.g. -1 returned by FAISS)."""
+        chunks = []
+        for position in self._positions(ids):
+            if position < 0:
+                chunks.append(None)
+                continue
+            start, end = self.offsets[position], self.offsets[position + 1]
+            chunks.append(json.loads(self.data[start:end].tobytes()))
+        return chunks
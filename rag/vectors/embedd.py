@@ -1,8 +1,13 @@
-from typing import List, Tuple
+from typing import List, Tuple, Optional
 import numpy as np
 from sentence_transformers import SentenceTransformer
+from .store import EmbeddingStore
 
-def embed_texts(texts: List[str], model_name: str = 'all-MiniLM-L6-v2') -> Tuple[np.ndarray, SentenceTransformer]:
+# Models loaded in this process, so their weights are read from disk only once
+_models = {}
+
+def embed_texts(texts: List[str], model_name: str = 'all-MiniLM-L6-v2',
+                store: Optional[EmbeddingStore] = None) -> Tuple[np.ndarray, SentenceTransformer]:
     """
     This function converts a list of text strings into numerical format (called embeddings),
     which makes it possible to compare the meaning of texts.
@@ -10,17 +15,29 @@ def embed_texts(texts: List[str], model_name: str = 'all-MiniLM-L6-v2') -> Tuple
     Parameters:
     - texts: a list of English sentences or phrases.
     - model_name: the name of the model used to generate the embeddings. Default is a small, efficient model.
+    - store: optional EmbeddingStore of this model - only texts which are not in it yet are encoded
+      (and added to it), the rest is read from disk.
 
     Returns:
     - An array of embeddings, each representing the meaning of a text input.
     """
     model = load_embedding_model(model_name)
-    embeddings = model.encode(texts, convert_to_numpy=True)  # Convert texts into numerical vectors
-    return embeddings, model
+    if store is None:
+        embeddings = model.encode(texts, convert_to_numpy=True)  # Convert texts into numerical vectors
+        return embeddings, model
+
+    keys, missing = store.missing(texts)
+    if missing:
+        print(f"Encoding {len(missing)} new texts, {len(texts) - len(missing)} taken from the store.")
+        new_embeddings = model.encode([texts[i] for i in missing], convert_to_numpy=True)
+        store.add([keys[i] for i in missing], new_embeddings)
+    return store.get(keys), model
 
 def load_embedding_model(model_name: str = 'all-MiniLM-L6-v2') -> SentenceTransformer:
     """
     Function loads embedding model from sentence_transformers.
+    Each model is loaded only once per process, the next calls return the same object.
     """
-    model = SentenceTransformer(model_name)
-    return model
\ No newline at end of file
+    if model_name not in _models:
+        _models[model_name] = SentenceTransformer(model_name)
+    return _models[model_name]
@@ -0,0 +1,141 @@
+import re
+import json
+import numpy as np
+import faiss
+from typing import Iterable, Optional, Tuple
+
+# metadata of acts which can be used to filter chunks, stored as codes of their values
+CATEGORY_COLUMNS = ('type', 'status', 'inForce')
+DOCUMENT_YEAR_PATTERN = re.compile(r'DU_(\d{4})_')
+
+
+def _chunk_year(chunk: dict) -> int:
+    """Year of the act of the chunk, also for chunks saved before year was added to them (from DU_<year>_<pos>.md)."""
+    if chunk.get('year'):
+        return int(chunk['year'])
+    match = DOCUMENT_YEAR_PATTERN.match(chunk.get('document_id', ''))
+    return int(match.group(1)) if match else 0
+
+
+class ChunkMetadata:
+    """
+    Columns with metadata of every chunk (year, type, status, inForce, announcementDate), kept next to an index,
+    so a search can be limited to some acts without building a separate index.
+
+    ids - ids of the chunks in the index, positions in the list by default (see write_chunk_store).
+    filters accepted by select (all given conditions must be met):
+    - years: list of years, year_from / year_to: range of years (inclusive),
+    - types, statuses: lists of allowed values of type and status,
+    - inForce: the required inForce value (e.g. 'IN_FORCE'),
+    - announced_from / announced_to: range of announcementDate ('YYYY-MM-DD', inclusive).
+    """
+
+    def __init__(self, chunks: Iterable[dict] = (), ids: Optional[Iterable[int]] = None):
+        chunks = list(chunks)
+        self.ids = np.arange(len(chunks), dtype=np.int64) if ids is None else np.fromiter(ids, dtype=np.int64, count=len(chunks))
+        self.year = np.array([_chunk_year(chunk) for chunk in chunks], dtype=np.int32)
+        # dates which are missing or can't be read become NaT and never match a date range
+        self.announced = np.array([(chunk.get('announcementDate') or '')[:10] or 'NaT' for chunk in chunks], dtype='datetime64[D]')
+        self.values, self.codes = {}, {}
+        for column in CATEGORY_COLUMNS:
+            values = sorted({str(chunk[column]) for chunk in chunks if chunk.get(column) is not None})
+            code_of = {value: code for code, value in enumerate(values)}
+            self.values[column] = values
+            self.codes[column] = np.array([code_of.get(str(chunk.get(column)), -1) for chunk in chunks], dtype=np.int32)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def _in(self, column: str, allowed: Iterable) -> np.ndarray:
+        allowed = {str(value) for value in allowed}
+        codes = [code for code, value in enumerate(self.values[column]) if value in allowed]
+        return np.isin(self.codes[column], codes)
+
+    def mask(self, filters: dict) -> np.ndarray:
+        """True for every chunk (in the order of ids) which meets all conditions of filters."""
+        mask = np.ones(len(self.ids), dtype=bool)
+        if filters.get('years'):
+            mask &= np.isin(self.year, list(filters['years']))
+        if filters.get('year_from') is not None:
+            mask &= self.year >= filters['year_from']
+        if filters.get('year_to') is not None:
+            mask &= self.year <= filters['year_to']
+        if filters.get('types'):
+            mask &= self._in('type', filters['types'])
+        if filters.get('statuses'):
+            mask &= self._in('status', filters['statuses'])
+        if filters.get('inForce') is not None:
+            mask &= self._in('inForce', [filters['inForce']])
+        if filters.get('announced_from'):
+            mask &= self.announced >= np.datetime64(filters['announced_from'], 'D')
+        if filters.get('announced_to'):
+            mask &= self.announced <= np.datetime64(filters['announced_to'], 'D')
+        return mask
+
+    def select(self, filters: dict) -> np.ndarray:
+        """Sorted ids of the chunks which meet all conditions of filters."""
+        return np.sort(self.ids[self.mask(filters)])
+
+    def save(self, path: str) -> None:
+        """Saves the columns into one .npz file."""
+        np.savez(path, ids=self.ids, year=self.year, announced=self.announced,
+                 values=np.array(json.dumps(self.values)), **{f'codes_{column}': self.codes[column] for column in CATEGORY_COLUMNS})
+
+    @classmethod
+    def load(cls, path: str) -> 'ChunkMetadata':
+        files = np.load(path)
+        metadata = cls.__new__(cls)
+        metadata.ids, metadata.year, metadata.announced = files['ids'], files['year'], files['announced']
+        metadata.values = json.loads(str(files['values']))
+        metadata.codes = {column: files[f'codes_{column}'] for column in CATEGORY_COLUMNS}
+        return metadata
+
+
+def filtered_search(index, query_embeddings: np.ndarray, k: int, ids: np.ndarray,
+                    subset_fraction: float = 0.2, postfilter_fraction: float = 0.5) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Searches only among the chunks with the given ids (sorted), returns distances and ids like index.search.
+    index - FAISS index or ChunkIndex.
+    - For flat indexes, when at most subset_fraction of all vectors is allowed, only those vectors are read from
+      the index and compared with the queries - the fewer acts pass the filter, the faster the search.
+    - When more than postfilter_fraction is allowed, a normal search for a few times more than k chunks
+      is done first and the chunks which are not allowed are dropped (checking the filter for every vector
+      would cost more than it saves). If too few are left, the next option is used.
+    - Otherwise FAISS skips vectors which are not allowed (IDSelector), which still avoids computing their distances.
+    """
+    faiss_index = index if isinstance(index, faiss.Index) else index.index  # ChunkIndex keeps a FAISS index
+    if faiss_index is None or len(ids) == 0:
+        return (np.full((len(query_embeddings), k), np.inf, dtype=np.float32),
+                np.full((len(query_embeddings), k), -1, dtype=np.int64))
+    query_embeddings = np.ascontiguousarray(query_embeddings, dtype=np.float32)
+    base = faiss.downcast_index(faiss_index.index) if isinstance(faiss_index, faiss.IndexIDMap2) else faiss_index
+
+    if isinstance(base, faiss.IndexFlat) and len(ids) <= subset_fraction * faiss_index.ntotal:
+        vectors = faiss_index.reconstruct_batch(ids)
+        D, I = faiss.knn(query_embeddings, vectors, min(k, len(ids)), metric=base.metric_type)
+        I = ids[I]
+        if I.shape[1] < k:
+            # fewer allowed chunks than k - fill up like FAISS does
+            missing = k - I.shape[1]
+            D = np.hstack([D, np.full((len(D), missing), np.inf, dtype=np.float32)])
+            I = np.hstack([I, np.full((len(I), missing), -1, dtype=np.int64)])
+        return D, I
+
+    fraction = len(ids) / faiss_index.ntotal
+    if fraction > postfilter_fraction:
+        fetch_k = min(faiss_index.ntotal, int(np.ceil(2 * k / fraction)))
+        D, I = faiss_index.search(query_embeddings, fetch_k)
+        allowed = np.isin(I, ids)
+        if (allowed.sum(axis=1) >= k).all():
+            # allowed results keep their order, take the first k of every row
+            order = np.argsort(~allowed, axis=1, kind='stable')[:, :k]
+            return np.take_along_axis(D, order, axis=1), np.take_along_axis(I, order, axis=1)
+
+    selector = faiss.IDSelectorBatch(ids)
+    try:
+        # IVF indexes need their own parameters, which override nprobe set on the index
+        params = faiss.SearchParametersIVF(sel=selector, nprobe=faiss.extract_index_ivf(faiss_index).nprobe)
+    except RuntimeError:
+        params = faiss.SearchParameters(sel=selector)
+    return faiss_index.search(query_embeddings, k, params=params)
+
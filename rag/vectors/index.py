@@ -1,22 +1,111 @@
 import numpy as np
 import faiss
+from typing import Optional
 
-def create_faiss_index(embeddings: np.ndarray) -> faiss.IndexFlatL2:
+# index types known to create_faiss_index
+INDEX_TYPES = ('flat', 'ivf_flat', 'ivf_pq', 'hnsw')
+# cosine is inner product of normalised vectors
+METRICS = {'l2': faiss.METRIC_L2, 'ip': faiss.METRIC_INNER_PRODUCT, 'cosine': faiss.METRIC_INNER_PRODUCT}
+
+
+def make_faiss_index(embeddings: np.ndarray, index_type: str = 'flat', metric: str = 'l2',
+                     nlist: Optional[int] = None, pq_m: int = 16, pq_bits: int = 8, hnsw_m: int = 32,
+                     ef_construction: int = 40, train_size: int = 50000, seed: int = 0) -> faiss.Index:
+    """
+    Creates an empty index of the given type (see create_faiss_index), trained on embeddings if it needs training.
+    Embeddings are not added to it.
+    IVF indexes can't have more clusters than training vectors, so nlist is lowered to their number if needed.
+    """
+    if index_type not in INDEX_TYPES:
+        raise ValueError(f"Unknown index type {index_type}, use one of {INDEX_TYPES}")
+    if metric not in METRICS:
+        raise ValueError(f"Unknown metric {metric}, use one of {tuple(METRICS)}")
+    embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+    dim = embeddings.shape[1]  # Get the size of each embedding vector
+    metric_type = METRICS[metric]
+    n_train = min(len(embeddings), train_size)
+    if index_type.startswith('ivf') and n_train == 0:
+        raise ValueError(f"{index_type} index needs embeddings to train on, got none")
+    if index_type == 'ivf_pq':
+        if dim % pq_m:
+            raise ValueError(f"pq_m ({pq_m}) must divide the dimension of embeddings ({dim})")
+        if n_train < 2 ** pq_bits:
+            raise ValueError(f"ivf_pq with pq_bits={pq_bits} needs at least {2 ** pq_bits} training vectors, "
+                             f"got {n_train} - use smaller pq_bits or another index type")
+
+    if index_type == 'flat':
+        # Create a flat index that compares the query with every vector
+        index = faiss.IndexFlatL2(dim) if metric_type == faiss.METRIC_L2 else faiss.IndexFlatIP(dim)
+    elif index_type == 'hnsw':
+        index = faiss.IndexHNSWFlat(dim, hnsw_m, metric_type)
+        index.hnsw.efConstruction = ef_construction
+    else:
+        nlist = min(nlist or max(1, int(4 * np.sqrt(len(embeddings)))), n_train)
+        quantizer = faiss.IndexFlatL2(dim) if metric_type == faiss.METRIC_L2 else faiss.IndexFlatIP(dim)
+        if index_type == 'ivf_flat':
+            index = faiss.IndexIVFFlat(quantizer, dim, nlist, metric_type)
+        else:
+            index = faiss.IndexIVFPQ(quantizer, dim, nlist, pq_m, pq_bits, metric_type)
+
+    if metric == 'cosine':
+        # normalisation becomes part of the index, it's saved and applied to queries as well
+        index = faiss.IndexPreTransform(faiss.NormalizationTransform(dim, 2.0), index)
+
+    if not index.is_trained:
+        # training only needs a sample, which is much faster for big corpora
+        sample = embeddings
+        if len(embeddings) > train_size:
+            rng = np.random.default_rng(seed)
+            sample = embeddings[np.sort(rng.choice(len(embeddings), train_size, replace=False))]
+        index.train(sample)
+    return index
+
+
+def create_faiss_index(embeddings: np.ndarray, index_type: str = 'flat', metric: str = 'l2',
+                       nlist: Optional[int] = None, pq_m: int = 16, pq_bits: int = 8, hnsw_m: int = 32,
+                       ef_construction: int = 40, train_size: int = 50000, seed: int = 0) -> faiss.Index:
     """
     This function builds a searchable index from the text embeddings using FAISS,
     which allows for fast similarity searches.
 
     Parameters:
     - embeddings: the numerical representations of text.
+    - index_type: how vectors are searched:
+        'flat' - compares the query with every vector (exact, cost grows with the number of vectors),
+        'ivf_flat' - vectors are split into nlist clusters and only the nprobe closest clusters are searched,
+        'ivf_pq' - like ivf_flat, but vectors are compressed to pq_m codes of pq_bits bits (much less memory),
+        'hnsw' - graph of neighbours with hnsw_m links per vector, no training needed.
+    - metric: 'l2' (Euclidean distance), 'ip' (inner product) or 'cosine'. For 'cosine' the index normalises
+      every vector it gets (when adding and when searching), so queries can be passed as they are.
+    - nlist: number of clusters of IVF indexes, by default about 4 * sqrt(number of vectors),
+      at most the number of training vectors.
+    - pq_m, pq_bits: codes of ivf_pq - pq_m must divide the dimension, and at least 2 ** pq_bits
+      training vectors are needed (ValueError otherwise).
+    - train_size: IVF indexes learn their clusters from a random sample of at most that many vectors.
+
+    Use set_search_params to trade speed for recall (nprobe for IVF, ef_search for HNSW).
 
     Returns:
     - A FAISS index ready for searching similar texts.
     """
-    dim = embeddings.shape[1]  # Get the size of each embedding vector
-    index = faiss.IndexFlatL2(dim)  # Create a flat index that uses Euclidean distance (L2) to measure similarity
-    index.add(embeddings)  # Add the embeddings to the index
+    index = make_faiss_index(embeddings, index_type, metric, nlist, pq_m, pq_bits, hnsw_m,
+                             ef_construction, train_size, seed)
+    index.add(np.ascontiguousarray(embeddings, dtype=np.float32))  # Add the embeddings to the index
     return index
 
+
+def set_search_params(index: faiss.Index, nprobe: Optional[int] = None, ef_search: Optional[int] = None) -> None:
+    """
+    Sets search-time parameters of an index (also if it's wrapped, e.g. for cosine metric):
+    - nprobe: number of clusters searched by IVF indexes (more - better recall, slower),
+    - ef_search: size of the candidate list of HNSW indexes (more - better recall, slower).
+    """
+    params = faiss.ParameterSpace()
+    if nprobe is not None:
+        params.set_index_parameter(index, 'nprobe', nprobe)
+    if ef_search is not None:
+        params.set_index_parameter(index, 'efSearch', ef_search)
+
 def save_faiss_index(faiss_index, index_path) -> None:
     """
     This function saves the FAISS index and the associated texts to files so they can be reused later.
@@ -29,9 +118,16 @@ def save_faiss_index(faiss_index, index_path) -> None:
     """
     faiss.write_index(faiss_index, index_path)  # Save the index to a file
 
-def read_faiss_index(index_path: str):
+def read_faiss_index(index_path: str, mmap: bool = False):
     """
     Reads faiss index from a file
+    With mmap=True the vectors are not copied into memory - the file is memory-mapped, so opening is almost
+    instant and processes which open the same file share its pages. Such an index is read-only
+    (don't add or remove vectors), write a new file and open it again instead.
     """
-    index = faiss.read_index(index_path)
-    return index
\ No newline at end of file
+    if mmap:
+        # IO_FLAG_MMAP_IFC maps the vectors of every index type (older FAISS only has IO_FLAG_MMAP for IVF lists)
+        index = faiss.read_index(index_path, getattr(faiss, 'IO_FLAG_MMAP_IFC', faiss.IO_FLAG_MMAP))
+    else:
+        index = faiss.read_index(index_path)
+    return index
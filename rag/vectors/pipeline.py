@@ -0,0 +1,149 @@
+import os
+import numpy as np
+import faiss
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from typing import List, Optional, Tuple
+from .embedd import load_embedding_model
+
+
+# rough number of characters per token of the embedding models we use (English text)
+CHARS_PER_TOKEN = 4
+
+
+def estimate_tokens(texts: List[str], max_seq_length: int) -> np.ndarray:
+    """
+    Estimated number of tokens of every text, capped at max_seq_length (longer texts are truncated by the model).
+    Running the tokenizer just to sort texts costs about as much as what better batches save,
+    while the length in characters is free and orders texts almost the same way.
+    """
+    lengths = np.array([len(text) for text in texts]) // CHARS_PER_TOKEN + 2  # + [CLS] and [SEP]
+    return np.minimum(lengths, max_seq_length)
+
+
+def make_batches(lengths: np.ndarray, token_budget: int = 16384, max_batch_size: int = 256) -> List[np.ndarray]:
+    """
+    Splits texts into batches of similar length. Texts are sorted by their (estimated) number of tokens, so short texts
+    are not padded to the length of long ones, and a batch grows until batch size * longest text
+    would exceed token_budget - short texts go in big batches, long texts in small ones.
+    Returns positions of texts in every batch.
+    """
+    order = np.argsort(lengths, kind='stable')
+    batches, start = [], 0
+    for end in range(1, len(order) + 1):
+        # lengths are sorted, so the last text is the longest one in the batch
+        if end - start > 1 and ((end - start) * lengths[order[end - 1]] > token_budget or end - start > max_batch_size):
+            batches.append(order[start:end - 1])
+            start = end - 1
+    if start < len(order):
+        batches.append(order[start:])
+    return batches
+
+
+# model of the current worker process (see _init_worker)
+_worker_model = None
+
+
+def _init_worker(model_name: str, threads: int) -> None:
+    import torch
+    global _worker_model
+    # every worker gets its share of cores, so they don't fight for them
+    torch.set_num_threads(threads)
+    _worker_model = load_embedding_model(model_name)
+
+
+def _encode(model, texts: List[str]) -> np.ndarray:
+    return model.encode(texts, batch_size=len(texts), convert_to_numpy=True).astype(np.float32)
+
+
+def _encode_in_worker(task: Tuple[np.ndarray, List[str]]) -> Tuple[np.ndarray, np.ndarray]:
+    positions, texts = task
+    return positions, _encode(_worker_model, texts)
+
+
+class _IndexFeeder:
+    """
+    Adds embeddings to the index while the rest is still being computed.
+    An IndexIDMap gets every batch as soon as it's done, with positions of its texts as ids.
+    Other indexes number vectors in the order they are added, so rows are added in the original order of texts,
+    as soon as all earlier ones are done (add_block rows at a time at most).
+    """
+
+    def __init__(self, index: faiss.Index, embeddings: np.ndarray, add_block: int):
+        self.index, self.embeddings, self.add_block = index, embeddings, add_block
+        self.with_ids = isinstance(index, faiss.IndexIDMap)
+        self.done = np.zeros(len(embeddings), dtype=bool)
+        self.added = 0  # rows before it are in the index
+
+    def batch_done(self, positions: np.ndarray) -> None:
+        if self.with_ids:
+            self.index.add_with_ids(np.ascontiguousarray(self.embeddings[positions]), positions.astype(np.int64))
+            return
+        self.done[positions] = True
+        while self.added < len(self.done):
+            block = self.done[self.added:self.added + self.add_block]
+            end = self.added + (len(block) if block.all() else int(np.argmin(block)))
+            if end == self.added:
+                break
+            self.index.add(np.ascontiguousarray(self.embeddings[self.added:end]))
+            self.added = end
+
+
+def embed_stream(texts: List[str],
+                 model_name: str = 'all-MiniLM-L6-v2',
+                 output_path: Optional[str] = None,
+                 index: Optional[faiss.Index] = None,
+                 token_budget: int = 16384,
+                 max_batch_size: int = 256,
+                 workers: int = 1,
+                 add_block: int = 10000) -> np.ndarray:
+    """
+    Embeds texts batch by batch, with batches made of texts of similar length (see make_batches).
+
+    Parameters:
+    - token_budget, max_batch_size: limits of one batch - its (estimated) number of tokens with padding
+      and its number of texts.
+    - output_path: if given, embeddings are written straight into a .npy file opened as a memory-mapped array,
+      so the whole matrix never has to fit in RAM (the returned array is that memory map).
+    - index: optional FAISS index - embeddings are added to it while the next batches are computed
+      (see _IndexFeeder, vector i is the embedding of texts[i]).
+    - workers: number of processes encoding batches in parallel, each with its own copy of the model
+      and an equal share of CPU threads. At most 2 * workers batches are in flight at any time.
+
+    Returns an array of embeddings in the same order as texts.
+    """
+    model = load_embedding_model(model_name)
+    batches = make_batches(estimate_tokens(texts, model.max_seq_length), token_budget, max_batch_size)
+    # newer sentence-transformers renamed the method
+    dim = (getattr(model, 'get_embedding_dimension', None) or model.get_sentence_embedding_dimension)()
+    if output_path:
+        embeddings = np.lib.format.open_memmap(output_path, mode='w+', dtype=np.float32, shape=(len(texts), dim))
+    else:
+        embeddings = np.empty((len(texts), dim), dtype=np.float32)
+    feeder = _IndexFeeder(index, embeddings, add_block) if index is not None else None
+
+    def store(positions: np.ndarray, batch_embeddings: np.ndarray) -> None:
+        embeddings[positions] = batch_embeddings
+        if feeder is not None:
+            feeder.batch_done(positions)
+
+    if workers <= 1:
+        for positions in batches:
+            store(positions, _encode(model, [texts[i] for i in positions]))
+    else:
+        threads = max(1, (os.cpu_count() or 1) // workers)
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(model_name, threads)) as executor:
+            pending = set()
+            for positions in batches:
+                # don't send all texts at once, keep only a few batches in flight
+                if len(pending) >= 2 * workers:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        store(*future.result())
+                pending.add(executor.submit(_encode_in_worker, (positions, [texts[i] for i in positions])))
+            for future in pending:
+                store(*future.result())
+
+    if output_path:
+        embeddings.flush()
+    return embeddings
@@ -0,0 +1,168 @@
+import time
+import numpy as np
+from typing import List, Optional, Union
+from sentence_transformers import SentenceTransformer
+from ..llms.context import prepare_chunks
+from .bm25 import BM25Index, reciprocal_rank_fusion
+from .filters import ChunkMetadata, filtered_search
+from ..llms.query_cache import QueryCache, normalise_query
+
+
+class Retriever:
+    """
+    Finds the chunks closest to questions. Everything which depends only on the corpus is prepared once,
+    so the cost of one search doesn't grow with the number of chunks (for a flat index only the FAISS search does).
+
+    Parameters:
+    - index: FAISS index or ChunkIndex (anything with search(embeddings, k)).
+    - embedding_model: the model used to embed the chunks.
+    - chunks: where the found chunks are taken from:
+        a list of chunk dicts in the order of the index (like data of rag_search),
+        or a ChunkStore / ChunkIndex (anything with get(ids)) if the index returns chunk ids.
+    - lexical: optional BM25Index with the same ids as the index. Then fetch_k chunks (4 * k by default)
+      are found by each of them and their rankings are merged with reciprocal rank fusion, so chunks with
+      the exact article number or title of the question get to the top even if their embeddings are not the closest.
+    - metadata: optional ChunkMetadata with the same ids as the index, needed to search with filters
+      (see ChunkMetadata for the accepted conditions).
+    - cache: optional QueryCache - embeddings of questions asked before and chunks found for them are reused
+      (until the version of the index changes, see index_version).
+
+    Found chunks are dicts with "chunk" and "title" (like get_context_chunks returns), plus "id" and "score"
+    (distance from the index, or the fused score if lexical is used).
+    Time spent in every stage of the last call is kept in last_timings (milliseconds).
+    """
+
+    def __init__(self, index, embedding_model: SentenceTransformer, chunks: Union[list, object],
+                 lexical: Optional[BM25Index] = None, fetch_k: Optional[int] = None, rrf_k: int = 60,
+                 metadata: Optional[ChunkMetadata] = None, cache: Optional[QueryCache] = None):
+        self.index = index
+        self.metadata = metadata
+        self.cache = cache
+        self.lexical, self.fetch_k, self.rrf_k = lexical, fetch_k, rrf_k
+        self.embedding_model = embedding_model
+        self.store = None if isinstance(chunks, list) else chunks
+        self.data = chunks if isinstance(chunks, list) else None
+        self._texts = self._titles = None
+        self.last_timings = {}
+        self._reloads = 0
+
+    def _lookup(self, ids: np.ndarray) -> List[dict]:
+        """Chunk and title of every id (ids found by FAISS, -1 means "nothing found")."""
+        if self.store is not None:
+            return [{"chunk": item.get('eng_chunk', ''), "title": item.get('eng_title', 'No title available')}
+                    if item is not None else None for item in self.store.get(ids)]
+        if self._texts is None:
+            # Break data into chunks and get titles - only once, not for every question
+            self._texts, self._titles = prepare_chunks(self.data)
+        return [{"chunk": self._texts[i], "title": self._titles[i]} if i >= 0 else None for i in ids]
+
+    def reload(self, index=None, chunks: Union[list, object, None] = None, lexical: Optional[BM25Index] = None,
+               metadata: Optional[ChunkMetadata] = None) -> None:
+        """
+        Replaces the given parts of the corpus (e.g. read again after sync_corpus), so cached search results are dropped.
+        Call it without arguments after changing a plain FAISS index in place.
+        """
+        if index is not None:
+            self.index = index
+        if chunks is not None:
+            self.store = None if isinstance(chunks, list) else chunks
+            self.data = chunks if isinstance(chunks, list) else None
+            self._texts = self._titles = None
+        if lexical is not None:
+            self.lexical = lexical
+        if metadata is not None:
+            self.metadata = metadata
+        self._reloads += 1
+
+    def index_version(self) -> tuple:
+        """
+        Version of the searched corpus: changes with every reload, when another index object is used,
+        and with the version of a ChunkIndex (a plain FAISS index has none, so the number of its vectors is used).
+        """
+        version = getattr(self.index, 'version', None)
+        return self._reloads, id(self.index), version if version is not None else self.index.ntotal
+
+    def _encode(self, queries: List[str]) -> np.ndarray:
+        """Embeddings of the questions, only questions not found in the cache go to the model."""
+        if self.cache is None:
+            return np.ascontiguousarray(self.embedding_model.encode(queries, convert_to_numpy=True), dtype=np.float32)
+        keys = [normalise_query(query) for query in queries]
+        found = {key: self.cache.embeddings.get(key) for key in dict.fromkeys(keys)}
+        missing = [key for key, embedding in found.items() if embedding is None]
+        if missing:
+            # the first question with a given key is embedded (questions with the same key differ only in case and spaces)
+            texts = [queries[keys.index(key)] for key in missing]
+            for key, embedding in zip(missing, self.embedding_model.encode(texts, convert_to_numpy=True)):
+                found[key] = np.asarray(embedding, dtype=np.float32)
+                self.cache.embeddings.put(key, found[key])
+        return np.stack([found[key] for key in keys])
+
+    def _rank(self, queries: List[str], query_embeddings: np.ndarray, k: int, filters: Optional[dict]) -> List[dict]:
+        """id -> score of the k best chunks of every question, best first."""
+        fetch_k = max(k, self.fetch_k or 4 * k) if self.lexical is not None else k
+        lexical_mask = None
+        if filters:
+            if self.metadata is None:
+                raise ValueError("Retriever needs metadata to search with filters")
+            allowed = self.metadata.select(filters)
+            D, I = filtered_search(self.index, query_embeddings, fetch_k, allowed)
+            if self.lexical is not None:
+                lexical_mask = np.isin(self.lexical.ids, allowed)
+        else:
+            D, I = self.index.search(query_embeddings, fetch_k)
+        searched = time.perf_counter()
+
+        rankings = []
+        for query, scores, ids in zip(queries, D, I):
+            # id -> score, best first (-1 means FAISS found fewer than fetch_k chunks)
+            ranking = {int(id_): float(score) for score, id_ in zip(scores, ids) if id_ >= 0}
+            if self.lexical is not None:
+                lexical_ids = self.lexical.search(query, fetch_k, lexical_mask)[1]
+                ranking = dict(reciprocal_rank_fusion([list(ranking), lexical_ids], self.rrf_k)[:k])
+            rankings.append(ranking)
+        self.last_timings['lexical_ms'] = (time.perf_counter() - searched) * 1000
+        return rankings
+
+    def search_batch(self, queries: List[str], k: int = 3, filters: Optional[dict] = None) -> List[List[dict]]:
+        """
+        Returns the k closest chunks of every question, in order from the closest one, without duplicates.
+        filters - optional conditions on the metadata of acts (e.g. {'year_from': 2020, 'inForce': 'IN_FORCE'}),
+        only chunks which meet them are searched.
+        """
+        start = time.perf_counter()
+        self.last_timings = {'lexical_ms': 0.0}
+        version = self.index_version()
+        if self.cache is not None:
+            self.cache.check_index_version(version)
+        # all questions are embedded and searched in one call
+        query_embeddings = self._encode(queries)
+        encoded = time.perf_counter()
+
+        rankings = [None] * len(queries)
+        keys = [None] * len(queries)
+        if self.cache is not None:
+            for i, embedding in enumerate(query_embeddings):
+                keys[i] = self.cache.retrieval_key(embedding, k, filters, version)
+                rankings[i] = self.cache.retrievals.get(keys[i])
+        todo = [i for i, ranking in enumerate(rankings) if ranking is None]
+        if todo:
+            for i, ranking in zip(todo, self._rank([queries[i] for i in todo], query_embeddings[todo], k, filters)):
+                rankings[i] = ranking
+                if self.cache is not None:
+                    self.cache.retrievals.put(keys[i], ranking)
+        searched = time.perf_counter()
+
+        results = []
+        for ranking in rankings:
+            chunks = self._lookup(np.array(list(ranking), dtype=np.int64))
+            results.append([{**chunk, "id": id_, "score": score}
+                            for (id_, score), chunk in zip(ranking.items(), chunks) if chunk is not None])
+        done = time.perf_counter()
+        self.last_timings.update({'encode_ms': (encoded - start) * 1000,
+                                  'search_ms': (searched - encoded) * 1000 - self.last_timings['lexical_ms'],
+                                  'lookup_ms': (done - searched) * 1000, 'total_ms': (done - start) * 1000})
+        return results
+
+    def search(self, query: str, k: int = 3, filters: Optional[dict] = None) -> List[dict]:
+        """Returns the k closest chunks of one question (see search_batch)."""
+        return self.search_batch([query], k, filters)[0]
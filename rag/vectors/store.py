@@ -0,0 +1,106 @@
+import os
+import re
+import json
+import hashlib
+import numpy as np
+from typing import List, Tuple
+
+
+def content_hash(text: str) -> str:
+    """Hash of the text, used as its id in the store."""
+    return hashlib.blake2b(text.encode('utf-8'), digest_size=16).hexdigest()
+
+
+class EmbeddingStore:
+    """
+    Embeddings of one model saved on disk, so texts which didn't change are never encoded again.
+
+    For every model there are three files in the folder:
+    - <model>.<dtype>.bin - matrix of embeddings, opened as a memory-mapped array (only used rows are read),
+    - <model>.ids - content hash of the text in every row (one per line),
+    - <model>.json - dimension and type of the embeddings.
+    New embeddings are appended at the end of the files. float16 halves the size on disk at a small cost in precision.
+    """
+
+    def __init__(self, folder: str, model_name: str, dtype: str = 'float32'):
+        os.makedirs(folder, exist_ok=True)
+        name = re.sub(r'[^\w.-]', '_', model_name)
+        self.model_name = model_name
+        self.meta_path = os.path.join(folder, f'{name}.json')
+        self.ids_path = os.path.join(folder, f'{name}.ids')
+        self.dim = None
+        self.dtype = np.dtype(dtype)
+        if os.path.exists(self.meta_path):
+            with open(self.meta_path, 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+            self.dim, self.dtype = meta['dim'], np.dtype(meta['dtype'])
+        self.matrix_path = os.path.join(folder, f'{name}.{self.dtype.name}.bin')
+
+        self.rows = {}
+        if os.path.exists(self.ids_path):
+            with open(self.ids_path, 'r', encoding='utf-8') as f:
+                content = f.read()
+            hashes = content.split()
+            if content and not content.endswith('\n'):
+                # the last id was not written completely, forget it (its row will be overwritten)
+                hashes = hashes[:-1]
+                with open(self.ids_path, 'w', encoding='utf-8') as f:
+                    f.write(''.join(key + '\n' for key in hashes))
+            # rows are written before their ids, so after a crash there may be rows without an id, never the opposite
+            for row, key in enumerate(hashes[:self._rows_on_disk()]):
+                self.rows[key] = row
+        self._open()
+
+    def _rows_on_disk(self) -> int:
+        if self.dim is None or not os.path.exists(self.matrix_path):
+            return 0
+        return os.path.getsize(self.matrix_path) // (self.dim * self.dtype.itemsize)
+
+    def _open(self) -> None:
+        self.matrix = None
+        if self.rows:
+            self.matrix = np.memmap(self.matrix_path, dtype=self.dtype, mode='r', shape=(len(self.rows), self.dim))
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.rows
+
+    def add(self, keys: List[str], embeddings: np.ndarray) -> None:
+        """Appends embeddings of texts with the given content hashes (already stored ones are skipped)."""
+        new, seen = [], set()
+        for i, key in enumerate(keys):
+            if key not in self.rows and key not in seen:
+                seen.add(key)
+                new.append(i)
+        if not new:
+            return
+        if self.dim is None:
+            self.dim = embeddings.shape[1]
+            with open(self.meta_path, 'w', encoding='utf-8') as f:
+                json.dump({'model_name': self.model_name, 'dim': self.dim, 'dtype': self.dtype.name}, f)
+        # drop rows without ids left by an interrupted run, so rows and ids stay aligned
+        with open(self.matrix_path, 'ab') as f:
+            f.truncate(len(self.rows) * self.dim * self.dtype.itemsize)
+            f.write(np.ascontiguousarray(embeddings[new], dtype=self.dtype).tobytes())
+        with open(self.ids_path, 'a', encoding='utf-8') as f:
+            for i in new:
+                self.rows[keys[i]] = len(self.rows)
+                f.write(keys[i] + '\n')
+        self._open()
+
+    def get(self, keys: List[str]) -> np.ndarray:
+        """Returns a float32 matrix with the embeddings of the given content hashes, in the same order."""
+        if not keys:
+            return np.zeros((0, self.dim or 0), dtype=np.float32)
+        return np.asarray(self.matrix[[self.rows[key] for key in keys]], dtype=np.float32)
+
+    def missing(self, texts: List[str]) -> Tuple[List[str], List[int]]:
+        """Returns content hashes of all texts and positions of the (unique) texts which are not in the store yet."""
+        keys = [content_hash(text) for text in texts]
+        positions = {}
+        for i, key in enumerate(keys):
+            if key not in self.rows:
+                positions.setdefault(key, i)
+        return keys, list(positions.values())
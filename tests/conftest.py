@@ -0,0 +1,43 @@
+import hashlib
+import string
+import numpy as np
+import pytest
+import torch
+from tokenizers import Tokenizer, models, decoders
+from transformers import GPT2Config, GPT2LMHeadModel, PreTrainedTokenizerFast, pipeline
+
+DIM = 16
+
+
+class FakeEncoder:
+    """Stands in for a SentenceTransformer: every word adds a fixed random vector, so similar texts are close."""
+
+    max_seq_length = 256
+
+    def get_sentence_embedding_dimension(self) -> int:
+        return DIM
+
+    def encode(self, texts, convert_to_numpy=True, **kwargs) -> np.ndarray:
+        embeddings = np.zeros((len(texts), DIM), dtype=np.float32)
+        for row, text in zip(embeddings, texts):
+            for word in text.lower().split():
+                seed = int.from_bytes(hashlib.blake2b(word.encode('utf-8'), digest_size=4).digest(), 'little')
+                row += np.random.default_rng(seed).standard_normal(DIM).astype(np.float32)
+        return embeddings
+
+
+@pytest.fixture
+def encoder() -> FakeEncoder:
+    return FakeEncoder()
+
+
+@pytest.fixture(scope='session')
+def qa_pipeline():
+    """A tiny random GPT-2 with one token per character, built in memory."""
+    vocab = {char: i for i, char in enumerate(['<eos>'] + sorted(set(string.printable)))}
+    tokenizer = Tokenizer(models.BPE(vocab=vocab, merges=[]))
+    tokenizer.decoder = decoders.Fuse()
+    torch.manual_seed(0)
+    model = GPT2LMHeadModel(GPT2Config(vocab_size=len(vocab), n_positions=1024, n_embd=32, n_layer=2, n_head=2))
+    return pipeline('text-generation', model=model.eval(), device='cpu',
+                    tokenizer=PreTrainedTokenizerFast(tokenizer_object=tokenizer, eos_token='<eos>'))
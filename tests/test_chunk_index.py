@@ -0,0 +1,109 @@
+import os
+import numpy as np
+import pytest
+
+from rag.vectors.chunk_index import ChunkIndex, chunk_key
+from rag.vectors.index import save_faiss_index
+
+
+def make_chunks(document_id, texts):
+    return [{'document_id': document_id, 'chunk_id': i, 'eng_chunk': text} for i, text in enumerate(texts)]
+
+
+def add(index, encoder, chunks):
+    return index.add(chunks, encoder.encode([chunk['eng_chunk'] for chunk in chunks]))
+
+
+def test_add_and_search(tmp_path, encoder):
+    index = ChunkIndex(str(tmp_path))
+    ids = add(index, encoder, make_chunks('a.md', ['tax on income', 'waste disposal']))
+    assert list(ids) == [chunk_key('a.md', 0), chunk_key('a.md', 1)]
+    _, found = index.search(encoder.encode(['waste disposal']), k=1)
+    assert index.get(found[0])[0]['eng_chunk'] == 'waste disposal'
+
+
+def test_add_existing_chunk_replaces_it(tmp_path, encoder):
+    index = ChunkIndex(str(tmp_path))
+    add(index, encoder, make_chunks('a.md', ['old text', 'other']))
+    version = index.version
+    add(index, encoder, make_chunks('a.md', ['new text']))
+    assert len(index) == 2
+    assert index.get([chunk_key('a.md', 0)])[0]['eng_chunk'] == 'new text'
+    assert index.version > version
+
+
+def test_replace_documents_drops_chunks_of_the_old_version(tmp_path, encoder):
+    index = ChunkIndex(str(tmp_path))
+    add(index, encoder, make_chunks('a.md', ['one', 'two', 'three']))
+    add(index, encoder, make_chunks('b.md', ['other act']))
+    chunks = make_chunks('a.md', ['one changed'])
+    index.replace_documents(['a.md'], chunks, encoder.encode(['one changed']))
+    assert len(index) == 2
+    assert index.get([chunk_key('a.md', 1), chunk_key('a.md', 2)]) == [None, None]
+    _, found = index.search(encoder.encode(['three']), k=5)
+    assert set(found[0][found[0] >= 0]) == {chunk_key('a.md', 0), chunk_key('b.md', 0)}
+
+
+def test_changes_are_kept_after_save(tmp_path, encoder):
+    index = ChunkIndex(str(tmp_path))
+    add(index, encoder, make_chunks('a.md', ['one', 'two']))
+    index.remove_documents(['a.md'])
+    add(index, encoder, make_chunks('b.md', ['other act']))
+    index.save()
+    index.close()
+
+    reopened = ChunkIndex(str(tmp_path))
+    assert len(reopened) == 1
+    assert reopened.version == index.version
+    assert reopened.get([chunk_key('b.md', 0)])[0]['eng_chunk'] == 'other act'
+
+
+@pytest.mark.parametrize('metric', ['l2', 'cosine'])
+def test_hnsw_is_append_only(tmp_path, encoder, metric):
+    index = ChunkIndex(str(tmp_path), index_type='hnsw', metric=metric)
+    add(index, encoder, make_chunks('a.md', ['one', 'two']))
+    add(index, encoder, make_chunks('b.md', ['other act']))
+    assert len(index) == 3 and index.append_only
+    with pytest.raises(ValueError, match='HNSW'):
+        add(index, encoder, make_chunks('a.md', ['one changed']))
+    with pytest.raises(ValueError, match='HNSW'):
+        index.replace_documents(['a.md'], [], np.zeros((0, 16), dtype=np.float32))
+    index.save()
+    assert ChunkIndex(str(tmp_path)).append_only
+
+
+def test_crash_after_commit_is_finished_on_open(tmp_path, encoder, monkeypatch):
+    index = ChunkIndex(str(tmp_path))
+    add(index, encoder, make_chunks('a.md', ['one']))
+    index.save()
+    add(index, encoder, make_chunks('b.md', ['other act']))
+
+    def crash(*args):
+        raise OSError('killed')
+
+    # the metadata is committed, the process dies before the new index replaces the old one
+    with monkeypatch.context() as m:
+        m.setattr(os, 'replace', crash)
+        with pytest.raises(OSError):
+            index.save()
+    index.close()
+
+    reopened = ChunkIndex(str(tmp_path))
+    assert len(reopened) == 2
+    assert reopened.get([chunk_key('b.md', 0)])[0]['eng_chunk'] == 'other act'
+    assert sorted(os.listdir(tmp_path)) == ['chunks.sqlite', 'index.faiss']
+
+
+def test_index_of_uncommitted_version_is_dropped_on_open(tmp_path, encoder):
+    index = ChunkIndex(str(tmp_path))
+    add(index, encoder, make_chunks('a.md', ['one']))
+    index.save()
+    add(index, encoder, make_chunks('b.md', ['other act']))
+    # the process died after writing the new index, before the metadata was committed
+    save_faiss_index(index.index, str(tmp_path / f'index.faiss.v{index.version}.tmp'))
+    index.close()
+
+    reopened = ChunkIndex(str(tmp_path))
+    assert len(reopened) == 1
+    assert reopened.get([chunk_key('b.md', 0)]) == [None]
+    assert sorted(os.listdir(tmp_path)) == ['chunks.sqlite', 'index.faiss']
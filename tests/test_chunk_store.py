@@ -0,0 +1,61 @@
+import os
+import numpy as np
+
+from rag.vectors import chunk_store
+from rag.vectors.chunk_store import CURRENT, ChunkStore, write_chunk_store
+
+
+def chunks(texts):
+    return [{'chunk_id': i, 'eng_chunk': text} for i, text in enumerate(texts)]
+
+
+def test_get_by_id(tmp_path):
+    write_chunk_store(str(tmp_path), chunks(['a', 'b', 'c']), ids=[30, 10, 20])
+    store = ChunkStore(str(tmp_path))
+    assert len(store) == 3 and 20 in store and 5 not in store
+    assert [chunk and chunk['eng_chunk'] for chunk in store.get([10, -1, 30])] == ['b', None, 'a']
+
+
+def test_open_store_keeps_its_version(tmp_path):
+    write_chunk_store(str(tmp_path), chunks(['old']))
+    old = ChunkStore(str(tmp_path))
+    write_chunk_store(str(tmp_path), chunks(['new', 'other']))
+    assert old.get([0])[0]['eng_chunk'] == 'old'
+    assert ChunkStore(str(tmp_path)).get([0])[0]['eng_chunk'] == 'new'
+
+    # only the current and the previous version are kept
+    write_chunk_store(str(tmp_path), chunks(['newest']))
+    assert sorted(os.listdir(tmp_path)) == [CURRENT, 'v2', 'v3']
+
+
+def test_crash_before_the_swap_leaves_the_old_store(tmp_path, monkeypatch):
+    write_chunk_store(str(tmp_path), chunks(['old']))
+
+    def crash(*args):
+        raise OSError('disk full')
+
+    with monkeypatch.context() as m:
+        m.setattr(chunk_store.np, 'save', crash)
+        try:
+            write_chunk_store(str(tmp_path), chunks(['new']))
+        except OSError:
+            pass
+    assert ChunkStore(str(tmp_path)).get([0])[0]['eng_chunk'] == 'old'
+
+    # the half-written version is removed by the next write
+    write_chunk_store(str(tmp_path), chunks(['newer']))
+    assert sorted(os.listdir(tmp_path)) == [CURRENT, 'v1', 'v3']
+    assert ChunkStore(str(tmp_path)).get([0])[0]['eng_chunk'] == 'newer'
+
+
+def test_flat_store_is_read_and_replaced(tmp_path):
+    data = b'{"eng_chunk": "flat"}'
+    with open(tmp_path / 'chunks.bin', 'wb') as f:
+        f.write(data)
+    np.save(tmp_path / 'offsets.npy', np.array([0, len(data)], dtype=np.int64))
+    np.save(tmp_path / 'ids.npy', np.array([7], dtype=np.int64))
+    assert ChunkStore(str(tmp_path)).get([7])[0]['eng_chunk'] == 'flat'
+
+    write_chunk_store(str(tmp_path), chunks(['new']))
+    assert sorted(os.listdir(tmp_path)) == [CURRENT, 'v1']
+    assert ChunkStore(str(tmp_path)).get([0])[0]['eng_chunk'] == 'new'
@@ -0,0 +1,89 @@
+import os
+import json
+import pytest
+
+from rag.isap import files
+from rag.isap.files import MANIFEST_NAME, download_file, read_manifest, write_manifest
+
+
+class FakeResponse:
+    def __init__(self, status_code=200, body=b'', headers=None):
+        self.status_code, self.body, self.headers = status_code, body, headers or {}
+
+    def raise_for_status(self):
+        pass
+
+    def iter_content(self, chunk_size):
+        yield self.body
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+
+class FakeSession:
+    """Serves one file with an ETag and answers 304 to a request with the same ETag in If-None-Match."""
+
+    def __init__(self, body=b'%PDF v1', etag='"v1"'):
+        self.body, self.etag, self.requests = body, etag, []
+
+    def close(self):
+        pass
+
+    def request(self, method, url, headers=None, **kwargs):
+        self.requests.append((method, dict(headers or {})))
+        if (headers or {}).get('If-None-Match') == self.etag:
+            return FakeResponse(304)
+        return FakeResponse(200, self.body if method == 'GET' else b'',
+                            {'ETag': self.etag, 'Content-Length': str(len(self.body))})
+
+
+@pytest.fixture
+def pdf(tmp_path):
+    return str(tmp_path / 'DU_2024_1.pdf')
+
+
+def test_known_file_is_skipped_without_requests(pdf):
+    session = FakeSession()
+    stats = download_file(session, 'u', pdf)
+    assert stats['status'] == 'downloaded' and stats['etag'] == '"v1"'
+    assert download_file(session, 'u', pdf, stats)['status'] == 'skipped'
+    assert len(session.requests) == 1
+
+
+def test_revalidate_sends_the_etag(pdf):
+    session = FakeSession()
+    known = download_file(session, 'u', pdf)
+    assert download_file(session, 'u', pdf, known, revalidate=True)['status'] == 'skipped'
+    assert session.requests[-1] == ('GET', {'If-None-Match': '"v1"'})
+
+    # same size, new content - downloaded again
+    session.body, session.etag = b'%PDF v2', '"v2"'
+    assert download_file(session, 'u', pdf, known, revalidate=True)['status'] == 'downloaded'
+    with open(pdf, 'rb') as f:
+        assert f.read() == b'%PDF v2'
+
+
+def test_broken_manifest_is_read_as_empty(tmp_path):
+    with open(tmp_path / MANIFEST_NAME, 'w', encoding='utf-8') as f:
+        f.write('{"DU_2024_1.pdf": {"si')
+    assert read_manifest(str(tmp_path)) == {}
+
+    write_manifest(str(tmp_path), {'DU_2024_1.pdf': {'size': 7}})
+    assert read_manifest(str(tmp_path)) == {'DU_2024_1.pdf': {'size': 7}}
+    assert os.listdir(tmp_path) == [MANIFEST_NAME]
+
+
+def test_manifest_is_saved_after_download(tmp_path, monkeypatch):
+    monkeypatch.setattr(files, 'create_session', lambda pool_size: FakeSession())
+    monkeypatch.setattr(files, 'match_text_type', lambda doc: ('1', None))
+    docs = [{'year': 2024, 'pos': 1, 'textPDF': True}]
+    stats = files.download_articles(docs, str(tmp_path), max_workers=1)
+    assert [item['status'] for item in stats] == ['downloaded']
+    with open(tmp_path / MANIFEST_NAME, encoding='utf-8') as f:
+        assert json.load(f)['DU_2024_1.pdf']['etag'] == '"v1"'
@@ -0,0 +1,150 @@
+import json
+import random
+import threading
+import time
+from collections import Counter
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from types import SimpleNamespace
+from urllib.parse import urlparse, parse_qs
+import pytest
+import requests
+
+from rag import http_utils
+from rag.isap import info
+from rag.isap.info import harvest_all_docs_data
+
+YEARS = [2020, 2021]
+DOCS_PER_YEAR = 1200  # three pages of 500
+
+
+class StubISAP:
+    """Local stub of the ISAP API. failures[path] is a list of statuses returned before the real answer."""
+
+    def __init__(self):
+        self.requests = Counter()
+        self.failures = {}
+        self.lock = threading.Lock()
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                with stub.lock:
+                    stub.requests[self.path] += 1
+                    failures = stub.failures.get(self.path)
+                    status = failures.pop(0) if failures else 200
+                # answers come back in a random order
+                time.sleep(random.uniform(0, 0.01))
+                payload = json.dumps(stub.answer(self.path) if status == 200 else {'error': status}).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f'http://127.0.0.1:{self.server.server_port}'
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    @staticmethod
+    def answer(path):
+        url = urlparse(path)
+        parts = url.path.strip('/').split('/')
+        if parts[-1] == 'DU':
+            return {'years': YEARS}
+        if parts[-1] == 'search':
+            query = parse_qs(url.query)
+            year, offset, limit = (int(query[name][0]) for name in ('year', 'offset', 'limit'))
+            return {'items': [{'year': year, 'pos': pos} for pos in range(offset + 1, min(offset + limit, DOCS_PER_YEAR) + 1)]}
+        return {'count': DOCS_PER_YEAR}
+
+    @staticmethod
+    def page(year, offset):
+        return f'/search?limit=500&offset={offset}&publisher=DU&year={year}'
+
+
+EXPECTED = [{'year': year, 'pos': pos} for year in YEARS for pos in range(1, DOCS_PER_YEAR + 1)]
+
+
+@pytest.fixture
+def stub():
+    stub = StubISAP()
+    yield stub
+    stub.server.shutdown()
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    """Backoff waits of request_with_retry, recorded instead of slept."""
+    sleeps = []
+    monkeypatch.setattr(http_utils, 'time', SimpleNamespace(sleep=sleeps.append, monotonic=time.monotonic))
+    return sleeps
+
+
+def test_same_documents_in_order_with_one_shared_session(stub, monkeypatch):
+    sessions = []
+
+    def create_session(pool_size):
+        sessions.append(http_utils.create_session(pool_size))
+        return sessions[-1]
+
+    monkeypatch.setattr(info, 'create_session', create_session)
+    assert harvest_all_docs_data(base_api_url=stub.url, max_workers=4, requests_per_second=None) == EXPECTED
+    assert len(sessions) == 1
+    # every request was sent once: the year list, one count per year and three pages per year
+    assert sum(stub.requests.values()) == 1 + len(YEARS) * 4
+    assert set(stub.requests.values()) == {1}
+
+
+def test_resumes_from_a_partial_checkpoint(stub, tmp_path):
+    checkpoint = tmp_path / 'checkpoint.jsonl'
+    with open(checkpoint, 'w', encoding='utf-8') as f:
+        f.write(json.dumps({'year': 2020, 'count': DOCS_PER_YEAR}) + '\n')
+        for offset in (0, 500):
+            f.write(json.dumps({'year': 2020, 'offset': offset, 'items': StubISAP.answer(StubISAP.page(2020, offset))['items']}) + '\n')
+        # the run was killed while writing this line
+        f.write('{"year": 2020, "offset": 1000, "ite')
+
+    result = harvest_all_docs_data(checkpoint_path=str(checkpoint), base_api_url=stub.url, max_workers=4,
+                                   requests_per_second=None)
+    assert result == EXPECTED
+    assert stub.requests[StubISAP.page(2020, 0)] == stub.requests[StubISAP.page(2020, 500)] == 0
+    assert stub.requests['/DU/2020'] == 0
+    assert stub.requests[StubISAP.page(2020, 1000)] == 1
+
+    # everything is in the checkpoint now, the next run only asks for the list of years
+    stub.requests.clear()
+    assert harvest_all_docs_data(checkpoint_path=str(checkpoint), base_api_url=stub.url, requests_per_second=None) == EXPECTED
+    assert dict(stub.requests) == {'/DU': 1}
+
+
+@pytest.mark.parametrize('status', [429, 500, 503])
+def test_temporary_errors_are_retried_with_backoff(stub, sleeps, status):
+    stub.failures[StubISAP.page(2021, 500)] = [status, status]
+    assert harvest_all_docs_data(base_api_url=stub.url, requests_per_second=None, retries=3) == EXPECTED
+    assert stub.requests[StubISAP.page(2021, 500)] == 3
+    # backoff 0.5s, then 1s, each plus up to 0.5s of jitter
+    assert len(sleeps) == 2
+    assert 0.5 <= sleeps[0] <= 1.0 and 1.0 <= sleeps[1] <= 1.5
+
+
+def test_finished_pages_are_kept_when_retries_run_out(stub, sleeps, tmp_path):
+    checkpoint = tmp_path / 'checkpoint.jsonl'
+    stub.failures[StubISAP.page(2021, 1000)] = [503] * 3
+    with pytest.raises(requests.HTTPError):
+        harvest_all_docs_data(checkpoint_path=str(checkpoint), base_api_url=stub.url, requests_per_second=None, retries=2)
+    assert stub.requests[StubISAP.page(2021, 1000)] == 3
+
+    stub.requests.clear()
+    assert harvest_all_docs_data(checkpoint_path=str(checkpoint), base_api_url=stub.url, requests_per_second=None) == EXPECTED
+    assert dict(stub.requests) == {'/DU': 1, StubISAP.page(2021, 1000): 1}
+
+
+def test_other_client_errors_are_not_retried(stub, sleeps):
+    stub.failures['/DU/2020'] = [404]
+    with pytest.raises(requests.HTTPError):
+        harvest_all_docs_data(base_api_url=stub.url, requests_per_second=None)
+    assert stub.requests['/DU/2020'] == 1
+    assert sleeps == []
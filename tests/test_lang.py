@@ -0,0 +1,47 @@
+import langdetect
+import pytest
+
+from rag.txt_extract import lang
+from rag.txt_extract.lang import detect_paragraphs_lang, extract_lang, quick_lang
+
+
+@pytest.mark.parametrize('paragraph, expected', [
+    ('Ustawa wchodzi w życie po upływie 14 dni.', 'pl'),
+    # diacritics lost by OCR
+    ('Przepisy ustawy stosuje sie odpowiednio do jednostek samorzadu terytorialnego.', 'pl'),
+    ('Dziennik Ustaw – 3 – Poz. 1234', 'pl'),
+    ('The provisions of this Act shall apply accordingly to local government units.', 'en'),
+    ('The Minister responsible for public finance shall determine the fees.', 'en'),
+    ('§ 12. 2024-05-01', ''),
+    # too few typical words, or letters of another language - langdetect decides
+    ('Art. 5.', None),
+    ('Die Verordnung tritt in Kraft.', None),
+    ('Das Gericht entscheidet durch Beschluss ohne mundliche Verhandlung.', None),
+    ('Il presente regolamento entra in vigore il ventesimo giorno successivo alla pubblicazione.', None),
+])
+def test_quick_lang(paragraph, expected):
+    assert quick_lang(paragraph) == expected
+
+
+def test_extract_lang_keeps_polish_paragraphs():
+    text = 'Ustawa wchodzi w życie.\nThe Act enters into force.\n\n12\nDie Verordnung tritt in Kraft.\nUstawa wchodzi w życie.'
+    assert extract_lang(text, 'pl') == 'Ustawa wchodzi w życie.\nUstawa wchodzi w życie.'
+
+
+def test_same_verdict_every_time_without_a_global_seed():
+    paragraphs = ['Diese Verordnung tritt am zwanzigsten Tag in Kraft.', 'ok ok', 'Le règlement entre en vigueur.']
+    first = detect_paragraphs_lang(paragraphs)
+    lang._verdicts.clear()
+    assert detect_paragraphs_lang(paragraphs) == first
+    # the seed is set only on the detectors of this module
+    assert langdetect.DetectorFactory.seed is None
+
+
+def test_small_input_does_not_start_the_pool(monkeypatch):
+    def no_pool(workers):
+        raise AssertionError('the pool was started')
+
+    monkeypatch.setattr(lang, '_get_pool', no_pool)
+    monkeypatch.setattr(lang, '_pool_workers', 0)
+    paragraphs = [f'Die Verordnung {i} tritt in Kraft.' for i in range(200)]
+    assert set(detect_paragraphs_lang(paragraphs, workers=4, chunksize=8)) == {'de'}
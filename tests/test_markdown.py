@@ -0,0 +1,42 @@
+import pytest
+
+from rag.txt_extract.discard import strip_markdown
+from rag.txt_extract.tables import detect_markdown_table, markdown_table_to_csv
+from rag.txt_extract.markdown import normalise_markdown
+
+TABLE = '| a | b |\n| --- | --- |\n| 1 | 2 |\n'
+DOCUMENTS = {
+    'consecutive separators': 'a\n\n\n\nb\n\n\nc',
+    'crlf': 'a\r\n\r\n\r\nb\r\n',
+    'blank lines with spaces': 'a\n  \n\n  \nb',
+    'leading newlines': '\n\n\n# Title\n\ntext',
+    'table at the start': TABLE + '\ntext',
+    'table at the end': 'text\n\n' + TABLE,
+    'table at the end without newline': 'text\n\n' + TABLE.rstrip('\n'),
+    'two tables': TABLE + '\n\n' + TABLE + '\nend',
+    'markdown in a table': '| **a** | [x](y) |\n| --- | --- |\n| > 1 | # 2 |\n',
+    'bold and italics': '**Art. 1.** text *italic* ** not closed\n*a\nb*',
+    'empty bold line': 'a\n****\nb',
+    'quote and header with newline': 'a >\nb\n>\n\nc\n#\n\nd',
+    'images and links': '![](_page_1_Picture_0.jpeg)\n<span id="page-1-0"></span>see [art. 5](#page-1-0) here',
+    'linked image': 'before [![](img.png)](http://x) after\n[![alt](a.png)](b)',
+    'image inside link text': 'see [the ![](icon.png) act](http://x) here',
+    'removal joins a header': '#>\n x\n#[a](b) y',
+    'link with a pipe on a table row': '[a | b](c) |\n| x |\n',
+    'image with a pipe before a table': '![a | b](c) | d |\n',
+}
+
+
+def reference(text: str, keep_tables: bool) -> str:
+    """The old clean_document: tables replaced one by one (from the last one), then strip_markdown."""
+    if not keep_tables:
+        for i, (start, end) in reversed(list(enumerate(detect_markdown_table(text)))):
+            text = text[:start] + f'Tabela {i}. {markdown_table_to_csv(text[start:end])}\n' + text[end:]
+    return strip_markdown(text)
+
+
+@pytest.mark.parametrize('keep_tables', [True, False])
+@pytest.mark.parametrize('name', list(DOCUMENTS))
+def test_same_as_strip_markdown(name, keep_tables):
+    assert normalise_markdown(DOCUMENTS[name], keep_tables) == reference(DOCUMENTS[name], keep_tables)
+
@@ -0,0 +1,41 @@
+import os
+import pytest
+import torch
+from transformers import GPT2Config, GPT2LMHeadModel
+
+from rag.llms.models import _quantized_cache_path, load_cpu_model
+
+
+@pytest.fixture
+def model_dir(tmp_path):
+    """A tiny random GPT-2 saved like a downloaded model."""
+    torch.manual_seed(0)
+    model = GPT2LMHeadModel(GPT2Config(vocab_size=50, n_positions=64, n_embd=32, n_layer=2, n_head=2))
+    model.save_pretrained(tmp_path / 'gpt2')
+    return str(tmp_path / 'gpt2')
+
+
+def logits(model):
+    with torch.no_grad():
+        return model(input_ids=torch.arange(10).unsqueeze(0)).logits
+
+
+def test_quantized_model_is_loaded_from_the_cache(model_dir, tmp_path):
+    cache_dir = str(tmp_path / 'cache')
+    quantized = load_cpu_model(model_dir, cache_dir=cache_dir)
+    assert os.listdir(cache_dir) == [os.path.basename(_quantized_cache_path(cache_dir, model_dir))]
+    cached = load_cpu_model(model_dir, cache_dir=cache_dir)
+    assert torch.equal(cached.lm_head.weight().int_repr(), quantized.lm_head.weight().int_repr())
+    assert torch.equal(logits(cached), logits(quantized))
+
+
+def test_changed_weights_are_quantized_again(model_dir, tmp_path):
+    cache_dir = str(tmp_path / 'cache')
+    path = _quantized_cache_path(cache_dir, model_dir)
+    load_cpu_model(model_dir, cache_dir=cache_dir)
+
+    # the model was fine-tuned and saved again in the same folder
+    torch.manual_seed(1)
+    GPT2LMHeadModel(GPT2Config(vocab_size=50, n_positions=64, n_embd=32, n_layer=2, n_head=2)).save_pretrained(model_dir)
+    assert _quantized_cache_path(cache_dir, model_dir) != path
+    assert torch.equal(logits(load_cpu_model(model_dir, cache_dir=cache_dir)), logits(load_cpu_model(model_dir)))
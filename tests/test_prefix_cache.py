@@ -0,0 +1,47 @@
+import torch
+
+from rag.llms.core import build_prompt, prompt_prefix
+from rag.llms.prefix_cache import PrefixCache
+
+CHUNKS = [{'title': 'Act 1', 'chunk': 'The minister shall determine the fees.'}]
+
+
+def next_token_logits(model, input_ids, past_key_values=None):
+    start = past_key_values.get_seq_length() if past_key_values is not None else 0
+    with torch.no_grad():
+        return model(input_ids=input_ids[:, start:], past_key_values=past_key_values).logits[0, -1]
+
+
+def test_same_answer_as_the_pipeline(qa_pipeline):
+    cache = PrefixCache()
+    params = {'max_new_tokens': 6, 'do_sample': False, 'return_full_text': False}
+    for question in ('What are the fees?', 'Who determines them?'):
+        prompt = build_prompt(question, CHUNKS)
+        stats = {}
+        answer = cache.generate(qa_pipeline, prompt_prefix(), prompt, params, stats)
+        assert answer == qa_pipeline(prompt, **params)[0]['generated_text']
+        assert stats['cached_tokens'] == len(prompt_prefix())
+        assert stats['prefill_saved_ms_est'] > 0
+    assert cache.stats()['hits'] == 2
+
+
+def test_partly_matching_prefix_is_cropped(qa_pipeline):
+    model, tokenizer = qa_pipeline.model, qa_pipeline.tokenizer
+    prefix = prompt_prefix()
+    # the prompt leaves the prefix after 10 characters, only those can be reused
+    prompt = prefix[:10] + '#' + prefix[10:] + 'question'
+    stats = {}
+    input_ids, _, past_key_values = PrefixCache().prepare(model, tokenizer, prefix, prompt, stats)
+    assert stats['cached_tokens'] == 10
+    assert past_key_values.get_seq_length() == 10
+    assert torch.allclose(next_token_logits(model, input_ids, past_key_values), next_token_logits(model, input_ids),
+                          atol=1e-5)
+
+
+def test_changed_sys_prompt_computes_the_prefix_again(qa_pipeline):
+    model, tokenizer = qa_pipeline.model, qa_pipeline.tokenizer
+    cache = PrefixCache()
+    cache.get(model, tokenizer, prompt_prefix())
+    entry = cache.get(model, tokenizer, prompt_prefix('Answer in one word.'))
+    assert entry['prefix'] == prompt_prefix('Answer in one word.')
+    assert cache.stats()['models'] == 1
@@ -0,0 +1,39 @@
+from rag.llms.query_cache import QueryCache
+from rag.vectors.chunk_index import ChunkIndex
+from rag.vectors.index import create_faiss_index
+from rag.vectors.retriever import Retriever
+
+
+def chunks(texts, document_id='a.md'):
+    return [{'document_id': document_id, 'chunk_id': i, 'eng_chunk': text, 'eng_title': document_id}
+            for i, text in enumerate(texts)]
+
+
+def test_repeated_question_is_served_from_the_cache(encoder):
+    data = chunks(['tax on income', 'waste disposal'])
+    retriever = Retriever(create_faiss_index(encoder.encode(['tax on income', 'waste disposal'])), encoder, data,
+                          cache=QueryCache())
+    first = retriever.search('Waste  disposal', 1)
+    assert retriever.search('waste disposal', 1) == first
+    assert retriever.cache.retrievals.hits == 1
+    assert retriever.cache.embeddings.hits == 1
+
+
+def test_chunk_index_change_invalidates_results(tmp_path, encoder):
+    index = ChunkIndex(str(tmp_path))
+    index.add(chunks(['tax on income']), encoder.encode(['tax on income']))
+    retriever = Retriever(index, encoder, index, cache=QueryCache())
+    assert retriever.search('waste disposal', 1)[0]['chunk'] == 'tax on income'
+
+    index.add(chunks(['waste disposal'], 'b.md'), encoder.encode(['waste disposal']))
+    assert retriever.search('waste disposal', 1)[0]['chunk'] == 'waste disposal'
+
+
+def test_reload_invalidates_results(encoder):
+    old, new = chunks(['tax on income']), chunks(['waste disposal'])
+    retriever = Retriever(create_faiss_index(encoder.encode(['tax on income'])), encoder, old, cache=QueryCache())
+    assert retriever.search('waste disposal', 1)[0]['chunk'] == 'tax on income'
+
+    # an index with the same number of vectors
+    retriever.reload(create_faiss_index(encoder.encode(['waste disposal'])), new)
+    assert retriever.search('waste disposal', 1)[0]['chunk'] == 'waste disposal'
@@ -0,0 +1,134 @@
+import time
+import asyncio
+from types import SimpleNamespace
+import pytest
+
+pytest.importorskip('aiohttp')
+from aiohttp.test_utils import TestClient, TestServer
+
+from rag.server import MicroBatcher, RAGService
+from rag.vectors.index import create_faiss_index
+from rag.vectors.retriever import Retriever
+
+
+class FakePipeline:
+    """Stands in for a text-generation pipeline, answers after delay seconds (or fails)."""
+
+    def __init__(self, delay: float = 0.0, error: Exception = None):
+        self.delay, self.error = delay, error
+        self.tokenizer = SimpleNamespace(padding_side='right', pad_token=None, eos_token='</s>', eos_token_id=0)
+        self.model = SimpleNamespace(generation_config=SimpleNamespace(pad_token_id=None))
+
+    def __call__(self, prompts, batch_size=1, **params):
+        time.sleep(self.delay)
+        if self.error is not None:
+            raise self.error
+        return [[{'generated_text': f'answer {params["max_new_tokens"]}'}] for _ in prompts]
+
+
+@pytest.fixture
+def retriever(encoder):
+    data = [{'eng_chunk': text, 'eng_title': f'Act {i}'} for i, text in enumerate(['tax on income', 'waste disposal'])]
+    return Retriever(create_faiss_index(encoder.encode([item['eng_chunk'] for item in data])), encoder, data)
+
+
+def serve(service, scenario):
+    """Runs scenario(client) against the app of the service."""
+    async def run():
+        async with TestClient(TestServer(service.make_app())) as client:
+            return await scenario(client)
+    return asyncio.run(run())
+
+
+@pytest.mark.parametrize('body', [{}, {'question': ' '}, {'question': 'tax', 'k': 0}, {'question': 'tax', 'k': 'x'},
+                                  {'question': 'tax', 'filters': [2020]}, {'question': 'tax', 'max_new_tokens': 0}])
+def test_bad_request(retriever, body):
+    async def scenario(client):
+        response = await client.post('/query', json=body)
+        return response.status
+    assert serve(RAGService(retriever, FakePipeline()), scenario) == 400
+
+
+def test_query(retriever):
+    async def scenario(client):
+        response = await client.post('/query', json={'question': 'waste', 'k': 1, 'max_new_tokens': 8})
+        return response.status, await response.json()
+    status, result = serve(RAGService(retriever, FakePipeline()), scenario)
+    assert status == 200
+    assert result['answer'] == 'answer 8'
+    assert [chunk['title'] for chunk in result['chunks']] == ['Act 1']
+
+
+def test_filters_without_metadata_are_a_bad_request(retriever):
+    async def scenario(client):
+        response = await client.post('/query', json={'question': 'tax', 'filters': {'year_from': 2020}})
+        return response.status
+    assert serve(RAGService(retriever, FakePipeline()), scenario) == 400
+
+
+def test_generation_error_is_500(retriever):
+    service = RAGService(retriever, FakePipeline(error=RuntimeError('out of memory')))
+
+    async def scenario(client):
+        response = await client.post('/query', json={'question': 'tax'})
+        latency = await (await client.get('/latency')).json()
+        return response.status, await response.json(), latency['errors']
+    status, result, errors = serve(service, scenario)
+    assert status == 500
+    assert 'out of memory' in result['error']
+    assert errors == 1
+
+
+def test_too_many_pending_requests_are_rejected(retriever):
+    service = RAGService(retriever, FakePipeline(delay=0.3), max_pending=1)
+
+    async def scenario(client):
+        first = asyncio.ensure_future(client.post('/query', json={'question': 'tax'}))
+        await asyncio.sleep(0.1)
+        second = await client.post('/query', json={'question': 'waste'})
+        return (await first).status, second.status, second.headers.get('Retry-After')
+    assert serve(service, scenario) == (200, 503, '1')
+    assert service.counts['rejected'] == 1
+
+
+def test_slow_request_times_out(retriever):
+    service = RAGService(retriever, FakePipeline(delay=0.5), request_timeout=0.1)
+
+    async def scenario(client):
+        response = await client.post('/query', json={'question': 'tax'})
+        return response.status
+    assert serve(service, scenario) == 504
+    assert service.counts['timeouts'] == 1
+
+
+def test_micro_batcher_batches_and_fails_single_items():
+    batches = []
+
+    def process(items):
+        batches.append(len(items))
+        return [ValueError(item) if item == 3 else item * 10 for item in items]
+
+    async def run():
+        batcher = MicroBatcher(process, max_batch_size=4, max_wait_ms=50)
+        batcher.start()
+        results = await asyncio.gather(*(batcher.submit(i) for i in range(8)), return_exceptions=True)
+        await batcher.stop()
+        return results
+
+    results = asyncio.run(run())
+    assert [result for result in results if not isinstance(result, Exception)] == [0, 10, 20, 40, 50, 60, 70]
+    assert isinstance(results[3], ValueError)
+    assert batches == [4, 4]
+
+
+def test_micro_batcher_rejects_when_queue_is_full():
+    async def run():
+        batcher = MicroBatcher(lambda items: items, max_queue=1)
+        # not started, so the first item stays in the queue
+        first = asyncio.ensure_future(batcher.submit(1))
+        await asyncio.sleep(0)
+        with pytest.raises(asyncio.QueueFull):
+            await batcher.submit(2)
+        first.cancel()
+        await batcher.stop()
+    asyncio.run(run())
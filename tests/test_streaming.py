@@ -0,0 +1,100 @@
+import asyncio
+import threading
+import time
+import pytest
+import torch
+
+from rag.llms.core import generate
+from rag.llms.streaming import astream_generate, stream_generate
+
+CHUNKS = [{'title': 'Act 1', 'chunk': 'The minister shall determine the fees.'}]
+QUESTION = 'What are the fees?'
+# the random model puts a space or a new line (where the streamer passes text on) every few dozen sampled tokens,
+# a stopped generation ends long before max_new_tokens
+LONG = {'max_new_tokens': 500, 'do_sample': True}
+
+
+@pytest.fixture(autouse=True)
+def seed():
+    torch.manual_seed(0)
+
+
+def wait_for(condition, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, 'timed out'
+        time.sleep(0.01)
+
+
+def test_pieces_make_the_same_answer_as_generate(qa_pipeline):
+    params = {'max_new_tokens': 30, 'do_sample': False}
+    stats = {}
+    pieces = list(stream_generate(QUESTION, CHUNKS, qa_pipeline, params, stats=stats))
+    assert ''.join(pieces) == generate(QUESTION, CHUNKS, qa_pipeline, {**params, 'return_full_text': False})
+    assert stats['tokens'] == 30 and not stats['cancelled']
+    assert stats['ttft_ms'] <= stats['latency_ms']
+
+
+def test_leaving_the_loop_stops_generation(qa_pipeline):
+    stats = {}
+    pieces = stream_generate(QUESTION, CHUNKS, qa_pipeline, LONG, stats=stats)
+    for _ in pieces:
+        break
+    pieces.close()
+    assert stats['cancelled']
+    assert stats['tokens'] < 500
+
+
+def test_stop_event_stops_generation(qa_pipeline):
+    stop_event, stats = threading.Event(), {}
+    for _ in stream_generate(QUESTION, CHUNKS, qa_pipeline, LONG, stop_event=stop_event, stats=stats):
+        stop_event.set()
+    assert stats['cancelled']
+    assert stats['tokens'] < 500
+
+
+def test_cancelling_the_consumer_task_stops_the_generation_thread(qa_pipeline):
+    stats = {}
+    first_piece = None
+
+    async def consume():
+        nonlocal first_piece
+        async for piece in astream_generate(QUESTION, CHUNKS, qa_pipeline, LONG, stats=stats):
+            first_piece = first_piece or piece
+            await asyncio.sleep(3600)
+
+    async def main():
+        threads = threading.active_count()
+        task = asyncio.create_task(consume())
+        while first_piece is None:
+            await asyncio.sleep(0.01)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        return threads
+
+    threads = asyncio.run(main())
+    # stats are filled once generation has stopped and its thread has been joined
+    wait_for(lambda: 'cancelled' in stats)
+    assert stats['cancelled'] and stats['tokens'] < 500
+    wait_for(lambda: threading.active_count() <= threads)
+
+
+def test_closed_event_loop_does_not_break_the_producer(qa_pipeline):
+    stats = {}
+
+    async def first_piece():
+        pieces = astream_generate(QUESTION, CHUNKS, qa_pipeline, LONG, stats=stats)
+        # the generator is left open: nothing tells the producer to stop before the loop is gone
+        return await pieces.__anext__()
+
+    errors = []
+    hook, threading.excepthook = threading.excepthook, errors.append
+    try:
+        loop = asyncio.new_event_loop()
+        assert loop.run_until_complete(first_piece())
+        loop.close()
+        wait_for(lambda: 'cancelled' in stats)
+    finally:
+        threading.excepthook = hook
+    assert errors == []
+    assert stats['cancelled'] and stats['tokens'] < 500
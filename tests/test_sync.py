@@ -0,0 +1,120 @@
+import os
+import json
+import shutil
+import pytest
+
+from rag import sync
+from rag.isap.files import MANIFEST_NAME
+from rag.vectors.bm25 import BM25Index
+from rag.vectors.chunk_index import ChunkIndex
+from rag.vectors.chunk_store import ChunkStore
+from rag.vectors.filters import ChunkMetadata
+from rag.vectors.index import read_faiss_index
+
+
+def act(pos, change_date='2024-01-01'):
+    return {'year': 2024, 'pos': pos, 'title': f'Act {pos}', 'changeDate': change_date, 'announcementDate': '2024-01-01'}
+
+
+class FakeISAP:
+    """The ISAP listing and the texts of PDFs, with sync_corpus steps which need network or models replaced."""
+
+    def __init__(self, monkeypatch, encoder):
+        self.docs, self.texts, self.downloads = [], {}, []
+        monkeypatch.setattr(sync, 'harvest_all_docs_data', lambda years: list(self.docs))
+        monkeypatch.setattr(sync, 'filter_out_results', lambda docs, filters: docs)
+        monkeypatch.setattr(sync, 'download_articles', self.download)
+        monkeypatch.setattr(sync, 'process_documents', self.clean)
+        monkeypatch.setattr(sync, 'process_document', self.chunk)
+        monkeypatch.setattr(sync, 'EmbeddingStore', lambda folder, model_name: None)
+        monkeypatch.setattr(sync, 'embed_texts', lambda texts, model_name, store: (encoder.encode(texts), encoder))
+        monkeypatch.setattr(sync, 'load_embedding_model', lambda model_name: encoder)
+
+    def download(self, docs, folder):
+        # like download_articles, a PDF which is already there is not downloaded again
+        for doc in docs:
+            path = os.path.join(folder, f'DU_{doc["year"]}_{doc["pos"]}.pdf')
+            if not os.path.exists(path):
+                self.downloads.append(doc['pos'])
+                with open(path, 'w', encoding='utf-8') as f:
+                    f.write(self.texts[doc['pos']])
+
+    @staticmethod
+    def convert(pdf_paths, md_folder):
+        for path in pdf_paths:
+            with open(path, encoding='utf-8') as f:
+                text = f.read()
+            if text != 'broken':
+                shutil.copy(path, os.path.join(md_folder, os.path.basename(path)[:-4] + '.md'))
+
+    @staticmethod
+    def clean(docs, md_folder, clean_folder, params):
+        for name in os.listdir(md_folder):
+            shutil.copy(os.path.join(md_folder, name), os.path.join(clean_folder, name))
+
+    @staticmethod
+    def chunk(path, doc, engine, translator=None):
+        with open(path, encoding='utf-8') as f:
+            paragraphs = f.read().split('\n')
+        return [{'document_id': os.path.basename(path), 'chunk_id': i, 'title': doc['title'], 'translated_text': text,
+                 'year': doc['year']} for i, text in enumerate(paragraphs)]
+
+    def run(self, workdir):
+        return sync.sync_corpus(str(workdir), {}, self.convert)
+
+
+@pytest.fixture
+def isap(monkeypatch, encoder):
+    return FakeISAP(monkeypatch, encoder)
+
+
+def read_chunks(workdir):
+    with open(workdir / 'chunks.jsonl', encoding='utf-8') as f:
+        return [(chunk['document_id'], chunk['eng_chunk']) for chunk in map(json.loads, f)]
+
+
+def test_changed_act_is_downloaded_again_and_replaced(tmp_path, isap):
+    isap.docs = [act(1), act(2)]
+    isap.texts = {1: 'tax on income\npenalty', 2: 'waste disposal'}
+    assert isap.run(tmp_path) == {'new': 2, 'changed': 0, 'removed': 0, 'failed': 0}
+
+    isap.docs = [act(1, '2024-06-01'), act(2)]
+    isap.texts[1] = 'tax on income changed'
+    assert isap.run(tmp_path) == {'new': 0, 'changed': 1, 'removed': 0, 'failed': 0}
+
+    # the old PDF of the changed act was not reused
+    assert isap.downloads == [1, 2, 1]
+    assert sorted(read_chunks(tmp_path)) == [('DU_2024_1.md', 'tax on income changed'), ('DU_2024_2.md', 'waste disposal')]
+    index = ChunkIndex(str(tmp_path / 'chunk_index'))
+    assert len(index) == 2
+    assert {chunk['eng_chunk'] for chunk in index.get(index.document_ids(['DU_2024_1.md']))} == {'tax on income changed'}
+    assert len(ChunkStore(str(tmp_path / 'chunk_store'))) == 2
+    assert read_faiss_index(str(tmp_path / 'index.faiss')).ntotal == 2
+
+
+def test_manifest_entry_of_changed_act_is_forgotten(tmp_path, isap):
+    isap.docs, isap.texts = [act(1)], {1: 'text'}
+    isap.run(tmp_path)
+    with open(tmp_path / 'pdf' / MANIFEST_NAME, 'w', encoding='utf-8') as f:
+        json.dump({'DU_2024_1.pdf': {'url': 'u', 'size': 4}, 'DU_2024_5.pdf': {'url': 'v', 'size': 1}}, f)
+
+    isap.docs = [act(1, '2024-06-01')]
+    isap.run(tmp_path)
+    with open(tmp_path / 'pdf' / MANIFEST_NAME, encoding='utf-8') as f:
+        assert list(json.load(f)) == ['DU_2024_5.pdf']
+
+
+def test_empty_corpus_writes_empty_files(tmp_path, isap):
+    isap.docs, isap.texts = [act(1), act(2)], {1: 'tax on income', 2: 'waste disposal'}
+    isap.run(tmp_path)
+
+    # both acts are gone from the listing and the only new one can't be converted
+    isap.docs, isap.texts[3] = [act(3)], 'broken'
+    assert isap.run(tmp_path) == {'new': 1, 'changed': 0, 'removed': 2, 'failed': 1}
+
+    assert read_chunks(tmp_path) == []
+    assert read_faiss_index(str(tmp_path / 'index.faiss')).ntotal == 0
+    assert len(ChunkIndex(str(tmp_path / 'chunk_index'))) == 0
+    assert len(ChunkStore(str(tmp_path / 'chunk_store'))) == 0
+    assert len(BM25Index.load(str(tmp_path / 'bm25.npz'))) == 0
+    assert len(ChunkMetadata.load(str(tmp_path / 'metadata.npz'))) == 0